@@ -0,0 +1,178 @@
+# -*- coding:utf-8 -*-
+
+import asyncio
+import json
+import logging
+import os
+import secrets
+
+from quart import Quart, Response, make_response, session, render_template, request
+from tasks.transportation_path import async_handler, handler, metrics
+
+from config import secret_key, logger_url
+import chat_flow
+from log_shipper import LogShipper
+from state_store import create_state_store
+
+# web_server.py 와 같은 화면/메시지 형식의 async 서버
+# 한 worker 프로세스의 이벤트 루프에서 여러 대화를 동시에 처리 (외부 API 는 await, 점수 계산/그래프는 executor)
+#   hypercorn async_server:app --bind 0.0.0.0:5555
+#   python async_server.py
+
+app = Quart(__name__)
+app.secret_key = secret_key
+
+logger = logging.getLogger("chatbot")
+logger.setLevel(logging.DEBUG)
+
+# startup 에서 만듦 (그래프 worker 프로세스가 이 파일을 다시 import 해도 아무것도 띄우지 않도록)
+log_shipper = None
+state_store = None
+
+
+@app.before_serving
+async def startup():
+    global log_shipper, state_store
+
+    if not os.path.exists("logs"):
+        os.makedirs("logs")
+
+    handler.init_handler()
+    state_store = create_state_store()
+    log_shipper = LogShipper(logger_url).start()
+    metrics.Gauge('transafer_log_shipper_messages', '로그 전송 결과별 메시지 수',
+                  lambda: {'sent': log_shipper.sent, 'failed': log_shipper.failed, 'dropped': log_shipper.dropped},
+                  'result')
+
+
+@app.after_serving
+async def shutdown():
+    await async_handler.close_http_client()
+    log_shipper.close()
+
+
+# 챗봇 화면 출력
+@app.route("/", methods=["GET"])
+async def chat_client():
+    return await render_template("chat_client.html")
+
+
+# 출발지/목적지 후보 정류장 (static/stop_picker.html 에서 사용)
+@app.route("/stops/<key>", methods=["GET"])
+async def stop_candidates(key):
+    body = await async_handler.run_io(handler.load_stop_candidates, key)
+    if body is None:
+        return {"stops": []}, 404
+
+    return Response(body, mimetype="application/json", headers={"Cache-Control": "public, max-age=86400"})
+
+
+# 경로별 혼잡도 그래프 데이터 (templates/chat_client.html 에서 막대 그래프로 그림)
+@app.route("/routes/<key>", methods=["GET"])
+async def route_congestion(key):
+    body = await async_handler.run_io(handler.load_route_congestion, key)
+    if body is None:
+        return {"routes": []}, 404
+
+    return Response(body, mimetype="application/json", headers={"Cache-Control": "public, max-age=86400"})
+
+
+# Prometheus 수집용 지표
+@app.route("/metrics", methods=["GET"])
+async def metrics_endpoint():
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4; charset=utf-8")
+
+
+# 챗봇 메시지 처리
+# stream=1 이면 text/event-stream 으로 응답 메시지를 나오는 대로 하나씩 보냄 (마지막은 event: done)
+@app.route("/chat_message", methods=["POST"])
+async def chat_message():
+    # 수신 데이터
+    recv_value = (await request.form).to_dict(flat=True)
+    logger.warning(f"recv: {recv_value}")
+
+    if recv_value.get('stream') == '1':
+        response = await make_response(stream_chat_message(recv_value, state_key(recv_value['client_id'])),
+                                       {"Content-Type": "text/event-stream", "Cache-Control": "no-cache",
+                                        "X-Accel-Buffering": "no"})
+        response.timeout = None
+        return response
+
+    output = await run(recv_value['input'], recv_value['client_id'])
+
+    # 발신 데이터
+    send_value = {"client_id": recv_value["client_id"], "message_id": recv_value["message_id"], "output": output}
+    logger.warning(f"send: {send_value}")
+    log_shipper.ship(output)
+
+    return send_value
+
+
+async def stream_chat_message(recv_value, key):
+    outputs = []
+
+    async for output in run_stream(recv_value['input'], key):
+        outputs.append(output)
+        send_value = {"client_id": recv_value["client_id"], "message_id": recv_value["message_id"], "output": output}
+        logger.warning(f"send: {send_value}")
+        yield ('data: %s\n\n' % json.dumps(send_value, ensure_ascii=False)).encode('utf-8')
+
+    yield b'event: done\ndata: {}\n\n'
+    log_shipper.ship('</br>'.join(outputs))
+
+
+def state_key(client_id):
+    if 'sid' not in session:
+        session['sid'] = secrets.token_hex(16)
+
+    return '%s:%s' % (session['sid'], client_id)
+
+
+async def run(message, client_id):
+    key = state_key(client_id)
+    context = await async_handler.run_io(state_store.get, key)
+
+    output = await chat_flow.run(message, context, async_handler)
+
+    await async_handler.run_io(state_store.put, key, context)
+
+    return output
+
+
+async def run_stream(message, key):
+    # 대화 흐름은 별도 task 에서 실행하고, 중간 출력은 queue 로 받아서 나오는 대로 내보냄
+    outputs = asyncio.Queue()
+
+    async def flow():
+        context = None
+        try:
+            context = await async_handler.run_io(state_store.get, key)
+            output = await chat_flow.run(message, context, async_handler, outputs.put)
+            await async_handler.run_io(state_store.put, key, context)
+
+            if output is not None:
+                await outputs.put(output)
+        except Exception:
+            # 응답은 이미 200 으로 시작했으므로 오류도 메시지로 보냄
+            logger.exception("chat_flow failed: %s", key)
+            if context is not None:
+                await async_handler.run_io(state_store.put, key, context)
+            await outputs.put(chat_flow.ERROR_MESSAGE)
+        finally:
+            await outputs.put(None)
+
+    task = asyncio.ensure_future(flow())
+
+    while True:
+        output = await outputs.get()
+        if output is None:
+            break
+        yield output
+
+    await task
+
+
+if __name__ == "__main__":
+    logger.critical("******************** async_server started ********************")
+    app.run(host='0.0.0.0', port=5555)
+    logger.critical("******************** async_server finished ********************")
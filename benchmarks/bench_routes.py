@@ -0,0 +1,270 @@
+# -*- coding:utf-8 -*-
+import argparse
+import datetime
+import json
+import logging
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import warnings
+
+import numpy as np
+
+from tasks.transportation_path import handler
+from .fixture_data import write_fixture_dataset
+
+
+# 저장된 API 응답(benchmarks/fixtures)과 작은 fixture 데이터셋으로 경로 검색 단계별 시간을 측정
+#   python -m benchmarks.bench_routes                   결과를 benchmarks/results/latest.json 에 저장하고 baseline 과 비교
+#   python -m benchmarks.bench_routes --save-baseline   결과를 baseline 으로 저장
+# 저장소 최상위 디렉토리에서 실행 (static/img, static/results 경로 기준)
+
+FIXTURE_DIR = 'benchmarks/fixtures'
+RESULT_PATH = 'benchmarks/results/latest.json'
+BASELINE_PATH = 'benchmarks/baseline.json'
+
+DEPARTURE_TIME = datetime.datetime(2020, 9, 2, 14, 55)
+START_LOC = ('출발정류장', '127.027', '37.498')
+END_LOC = ('도착정류장', '126.972', '37.556')
+
+# p50 이 baseline 의 REGRESSION_THRESHOLD 배를 넘으면 느려진 것으로 봄
+REGRESSION_THRESHOLD = 1.25
+
+
+class ReplayResponse:
+    status_code = 200
+
+    def __init__(self, text):
+        self.text = text
+
+    def raise_for_status(self):
+        pass
+
+
+class ReplaySession:
+    """handler.http_session 대신 저장된 응답을 돌려주는 세션"""
+
+    def __init__(self, fixture_dir):
+        with open(os.path.join(fixture_dir, 'search_pub_trans_path.json'), encoding='utf-8') as file:
+            self.search_pub_trans_path = file.read()
+        with open(os.path.join(fixture_dir, 'bus_lane_detail.json'), encoding='utf-8') as file:
+            self.bus_lane_detail = {bus_id: json.dumps(result_dict, ensure_ascii=False)
+                                    for bus_id, result_dict in json.load(file).items()}
+        with open(os.path.join(fixture_dir, 'get_location_info.xml'), encoding='utf-8') as file:
+            self.get_location_info = file.read()
+
+        self.calls = {}
+
+    def get(self, url, params=None, timeout=None):
+        api = url.rsplit('/', 1)[-1].split('?')[0]
+        self.calls[api] = self.calls.get(api, 0) + 1
+
+        if api == 'searchPubTransPathR':
+            return ReplayResponse(self.search_pub_trans_path)
+        if api == 'busLaneDetail':
+            return ReplayResponse(self.bus_lane_detail[str(params['busID'])])
+        if api == 'getLocationInfo':
+            return ReplayResponse(self.get_location_info)
+
+        raise KeyError('No recorded response for %s' % url)
+
+
+def reset_handler():
+    # init_handler 를 처음 실행하는 것처럼 전역 상태를 비움
+    handler.bus_ridership_index = None
+    handler.subway_congestion = None
+    handler.subway_risk_dict = None
+    handler.bus_risk_dict = None
+    handler.mask_imgs = None
+    handler.lane_store = None
+    handler.stop_index = None
+    handler.bus_load_curves = None
+    handler.route_cache.clear()
+
+
+def measure(fn, repeat, warmup=1):
+    for _ in range(warmup):
+        fn()
+
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+
+    return summarize(samples)
+
+
+def summarize(samples):
+    samples = np.array(samples) * 1000
+    return {
+        'n': len(samples),
+        'mean_ms': round(float(samples.mean()), 4),
+        'p50_ms': round(float(np.percentile(samples, 50)), 4),
+        'p95_ms': round(float(np.percentile(samples, 95)), 4),
+        'min_ms': round(float(samples.min()), 4),
+    }
+
+
+def compressed_segments(route_list):
+    segments = []
+    for route in route_list:
+        predicted_time = DEPARTURE_TIME
+        for path in route['subPath']:
+            paths, predicted_time = handler.compress_path(path, predicted_time)
+            if paths:
+                segments.extend(paths)
+    return segments
+
+
+def run_benchmarks(data_dir, fixture_dir, repeat):
+    session = ReplaySession(fixture_dir)
+    handler.http_session = session
+
+    stages = {}
+
+    def init():
+        reset_handler()
+        handler.init_handler(data_dir)
+
+    stages['init_handler'] = measure(init, max(repeat // 5, 3))
+
+    stages['get_location_info'] = measure(
+        lambda: handler.response_to_dict(handler.get_location_info(START_LOC[0])), repeat)
+
+    def search_cold():
+        handler.route_cache.clear()
+        return handler.search_routes(START_LOC, END_LOC, departure_time=DEPARTURE_TIME)
+
+    stages['search_routes_cold'] = measure(search_cold, repeat)
+    stages['search_routes_warm'] = measure(
+        lambda: handler.search_routes(START_LOC, END_LOC, departure_time=DEPARTURE_TIME), repeat)
+
+    route_list = search_cold()
+    segments = compressed_segments(json.loads(session.search_pub_trans_path)['result']['path'])
+    bus_paths = [path for path in segments if path.type == '버스']
+    subway_paths = [path for path in segments if path.type == '지하철']
+    lane_details = handler.prefetch_bus_lane_details([path.bus_id for path in bus_paths], 1)
+
+    def num_in_bus():
+        for path in bus_paths:
+            handler.get_num_in_bus_at_station_list(path.bus_id,
+                                                   int(path.columns.station_ids[0]),
+                                                   int(path.columns.station_ids[-1]),
+                                                   path.start_time, lane_details[path.bus_id])
+
+    def attach_subway():
+        for path in subway_paths:
+            handler.attach_congestion_count_at_subway(path)
+
+    def score_routes():
+        for route in route_list:
+            handler.check_risk_score_per_route(route)
+
+    stages['get_num_in_bus_at_station_list'] = measure(num_in_bus, repeat)
+    stages['attach_congestion_count_at_subway'] = measure(attach_subway, repeat)
+    stages['check_risk_score_per_route'] = measure(score_routes, repeat)
+
+    # 3시간 동안 10분 간격 출발 시각: 시각마다 점수를 따로 계산 vs 한 번에 계산
+    candidates = json.loads(session.search_pub_trans_path)['result']['path']
+    shifts = [datetime.timedelta(minutes=minutes) for minutes in range(0, 181, 10)]
+    sweep_lane_details = handler.prefetch_bus_lane_details(
+        handler.route_bus_ids(handler.compress_routes(candidates, DEPARTURE_TIME)), 1)
+
+    def score_each_departure():
+        for shift in shifts:
+            handler.score_routes(handler.compress_routes(candidates, DEPARTURE_TIME + shift),
+                                 sweep_lane_details, handler.TOP_N_ROUTES)
+
+    def score_departure_sweep():
+        handler.score_departure_times(handler.compress_routes(candidates, DEPARTURE_TIME),
+                                      sweep_lane_details, DEPARTURE_TIME, shifts)
+
+    stages['score_each_departure'] = measure(score_each_departure, max(repeat // 5, 3))
+    stages['score_departure_times'] = measure(score_departure_sweep, repeat)
+
+    def render():
+        # 이미지 캐시를 쓰지 않도록 그린 파일은 바로 지움
+        os.remove(handler.visualization_routes(route_list))
+
+    stages['visualization_routes'] = measure(render, max(repeat // 5, 3))
+
+    return {
+        'created_at': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'repeat': repeat,
+        'routes': len(route_list),
+        'upstream_calls': session.calls,
+        'stages': stages,
+    }
+
+
+def compare(result, baseline, threshold=REGRESSION_THRESHOLD):
+    # stage 별 p50 비율과 느려진 stage 목록
+    rows, regressions = [], []
+
+    for stage, stats in result['stages'].items():
+        base = baseline.get('stages', {}).get(stage) if baseline else None
+        ratio = stats['p50_ms'] / base['p50_ms'] if base and base['p50_ms'] else None
+        rows.append((stage, stats['p50_ms'], base['p50_ms'] if base else None, ratio))
+        if ratio is not None and ratio > threshold:
+            regressions.append(stage)
+
+    return rows, regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='경로 검색 단계별 microbenchmark')
+    parser.add_argument('--repeat', type=int, default=30)
+    parser.add_argument('--fixtures', default=FIXTURE_DIR)
+    parser.add_argument('--data-dir', default=None, help='지정하지 않으면 fixture 데이터셋을 임시 디렉토리에 만듦')
+    parser.add_argument('--out', default=RESULT_PATH)
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD)
+    args = parser.parse_args()
+
+    warnings.filterwarnings('ignore')
+    logging.getLogger('matplotlib.font_manager').setLevel(logging.ERROR)
+
+    tmp_dir = None
+    data_dir = args.data_dir
+    if data_dir is None:
+        tmp_dir = tempfile.mkdtemp(prefix='transafer_bench_')
+        data_dir = write_fixture_dataset(tmp_dir) + '/'
+
+    try:
+        result = run_benchmarks(data_dir, args.fixtures, args.repeat)
+    finally:
+        if tmp_dir:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    out_path = args.baseline if args.save_baseline else args.out
+    os.makedirs(os.path.dirname(out_path), exist_ok=True)
+    with open(out_path, 'w', encoding='utf-8') as file:
+        json.dump(result, file, ensure_ascii=False, indent=2)
+
+    baseline = None
+    if not args.save_baseline and os.path.exists(args.baseline):
+        with open(args.baseline, encoding='utf-8') as file:
+            baseline = json.load(file)
+
+    rows, regressions = compare(result, baseline, args.threshold)
+
+    print('%-36s %10s %10s %7s' % ('stage', 'p50 ms', 'base ms', 'ratio'))
+    for stage, p50, base, ratio in rows:
+        print('%-36s %10.3f %10s %7s' % (stage, p50,
+                                         '-' if base is None else '%.3f' % base,
+                                         '-' if ratio is None else '%.2f' % ratio))
+    print('saved %s' % out_path)
+
+    if regressions:
+        print('regressions (> %.2fx baseline p50): %s' % (args.threshold, ', '.join(regressions)))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+# -*- coding:utf-8 -*-
+import argparse
+import datetime
+import json
+import logging
+import shutil
+import sys
+import tempfile
+import warnings
+
+import numpy as np
+
+from tasks.transportation_path import handler, risk_scoring
+from .bench_routes import FIXTURE_DIR, ReplaySession
+from .fixture_data import write_fixture_dataset
+
+
+# risk_scoring.score_paths 가 기존 check_risk_score_per_route 의 반복문과 같은 점수를 내는지 확인
+#   python -m benchmarks.check_risk_scoring
+# 저장된 API 응답(benchmarks/fixtures)의 구간들을 하루 동안 여러 출발 시각으로 평가하고,
+# fixture 혼잡도로는 잘 넘지 않는 threshold 들까지 확인하도록 임의로 만든 구간도 함께 비교
+
+
+def find_consecutives_loop(values, ongoing_times, consecutive_seconds, thresholds):
+    # 기존 check_risk_score_per_route 안의 find_consecutives (비교 기준, 고치지 말 것)
+    score = 0
+    i = 0
+    threshold_keys = sorted(thresholds.keys(), reverse=True)
+
+    while(i < len(values)):
+        idx_end = np.argmax((ongoing_times - ongoing_times[i]) > consecutive_seconds)
+        if idx_end == 0:
+            break
+        min_value = min(values[i:idx_end+1])
+
+        for key in threshold_keys:
+            if min_value > key:
+                score += thresholds[key]
+                i = idx_end-1
+                break
+        i += 1
+    return score
+
+
+def score_path_loop(ongoing_times, congestions, risks):
+    # 기존 check_risk_score_per_route 의 구간 하나에 대한 점수
+    return (find_consecutives_loop(congestions, ongoing_times, 600, {0.25:0.5, 0.5:1, 0.75:2, 1.0:3}) +
+            find_consecutives_loop(risks, ongoing_times, 600, {0.5:1, 0.75:2, 1.0:3}) +
+            find_consecutives_loop(ongoing_times, ongoing_times, 900, {15*60:1}))
+
+
+def fixture_paths(data_dir, fixture_dir):
+    # 저장된 응답의 구간들을 시간대/요일을 바꿔가며 혼잡도를 붙여서 (ongoing_times, congestions, risks) 로 반환
+    handler.http_session = ReplaySession(fixture_dir)
+    handler.init_handler(data_dir)
+
+    with open(fixture_dir + '/search_pub_trans_path.json', encoding='utf-8') as file:
+        candidates = json.load(file)['result']['path']
+
+    paths = []
+    for day in (2, 5):  # 평일, 주말
+        for hour in range(24):
+            departure_time = datetime.datetime(2020, 9, day, hour, 25)
+            scored_routes = handler.compress_routes(candidates, departure_time)
+            lane_details = handler.prefetch_bus_lane_details(handler.route_bus_ids(scored_routes), 1)
+            segments = [path
+                        for scored_route in scored_routes
+                        for lanes in scored_route['segments']
+                        for path in lanes if path.station_num]
+            handler.attach_congestion_counts(segments, {}, lane_details)
+
+            paths.extend((path.columns.ongoing_seconds(), path.congestions, path.risks)
+                         for path in segments if path.has_congestion())
+
+    return paths
+
+
+def random_paths(count, seed=0):
+    # 정류장 사이 시간과 혼잡도/위험도를 threshold 주변에서 임의로 만든 구간
+    rng = np.random.default_rng(seed)
+    paths = []
+
+    for _ in range(count):
+        station_num = int(rng.integers(1, 60))
+        ongoing_times = np.floor(np.cumsum(np.concatenate([[0], rng.uniform(30, 240, station_num - 1)])))
+        congestions = rng.uniform(0, 1.4, station_num)
+        risks = rng.uniform(0, 1.4, station_num)
+        paths.append((ongoing_times, congestions, risks))
+
+    return paths
+
+
+def check(paths):
+    # 모든 구간을 이어붙여 한 번에 계산한 점수와 구간별 반복문 점수가 같은지
+    expected = np.array([score_path_loop(*path) for path in paths], dtype=np.float64)
+    actual = risk_scoring.score_paths(np.concatenate([path[0] for path in paths]),
+                                      np.concatenate([path[1] for path in paths]),
+                                      np.concatenate([path[2] for path in paths]),
+                                      [len(path[0]) for path in paths])
+
+    return np.flatnonzero(expected != actual), expected
+
+
+def main():
+    parser = argparse.ArgumentParser(description='risk_scoring.score_paths 와 기존 반복문 점수 비교')
+    parser.add_argument('--fixtures', default=FIXTURE_DIR)
+    parser.add_argument('--data-dir', default=None, help='지정하지 않으면 fixture 데이터셋을 임시 디렉토리에 만듦')
+    parser.add_argument('--random', type=int, default=2000, help='임의로 만든 구간 수')
+    args = parser.parse_args()
+
+    warnings.filterwarnings('ignore')
+    logging.getLogger('matplotlib.font_manager').setLevel(logging.ERROR)
+
+    tmp_dir = None
+    data_dir = args.data_dir
+    if data_dir is None:
+        tmp_dir = tempfile.mkdtemp(prefix='transafer_check_')
+        data_dir = write_fixture_dataset(tmp_dir) + '/'
+
+    try:
+        path_sets = {'fixtures': fixture_paths(data_dir, args.fixtures), 'random': random_paths(args.random)}
+    finally:
+        if tmp_dir:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    failed = False
+    for name, paths in path_sets.items():
+        mismatches, expected = check(paths)
+        print('%-10s %5d paths, %5d scored > 0, %d mismatches'
+              % (name, len(paths), np.count_nonzero(expected), len(mismatches)))
+        failed |= len(mismatches) > 0
+
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,149 @@
+# -*- coding:utf-8 -*-
+import json
+import os
+import pickle
+
+import numpy as np
+import pandas as pd
+
+
+# 벤치마크용 작은 데이터셋 (tasks/transportation_path/dataset 과 같은 파일 이름/형식)
+# benchmarks/fixtures 의 응답에 나오는 버스 노선/정류장과 지하철역만 포함
+FIXTURE_SEED = 1
+
+BUS_ROUTES = {101: '7016', 102: '100', 103: '7212'}
+BUS_STATION_NUM = 40
+SUBWAY_STATIONS = [200 + i for i in range(20)]
+SUBWAY_58_STATIONS = [300 + i for i in range(5)]
+
+
+def bus_stations(bus_id):
+    # (stationID, localStationID)
+    return [(5000 + i, str(100000100 + i)) for i in range(BUS_STATION_NUM)]
+
+
+def make_subway_congestion_df(rng, station_ids):
+    hour_columns = ['%02d:00' % hour for hour in range(24)]
+    rows = []
+
+    for day in ('평일', '주말'):
+        for station_id in station_ids:
+            for way in ('상선', '하선', '내선', '외선'):
+                # 일부 역/방향은 비워서 'NaN' 역 대체값을 쓰게 함
+                if station_id != 'NaN' and rng.random() < 0.2:
+                    continue
+                rows.append([day, station_id, way] + list(rng.random(24) * 150))
+
+    return pd.DataFrame(rows, columns=['사용일', '역번', '구분'] + hour_columns)
+
+
+def write_fixture_dataset(data_dir, seed=FIXTURE_SEED):
+    rng = np.random.default_rng(seed)
+    os.makedirs(data_dir, exist_ok=True)
+
+    rows = []
+    for bus_id, bus_no in BUS_ROUTES.items():
+        for is_weekend in (0, 1):
+            for _, local_station_id in bus_stations(bus_id):
+                for hour in range(24):
+                    rows.append((bus_no, is_weekend, int(local_station_id), hour,
+                                 rng.random() * 12, rng.random() * 9))
+    pd.DataFrame(rows, columns=['BUS_ROUTE_NO', 'WEEKEND', 'STND_BSST_ID', 'TIME',
+                                'RIDE_NUM_PRED', 'ALIGHT_NUM_PRED']) \
+        .to_csv(os.path.join(data_dir, 'getout_bus_prep_m_df(202005)_min.csv'), index=False)
+
+    with open(os.path.join(data_dir, 'station_congestion_2015.pkl'), 'wb') as file:
+        pickle.dump(make_subway_congestion_df(rng, SUBWAY_STATIONS + ['NaN']), file)
+    with open(os.path.join(data_dir, 'station_congestion_2015_est_5_8.pkl'), 'wb') as file:
+        pickle.dump(make_subway_congestion_df(rng, SUBWAY_58_STATIONS), file)
+
+    pd.DataFrame({'전철역코드': ['A1', 'A2'], '외부코드': ['999', '998']}) \
+        .to_csv(os.path.join(data_dir, '서울특별시 노선별 지하철역 정보(신규)_fix.csv'), index=False)
+
+    with open(os.path.join(data_dir, 'bus_risk_dict.pkl'), 'wb') as file:
+        pickle.dump({key: key * 0.02 * (1 + rng.random()) for key in range(1, 80)}, file)
+    with open(os.path.join(data_dir, 'subway_risk_dict.pkl'), 'wb') as file:
+        pickle.dump({key: key * 0.015 * (1 + rng.random()) for key in range(1, 600)}, file)
+
+    return data_dir
+
+
+def make_fixture_responses():
+    # 실제 API 응답 형식의 searchPubTransPathR / busLaneDetail / getLocationInfo 응답
+    def bus_path(bus_ids, first, last, section_time):
+        return {'trafficType': 2, 'distance': 3000, 'sectionTime': section_time,
+                'startName': '버스정류장%d' % (5000 + first), 'endName': '버스정류장%d' % (5000 + last - 1),
+                'lane': [{'busNo': BUS_ROUTES[bus_id], 'busID': bus_id, 'type': 11} for bus_id in bus_ids],
+                'passStopList': {'stations': [{'stationID': station_id, 'stationName': '버스정류장%d' % station_id}
+                                              for station_id, _ in bus_stations(bus_ids[0])[first:last]]}}
+
+    def subway_path(subway_codes, station_ids, section_time, way_code=1):
+        return {'trafficType': 1, 'distance': 5000, 'sectionTime': section_time,
+                'startName': '지하철역%d' % station_ids[0], 'endName': '지하철역%d' % station_ids[-1],
+                'way': '상행' if way_code == 1 else '하행', 'wayCode': way_code,
+                'lane': [{'name': '수도권 %d호선' % code, 'subwayCode': code} for code in subway_codes],
+                'passStopList': {'stations': [{'stationID': station_id, 'stationName': '지하철역%d' % station_id}
+                                              for station_id in station_ids]}}
+
+    def walk_path(distance, section_time):
+        return {'trafficType': 3, 'distance': distance, 'sectionTime': section_time}
+
+    def route(sub_paths, total_time):
+        return {'info': {'firstStartStation': '출발정류장', 'lastEndStation': '도착정류장',
+                         'totalTime': total_time, 'payment': 1250, 'mapObj': '1:2:3:4'},
+                'subPath': sub_paths}
+
+    search_pub_trans_path = {'result': {'path': [
+        route([walk_path(100, 3), bus_path([101, 102], 3, 15, 24), walk_path(50, 2),
+               subway_path([2], [200, 201, 202, 203, 250, 204], 14, 2), walk_path(0, 0)], 45),
+        route([walk_path(100, 5), subway_path([1, 4], [205, 206, 207, 300, 301], 12, 1), walk_path(30, 1),
+               bus_path([103, 101, 102], 10, 30, 40)], 62),
+        route([bus_path([102, 103], 0, 20, 35), walk_path(10, 1),
+               subway_path([5], [210, 211, 212, 213, 214, 215, 216, 217], 20, 2)], 58),
+        route([walk_path(200, 4), bus_path([101], 5, 12, 14)], 20),
+    ]}}
+
+    bus_lane_detail = {
+        str(bus_id): {'result': {'busNo': bus_no, 'busStartPoint': '기점', 'busEndPoint': '종점',
+                                 'busFirstTime': '04:30', 'busLastTime': '23:00', 'busTotalDistance': 25000,
+                                 'busInterval': '12',
+                                 'station': [{'stationID': station_id, 'localStationID': local_station_id}
+                                             for station_id, local_station_id in bus_stations(bus_id)]}}
+        for bus_id, bus_no in BUS_ROUTES.items()
+    }
+
+    items = ''.join('<itemList><gpsX>127.0%02d</gpsX><gpsY>37.5%02d</gpsY><poiId>%d</poiId>'
+                    '<poiNm>강남역 %d번출구</poiNm></itemList>' % (i, i, 1000 + i, i + 1) for i in range(8))
+    get_location_info = ('<?xml version="1.0" encoding="UTF-8" standalone="yes"?><ServiceResult>'
+                         '<comMsgHeader/><msgHeader><headerCd>0</headerCd><headerMsg>정상적으로 처리되었습니다.</headerMsg>'
+                         '<itemCount>0</itemCount></msgHeader><msgBody>%s</msgBody></ServiceResult>' % items)
+
+    return search_pub_trans_path, bus_lane_detail, get_location_info
+
+
+def write_fixture_responses(fixture_dir):
+    search_pub_trans_path, bus_lane_detail, get_location_info = make_fixture_responses()
+    os.makedirs(fixture_dir, exist_ok=True)
+
+    with open(os.path.join(fixture_dir, 'search_pub_trans_path.json'), 'w', encoding='utf-8') as file:
+        json.dump(search_pub_trans_path, file, ensure_ascii=False, indent=1)
+    with open(os.path.join(fixture_dir, 'bus_lane_detail.json'), 'w', encoding='utf-8') as file:
+        json.dump(bus_lane_detail, file, ensure_ascii=False, indent=1)
+    with open(os.path.join(fixture_dir, 'get_location_info.xml'), 'w', encoding='utf-8') as file:
+        file.write(get_location_info)
+
+
+if __name__ == '__main__':
+    # 합성 응답 fixture 다시 만들기: python -m benchmarks.fixture_data
+    # (실제 API 응답은 python -m benchmarks.record 로 저장)
+    # --dataset DIR 을 주면 fixture 데이터셋만 DIR 에 만듦 (부하 테스트 서버용 TRANSAFER_DATA_DIR)
+    import argparse
+
+    parser = argparse.ArgumentParser(description='벤치마크/부하 테스트용 fixture 만들기')
+    parser.add_argument('--dataset', default=None)
+    args = parser.parse_args()
+
+    if args.dataset:
+        write_fixture_dataset(args.dataset)
+    else:
+        write_fixture_responses('benchmarks/fixtures')
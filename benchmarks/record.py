@@ -0,0 +1,48 @@
+# -*- coding:utf-8 -*-
+import argparse
+import json
+import os
+
+from tasks.transportation_path import handler
+
+
+# 실제 API 응답을 벤치마크 fixture 로 저장 (tasks/transportation_path/config.py 의 API 키 필요)
+#   python -m benchmarks.record 강남역 서울역 --out benchmarks/fixtures
+# 저장한 응답의 노선/정류장이 fixture 데이터셋에 없으면 혼잡도 정보가 없는 경로로 걸러지므로,
+# 실제 데이터셋으로 벤치마크할 때는 --data-dir 로 tasks/transportation_path/dataset/ 을 지정
+
+def main():
+    parser = argparse.ArgumentParser(description='searchPubTransPathR / busLaneDetail / getLocationInfo 응답 저장')
+    parser.add_argument('origin')
+    parser.add_argument('destination')
+    parser.add_argument('--out', default='benchmarks/fixtures')
+    args = parser.parse_args()
+
+    os.makedirs(args.out, exist_ok=True)
+
+    res = handler.get_location_info(args.origin)
+    with open(os.path.join(args.out, 'get_location_info.xml'), 'w', encoding='utf-8') as file:
+        file.write(res.text)
+
+    start_loc = handler.search_locations(args.origin)[0]
+    end_loc = handler.search_locations(args.destination)[0]
+
+    res = handler.get_path_info(start_loc, end_loc)
+    search_pub_trans_path = json.loads(res.text)
+    with open(os.path.join(args.out, 'search_pub_trans_path.json'), 'w', encoding='utf-8') as file:
+        json.dump(search_pub_trans_path, file, ensure_ascii=False, indent=1)
+
+    bus_ids = {lane['busID']
+               for route in search_pub_trans_path['result']['path']
+               for path in route['subPath'] if path['trafficType'] == 2
+               for lane in path['lane']}
+    bus_lane_detail = {str(bus_id): handler.get_bus_lane_detail(bus_id) for bus_id in sorted(bus_ids)}
+    with open(os.path.join(args.out, 'bus_lane_detail.json'), 'w', encoding='utf-8') as file:
+        json.dump(bus_lane_detail, file, ensure_ascii=False, indent=1)
+
+    print('%s -> %s: %d routes, %d bus lanes saved to %s'
+          % (start_loc[0], end_loc[0], len(search_pub_trans_path['result']['path']), len(bus_lane_detail), args.out))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,181 @@
+# -*- coding:utf-8 -*-
+import argparse
+import asyncio
+import json
+import logging
+import shutil
+import sys
+import tempfile
+import types
+import warnings
+
+from tasks.transportation_path import handler
+from loadtest.run_load import EXPECTED_REPLIES, STATES
+from .bench_routes import FIXTURE_DIR, ReplaySession
+from .fixture_data import write_fixture_dataset
+
+
+# async 서버 경로(chat_flow + async_handler)로 대화 하나를 처음부터 끝까지 진행해보는 smoke test
+#   python -m benchmarks.smoke_async
+# 외부 API 는 저장된 응답(benchmarks/fixtures)을 돌려주는 ReplayAsyncClient 가 대신함
+# httpx 가 없는 환경에서는 async_handler 를 import 할 수 있도록 빈 httpx 모듈을 넣음 (요청은 모두 ReplayAsyncClient 로 감)
+# quart 가 있으면 async_server 의 /chat_message 로도 같은 대화를 보냄
+# asyncio debug 모드로 실행해서 이벤트 루프를 --slow-ms 넘게 막은 콜백이 있으면 실패
+
+MESSAGES = ('/start', '강남역', '2', '서울역', '1')
+
+
+class ReplayAsyncClient:
+    """async_handler.http_client 대신 ReplaySession 의 응답을 돌려주는 클라이언트"""
+
+    def __init__(self, fixture_dir):
+        self.session = ReplaySession(fixture_dir)
+
+    async def get(self, url, params=None):
+        await asyncio.sleep(0)
+        return self.session.get(url, params=params)
+
+    async def aclose(self):
+        pass
+
+
+def import_async_handler():
+    try:
+        import httpx  # noqa: F401
+    except ImportError:
+        sys.modules['httpx'] = types.ModuleType('httpx')
+
+    from tasks.transportation_path import async_handler
+    return async_handler
+
+
+def check_replies(outputs):
+    # 상태별 응답이 다음 단계로 넘어간 문구인지 확인하고, 틀린 상태 목록을 반환
+    return [state for state, output in zip(STATES, outputs) if EXPECTED_REPLIES[state] not in (output or '')]
+
+
+async def run_flow(async_handler, stream):
+    import chat_flow
+
+    context = {}
+    outputs = []
+
+    for message in MESSAGES:
+        emitted = []
+
+        async def emit(output):
+            emitted.append(output)
+
+        output = await chat_flow.run(message, context, async_handler, emit if stream else None)
+        outputs.append('</br>'.join(emitted + ([output] if output is not None else [])))
+
+    return outputs
+
+
+async def run_quart(fixture_dir):
+    # before_serving/after_serving 까지 실행되도록 test_app 안에서 대화를 보냄 (stream 여부별로 client_id 를 나눔)
+    import async_server
+
+    results = {}
+    async with async_server.app.test_app() as test_app:
+        async_server.async_handler.http_client = ReplayAsyncClient(fixture_dir)
+        client = test_app.test_client()
+
+        for stream in (False, True):
+            outputs = []
+            for i, message in enumerate(MESSAGES):
+                form = {'client_id': 'smoke%d' % stream, 'message_id': str(i), 'input': message}
+                if stream:
+                    form['stream'] = '1'
+
+                res = await client.post('/chat_message', form=form)
+                body = await res.get_data(as_text=True)
+
+                if stream:
+                    outputs.append('</br>'.join(json.loads(line[len('data: '):]).get('output', '')
+                                                for line in body.splitlines() if line.startswith('data: ')))
+                else:
+                    outputs.append(json.loads(body)['output'])
+
+            results['async_server stream=%d' % stream] = outputs
+
+    return results
+
+
+async def smoke(fixture_dir, slow_ms):
+    loop = asyncio.get_running_loop()
+    loop.slow_callback_duration = slow_ms / 1000
+
+    async_handler = import_async_handler()
+    async_handler.http_client = ReplayAsyncClient(fixture_dir)
+
+    results = {}
+    for stream in (False, True):
+        results['chat_flow stream=%d' % stream] = await run_flow(async_handler, stream)
+
+    try:
+        import quart  # noqa: F401
+    except ImportError:
+        print('quart is not installed, skipping async_server')
+    else:
+        results.update(await run_quart(fixture_dir))
+
+    await async_handler.close_http_client()
+
+    return results
+
+
+class SlowCallbackCounter(logging.Handler):
+    def __init__(self):
+        super().__init__(logging.WARNING)
+        self.messages = []
+
+    def emit(self, record):
+        if record.getMessage().startswith('Executing'):
+            self.messages.append(record.getMessage())
+
+
+def main():
+    parser = argparse.ArgumentParser(description='async 서버 경로로 대화 하나를 끝까지 실행')
+    parser.add_argument('--fixtures', default=FIXTURE_DIR)
+    parser.add_argument('--data-dir', default=None, help='지정하지 않으면 fixture 데이터셋을 임시 디렉토리에 만듦')
+    parser.add_argument('--slow-ms', type=float, default=100, help='이벤트 루프를 이 시간보다 오래 막으면 실패')
+    args = parser.parse_args()
+
+    warnings.filterwarnings('ignore')
+    logging.getLogger('matplotlib.font_manager').setLevel(logging.ERROR)
+    logging.getLogger('chatbot').setLevel(logging.ERROR)
+
+    slow_callbacks = SlowCallbackCounter()
+    logging.getLogger('asyncio').addHandler(slow_callbacks)
+
+    tmp_dir = None
+    data_dir = args.data_dir
+    if data_dir is None:
+        tmp_dir = tempfile.mkdtemp(prefix='transafer_smoke_')
+        data_dir = write_fixture_dataset(tmp_dir) + '/'
+
+    try:
+        handler.init_handler(data_dir)
+        results = asyncio.run(smoke(args.fixtures, args.slow_ms), debug=True)
+    finally:
+        if tmp_dir:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    failed = False
+    for name, outputs in results.items():
+        wrong_states = check_replies(outputs)
+        print('%-24s %d messages, unexpected replies: %s' % (name, len(outputs), ', '.join(wrong_states) or '-'))
+        failed |= len(wrong_states) > 0
+
+    print('event loop blocked > %gms: %d' % (args.slow_ms, len(slow_callbacks.messages)))
+    for message in slow_callbacks.messages:
+        print('  ' + message)
+    failed |= len(slow_callbacks.messages) > 0
+
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,162 @@
+# -*- coding:utf-8 -*-
+import os
+import time
+
+from tasks.transportation_path import handler, metrics
+
+
+# 챗봇 대화 상태 흐름, Flask 서버(web_server.py)와 async 서버(async_server.py)가 같이 사용
+# services 는 ask_origin / ask_destination / search_routes / save_route_congestion 코루틴과
+# iter_route_charts (다 그려진 순서대로 (정렬 기준, 이미지 경로) 를 주는 async generator) 를 가진 객체
+#   - Flask: SyncServices (handler 를 그대로 부름)
+#   - async: tasks.transportation_path.async_handler
+
+
+class SyncServices:
+    @staticmethod
+    async def ask_origin(message):
+        return handler.ask_origin(message)
+
+    @staticmethod
+    async def ask_destination(message):
+        return handler.ask_destination(message)
+
+    @staticmethod
+    async def search_routes(start_loc, end_loc):
+        return handler.search_routes(start_loc, end_loc)
+
+    @staticmethod
+    async def save_route_congestion(route_list):
+        return handler.save_route_congestion(route_list)
+
+    @staticmethod
+    async def iter_route_charts(route_list):
+        for sort_type, img_path in handler.iter_route_charts(route_list):
+            yield sort_type, img_path
+
+
+# 'client': 혼잡도 json(/routes/<key>)을 브라우저에서 막대 그래프로 그림, 'image': 서버에서 png 로 그림
+CHART_MODE = os.environ.get('CHART_MODE', 'client')
+SORT_TYPES = ('fastest', 'safetest', 'riskiest')
+
+SEARCHING_MESSAGE = '경로를 찾고 있어요. 잠시만 기다려주세요!'
+ERROR_MESSAGE = '죄송해요, 처리 중에 문제가 생겼어요.</br>다시 시도해보시거나, 처음부터 하시려면 /start 를 적어주세요!'
+CHART_MESSAGES = {
+    'fastest': '가장 빠른 환승 경로는 다음과 같아요!</br>%s',
+    'safetest': '이 경로들은 상대적으로 이용 시민들이 적어 안전한 경로예요!</br>%s',
+    'riskiest': '아래 경로들은 이용 시민들이 많으니 가능하면 피하는 게 좋을 것 같아요!</br>%s',
+}
+IMAGE_TAG = '<img src="%s" width="300" height="345">'
+ROUTE_CHART_TAG = '<div class="route_chart" data-key="%s" data-sort="%s"></div>'
+
+
+async def route_charts(route_list, services):
+    # CHART_MODE 에 따라 정렬 기준별 그래프 html 을 준비되는 순서대로 내보냄
+    if CHART_MODE == 'image':
+        async for sort_type, img_path in services.iter_route_charts(route_list):
+            yield sort_type, IMAGE_TAG % img_path
+    else:
+        key = await services.save_route_congestion(route_list)
+        for sort_type in SORT_TYPES:
+            yield sort_type, ROUTE_CHART_TAG % (key, sort_type)
+
+
+def route_summary(start_loc, end_loc, route_list):
+    # 그래프를 그리기 전에 먼저 보내는 요약 (route_list 는 빠른 순서)
+    safest_route = min(route_list, key=lambda route: (route['risk_score'], route['mean_risk']))
+
+    return ('<%s> 부터 <%s> 까지 가는 환승 경로 %d개를 찾았어요!</br>가장 빠른 경로는 %d분, 가장 안전한 경로는 %d분 걸려요.</br>경로별 혼잡도 그래프를 준비하고 있어요...'
+            % (start_loc[0], end_loc[0], len(route_list), route_list[0]['total_time'], safest_route['total_time']))
+
+
+async def run(message, context, services, emit=None):
+    # context(대화 상태 dict)를 갱신하고 출력 문자열을 반환
+    # emit(async 함수)이 있으면 경로 검색 결과를 나오는 대로 emit 으로 보내고, 모두 보낸 뒤에는 None 을 반환
+    started = time.perf_counter()
+
+    if 'state' not in context:
+        context['state'] = 'waiting'
+
+    state = context['state']
+    # 대화 상태별 응답 시간 (/start 는 어느 상태에서든 처음으로 돌아가므로 따로 기록)
+    metric_state = 'start' if message == "/start" else state
+
+    if message == "/start":
+        output = "가장 안전한 길을 알려드리는 TranSafer 입니다. :)<br/>먼저, 출발지를 알려주세요!"
+        context['state'] = 'ask_origin'
+
+    elif state == 'ask_origin':
+        html_path, item_list = await services.ask_origin(message)
+
+        if html_path is None:
+            output = '검색 결과가 없습니다! 이름을 확인해주세요.</br>출발지는 정류장 이름으로 검색됩니다!'
+        else:
+            output = '원하시는 출발지에 가장 가까운 정류장을 숫자로 말씀해주세요!<br/><iframe src="%s" width="300" height="300"></iframe>' % html_path
+            context['state'] = 'ask_detail_origin'
+            context['start_locs'] = item_list
+
+    elif state == 'ask_detail_origin':
+        item_list = context['start_locs']
+        max_station = len(item_list)
+
+        if not message.isnumeric():
+            output = '숫자만 입력해주세요!'
+        elif int(message) < 1 or max_station < int(message):
+            output = '1 ~ %d 사이의 숫자를 입력해주세요!' % max_station
+        else:
+            output = '이제 목적지를 알려주세요!'
+            context['start_loc'] = item_list[int(message)-1]
+            context['start_locs'] = None
+            context['state'] = 'ask_destination'
+
+    elif state == 'ask_destination':
+        html_path, item_list = await services.ask_destination(message)
+
+        if html_path is None:
+            output = '검색 결과가 없습니다! 이름을 확인해주세요.</br>목적지는 정류장 이름으로 검색됩니다.</br>서울시 이외의 정류장은 검색되지 않습니다.'
+        else:
+            output = '원하시는 목적지에 가장 가까운 정류장을 숫자로 말씀해주세요!<br/><iframe src="%s" width="300" height="300"></iframe>' % html_path
+            context['state'] = 'ask_detail_destination'
+            context['end_locs'] = item_list
+
+    elif state == 'ask_detail_destination':
+        item_list = context['end_locs']
+        max_station = len(item_list)
+
+        if not message.isnumeric():
+            output = '숫자만 입력해주세요!'
+        elif int(message) < 1 or max_station < int(message):
+            output = '1 ~ %d 사이의 숫자를 입력해주세요!' % max_station
+        else:
+            context['end_loc'] = item_list[int(message)-1]
+            context['end_locs'] = None
+            context['state'] = 'print_routes'
+
+            start_loc = context['start_loc']
+            end_loc = context['end_loc']
+
+            if emit is not None:
+                await emit(SEARCHING_MESSAGE)
+
+            route_list = await services.search_routes(start_loc, end_loc)
+
+            if not route_list:
+                output = '아쉽지만 혼잡도 정보가 존재하는 환승경로를 찾지 못했어요... </br>다른 경로를 시도해보고 싶으시다면, /start 를 적어주세요!'
+            elif emit is not None:
+                # 요약을 먼저 보내고, 그래프는 다 그려지는 순서대로 보냄
+                await emit(route_summary(start_loc, end_loc, route_list))
+
+                async for sort_type, chart_tag in route_charts(route_list, services):
+                    await emit(CHART_MESSAGES[sort_type] % chart_tag)
+
+                output = None
+            else:
+                chart_tags = {sort_type: chart_tag async for sort_type, chart_tag in route_charts(route_list, services)}
+
+                output = ('<%s> 부터 <%s> 까지 가는 여러 경로들 중에서, 가장 빠른 환승 경로는 다음과 같아요!</br>%s</br>이 경로들은 상대적으로 이용 시민들이 적어 안전한 경로예요!</br>%s</br>한편, 아래 경로들은 이용 시민들이 많으니 가능하면 피하는 게 좋을 것 같아요!%s' % (start_loc[0], end_loc[0], chart_tags['fastest'], chart_tags['safetest'], chart_tags['riskiest']))
+    else:
+        output = '다시 시작하고 싶으시면 /start 를 입력해주세요!'
+
+    metrics.CHAT_STATE_SECONDS.observe(time.perf_counter() - started, state=metric_state)
+
+    return output
@@ -1,10 +1,13 @@
 # -*- coding:utf-8 -*-
 
 import logging
+import os
 import numpy as np
 import collections
+import threading
 import sentencepiece as spm
-from .model import build_model
+from .ner_service import NERBatcher
+from .numpy_model import NumpyNERModel
 
 # net_tag list
 NER_TAG = [
@@ -46,21 +49,58 @@ NER_TAG_IDX
 # 로그
 logger = logging.getLogger("chatbot")
 
-# vocab
-vocab = spm.SentencePieceProcessor()
-vocab.Load("./ko_8000.model")  # 실행시키면 web_server.py가 실행되고 거기서 호출하는 것이므로, web_server.py 기준으로 경로를 적어줘야 함!
+# 실행시키면 web_server.py가 실행되고 거기서 호출하는 것이므로, web_server.py 기준으로 경로를 적어줘야 함!
+VOCAB_PATH = "./ko_8000.model"
+WEIGHTS_PATH = "entity/ner_rnn.hdf5"
+# python -m entity.numpy_model export 로 만든 파일이 있으면 tensorflow 없이 추론
+NUMPY_WEIGHTS_PATH = "entity/ner_rnn.npz"
 
 n_seq = 128
-n_vocab = len(vocab)
 d_model = 512
 n_output = len(NER_TAG)
 
-# model
-model = build_model(n_vocab, d_model, n_output, n_seq)
-model.summary()
+# vocab, model 은 import 할 때가 아니라 처음 추론할 때 읽음
+vocab = None
+model = None
+ner_batcher = None
+_init_lock = threading.Lock()
 
-# load trained weights
-model.load_weights("entity/ner_rnn.hdf5")
+
+def init_entity():
+    global vocab, model
+
+    with _init_lock:
+        if vocab is None:
+            vocab = spm.SentencePieceProcessor()
+            vocab.Load(VOCAB_PATH)
+
+        if model is None and os.path.exists(NUMPY_WEIGHTS_PATH):
+            model = NumpyNERModel(NUMPY_WEIGHTS_PATH)
+
+        if model is None:
+            # tensorflow 는 모델이 필요할 때 import
+            from .model import build_model
+
+            # 길이 bucket 별로 추론할 수 있도록 입력 길이는 고정하지 않음
+            model = build_model(len(vocab), d_model, n_output, None)
+            model.summary(print_fn=logger.debug)
+
+            # load trained weights
+            model.load_weights(WEIGHTS_PATH)
+
+    return None
+
+
+def get_ner_batcher():
+    global ner_batcher
+
+    if ner_batcher is None:
+        init_entity()
+        with _init_lock:
+            if ner_batcher is None:
+                ner_batcher = NERBatcher(predict_batch).start()
+
+    return ner_batcher
 
 
 # 입력에 대한 entity 조회
@@ -69,6 +109,27 @@ def get_entity(recv_value):
     return output
 
 
+def predict_batch(inputs):
+    if isinstance(model, NumpyNERModel):
+        return model.predict(inputs)
+
+    # batch 크기를 2의 거듭제곱으로 맞춰서 모양이 바뀔 때마다 그래프를 다시 만들지 않게 함
+    batch_size = 1 << (len(inputs) - 1).bit_length()
+    padded = np.zeros((batch_size, inputs.shape[1]), dtype=inputs.dtype)
+    padded[:len(inputs)] = inputs
+
+    return model.predict_on_batch(padded)[:len(inputs)]
+
+
+def predict_single(inputs):
+    # 기존처럼 한 문장을 n_seq 까지 패딩해서 추론
+    inputs = inputs + [0] * (n_seq - len(inputs))
+    inputs = inputs[:n_seq]
+
+    outputs = model.predict(np.array([inputs]))
+    return np.argmax(outputs[0], axis=1)
+
+
 # 모델로 추론은 piece 단위로 하고,
 # 그걸 다시 띄어쓰기 단어 단위로 모아서 
 # 상대적으로 많은 entity가 선택되거나 동률이면 앞에것으로 entity를 선택
@@ -80,7 +141,7 @@ def choice_entity(entities):
         if entity not in dic:
             dic[entity] = 0
         dic[entity] += 1
-    print(dic)
+    logger.debug(dic)
     entity, count = "", 0
     for key, value in dic.items():
         # print(count, key, value)
@@ -90,19 +151,23 @@ def choice_entity(entities):
     return entity
 
 
-def do_predict(string):
+def do_predict(string, batched=True):
+    if model is None:
+        init_entity()
+
     tokens = vocab.encode_as_pieces(string)
-    inputs = vocab.encode_as_ids(string)
-    inputs += [0] * (n_seq - len(inputs))
-    inputs = inputs[:n_seq]
+    inputs = vocab.encode_as_ids(string)[:n_seq]
 
-    outputs = model.predict(np.array([inputs]))
-    tkn_idx = np.argmax(outputs[0], axis=1)[:len(tokens)]
+    # 동시에 들어온 요청들과 묶어서 추론 (batched=False 이면 기존처럼 한 문장씩)
+    if batched:
+        tkn_idx = get_ner_batcher().predict(inputs)[:len(tokens)]
+    else:
+        tkn_idx = predict_single(inputs)[:len(tokens)]
     tkn_type = [NER_TAG_IDX[idx] for idx in tkn_idx]
 
     assert len(tkn_type) == len(tokens)
-    print(tokens)
-    print(tkn_type)
+    logger.debug(tokens)
+    logger.debug(tkn_type)
     tags, tag, entities = [], [], []
     for token, type in zip(tokens, tkn_type):
         # space를 미리 계산
@@ -123,5 +188,5 @@ def do_predict(string):
     if tag and entities:
         tags.append(["".join(tag).strip(), choice_entity(entities)])
 
-    print(len(tags))
+    logger.debug(len(tags))
     return tags
\ No newline at end of file
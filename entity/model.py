@@ -1,7 +1,7 @@
 import tensorflow as tf
 
 def build_model(n_vocab, d_model, n_output, n_seq):
-    inputs = tf.keras.layers.Input(n_seq,)  # (bs, n_seq)
+    inputs = tf.keras.layers.Input((n_seq,))  # (bs, n_seq), n_seq 가 None 이면 길이 자유
 
     embedding = tf.keras.layers.Embedding(n_vocab, d_model)
     hidden = embedding(inputs)  # (bs, n_seq, d_model)
@@ -0,0 +1,201 @@
+# -*- coding:utf-8 -*-
+
+import logging
+import queue
+import threading
+import time
+
+from concurrent.futures import Future
+
+import numpy as np
+
+logger = logging.getLogger("chatbot")
+
+# 한 번에 추론할 최대 문장 수와, 첫 요청 이후 다른 요청을 기다리는 최대 시간(초)
+MAX_BATCH_SIZE = 32
+MAX_WAIT = 0.005
+# 문장 길이를 이 길이들 중 하나로 맞춰서 패딩 (마지막 값이 n_seq)
+# BiLSTM 은 패딩을 masking 하지 않고 학습했으므로 역방향 LSTM 이 보는 패딩 길이가 바뀌면 태그가 달라짐
+# 그래서 기본은 한 문장씩 추론할 때와 같이 n_seq 하나만 사용 (짧은 bucket 은 --seq-buckets 로 비교해보고 사용)
+SEQ_BUCKETS = (128,)
+
+
+def bucket_length(length, seq_buckets=SEQ_BUCKETS):
+    for bucket in seq_buckets:
+        if length <= bucket:
+            return bucket
+    return seq_buckets[-1]
+
+
+def pad_batch(inputs_list, seq_len):
+    batch = np.zeros((len(inputs_list), seq_len), dtype=np.int32)
+    for i, inputs in enumerate(inputs_list):
+        inputs = inputs[:seq_len]
+        batch[i, :len(inputs)] = inputs
+    return batch
+
+
+class NERBatcher:
+    """
+    여러 요청 스레드의 NER 추론을 모아서 한 번에 처리하는 백그라운드 스레드
+    첫 요청이 들어온 뒤 max_wait 동안 (또는 max_batch_size 개까지) 모은 요청을 길이 bucket 별로 묶어서
+    predict_fn((batch, seq_len) int 배열) -> (batch, seq_len, n_output) 확률 배열 로 추론
+    """
+
+    def __init__(self, predict_fn, max_batch_size=MAX_BATCH_SIZE, max_wait=MAX_WAIT, seq_buckets=SEQ_BUCKETS):
+        self.predict_fn = predict_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.seq_buckets = tuple(seq_buckets)
+
+        self.batches = 0
+        self.requests = 0
+
+        self._queue = queue.Queue()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='ner-batcher', daemon=True)
+            self._thread.start()
+        return self
+
+    def close(self, timeout=5):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def submit(self, inputs):
+        # inputs: 토큰 id 목록, 토큰별 태그 index 배열을 돌려주는 Future 반환
+        future = Future()
+        self._queue.put((list(inputs), future))
+        return future
+
+    def predict(self, inputs, timeout=None):
+        return self.submit(inputs).result(timeout)
+
+    def _next_batch(self):
+        try:
+            batch = [self._queue.get(timeout=0.1)]
+        except queue.Empty:
+            return []
+
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+
+        return batch
+
+    def _run(self):
+        while not (self._stop_event.is_set() and self._queue.empty()):
+            batch = self._next_batch()
+            if not batch:
+                continue
+
+            self.batches += 1
+            self.requests += len(batch)
+
+            # 같은 길이 bucket 끼리 묶어서 추론
+            groups = {}
+            for inputs, future in batch:
+                groups.setdefault(bucket_length(len(inputs), self.seq_buckets), []).append((inputs, future))
+
+            for seq_len, items in groups.items():
+                self._predict_group(seq_len, items)
+
+    def _predict_group(self, seq_len, items):
+        try:
+            outputs = self.predict_fn(pad_batch([inputs for inputs, _ in items], seq_len))
+            tkn_idx = np.argmax(outputs, axis=-1)
+        except Exception as e:
+            logger.warning(f"NER batch failed: {e}")
+            for _, future in items:
+                future.set_exception(e)
+            return
+
+        for i, (inputs, future) in enumerate(items):
+            future.set_result(tkn_idx[i, :len(inputs)])
+
+
+def percentile(latencies, q):
+    return float(np.percentile(latencies, q) * 1000) if latencies else 0.0
+
+
+def run_bench(predict, sentences, threads, repeat):
+    # threads 개의 스레드가 동시에 문장들을 repeat 번씩 추론할 때의 처리량과 지연 시간
+    latencies = []
+    results = {}
+    lock = threading.Lock()
+
+    def worker(worker_idx):
+        for i in range(repeat):
+            sentence = sentences[(worker_idx * repeat + i) % len(sentences)]
+            started = time.perf_counter()
+            tags = predict(sentence)
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies.append(elapsed)
+                results[sentence] = tags
+
+    started = time.perf_counter()
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    for worker_thread in workers:
+        worker_thread.start()
+    for worker_thread in workers:
+        worker_thread.join()
+    elapsed = time.perf_counter() - started
+
+    return {
+        'requests': len(latencies),
+        'throughput': len(latencies) / elapsed,
+        'p50_ms': percentile(latencies, 50),
+        'p99_ms': percentile(latencies, 99),
+    }, results
+
+
+if __name__ == '__main__':
+    # 웹 서버와 같은 경로 기준으로 실행: python -m entity.ner_service --threads 16
+    import argparse
+
+    import pandas as pd
+
+    from . import entity
+
+    parser = argparse.ArgumentParser(description='NER 한 문장씩 추론 vs micro-batch 추론 비교')
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--stop-list', default='entity/stop_name_df.csv')
+    parser.add_argument('--seq-buckets', default=','.join(map(str, SEQ_BUCKETS)),
+                        help='micro-batch 패딩 길이 목록 (예: 32,64,128)')
+    args = parser.parse_args()
+
+    stop_names = pd.read_csv(args.stop_list)['stop_name'].dropna().sample(200, random_state=0).tolist()
+    sentences = ['%s에서 %s까지 가는 가장 안전한 길 알려줘' % (origin, destination)
+                 for origin, destination in zip(stop_names[0::2], stop_names[1::2])]
+
+    entity.init_entity()
+    entity.ner_batcher = NERBatcher(entity.predict_batch,
+                                    seq_buckets=[int(length) for length in args.seq_buckets.split(',')]).start()
+    entity.do_predict(sentences[0], batched=False)
+    entity.do_predict(sentences[0], batched=True)
+
+    single, single_tags = run_bench(lambda s: entity.do_predict(s, batched=False), sentences, args.threads, args.repeat)
+    batched, batched_tags = run_bench(lambda s: entity.do_predict(s, batched=True), sentences, args.threads, args.repeat)
+
+    # 짧은 길이 bucket 을 쓰면 역방향 LSTM 이 보는 패딩 길이가 달라지므로 결과가 같은지 함께 확인
+    same = sum(single_tags[s] == batched_tags.get(s) for s in single_tags)
+
+    for name, stats in (('single', single), ('batched', batched)):
+        print('%-8s %5d req  %8.1f req/s  p50 %7.2f ms  p99 %7.2f ms'
+              % (name, stats['requests'], stats['throughput'], stats['p50_ms'], stats['p99_ms']))
+    print('batches: %d (%.1f req/batch)' % (entity.ner_batcher.batches,
+                                            entity.ner_batcher.requests / max(entity.ner_batcher.batches, 1)))
+    print('same tags: %d / %d' % (same, len(single_tags)))
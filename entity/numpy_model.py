@@ -0,0 +1,209 @@
+# -*- coding:utf-8 -*-
+
+import numpy as np
+
+# model.py 의 build_model 과 같은 구조 (Embedding -> BiLSTM -> BiLSTM -> Dense(relu) -> Dense -> Softmax) 를
+# tensorflow 없이 numpy 로만 추론
+# LSTM 가중치는 keras 와 같이 [i, f, c, o] 게이트 순서, activation=tanh, recurrent_activation=sigmoid
+
+WEIGHTS_VERSION = 1
+LSTM_NAMES = ('lstm1_fw', 'lstm1_bw', 'lstm2_fw', 'lstm2_bw')
+KERNEL_NAMES = tuple('%s_%s' % (lstm, name) for lstm in LSTM_NAMES for name in ('kernel', 'recurrent'))
+KERNEL_NAMES += ('dense1_kernel', 'dense2_kernel')
+
+
+def quantize_columns(weight):
+    # 열(출력 unit) 별 scale 로 int8 양자화
+    scale = np.abs(weight).max(axis=0) / 127
+    scale[scale == 0] = 1
+    return np.round(weight / scale).astype(np.int8), scale.astype(np.float32)
+
+
+def export_weights(hdf5_path, npz_path, n_vocab, d_model, n_output, int8=False):
+    """학습된 keras 모델(hdf5)의 가중치를 numpy 추론용 npz 파일로 저장 (tensorflow 필요)"""
+    from .model import build_model
+
+    model = build_model(n_vocab, d_model, n_output, None)
+    model.load_weights(hdf5_path)
+
+    embedding, lstm1, lstm2, dense1, dense2 = [layer for layer in model.layers
+                                               if layer.weights]
+
+    weights = {'embedding': embedding.get_weights()[0],
+               'dense1_kernel': dense1.get_weights()[0], 'dense1_bias': dense1.get_weights()[1],
+               'dense2_kernel': dense2.get_weights()[0], 'dense2_bias': dense2.get_weights()[1]}
+
+    # Bidirectional 의 가중치는 forward (kernel, recurrent_kernel, bias), backward (...) 순서
+    for name, layer in (('lstm1', lstm1), ('lstm2', lstm2)):
+        fw_kernel, fw_recurrent, fw_bias, bw_kernel, bw_recurrent, bw_bias = layer.get_weights()
+        weights.update({'%s_fw_kernel' % name: fw_kernel, '%s_fw_recurrent' % name: fw_recurrent,
+                        '%s_fw_bias' % name: fw_bias,
+                        '%s_bw_kernel' % name: bw_kernel, '%s_bw_recurrent' % name: bw_recurrent,
+                        '%s_bw_bias' % name: bw_bias})
+
+    save_weights(npz_path, weights, int8)
+
+    return model
+
+
+def save_weights(npz_path, weights, int8=False):
+    weights = {name: np.asarray(weight, dtype=np.float32) for name, weight in weights.items()}
+
+    if int8:
+        # 임베딩은 행 단위로 꺼내 쓰므로 행 별 scale, 나머지 kernel 은 열 별 scale
+        embedding, weights['embedding_scale'] = quantize_columns(weights['embedding'].T)
+        weights['embedding'] = np.ascontiguousarray(embedding.T)
+        for name in KERNEL_NAMES:
+            weights[name], weights[name + '_scale'] = quantize_columns(weights[name])
+
+    np.savez(npz_path, version=np.int32(WEIGHTS_VERSION), int8=np.bool_(int8), **weights)
+
+
+def sigmoid(x):
+    return 0.5 * (np.tanh(0.5 * x) + 1)
+
+
+class NumpyNERModel:
+    """export_weights 로 만든 npz 를 읽어서 (batch, seq_len) 토큰 id -> (batch, seq_len, n_output) 확률을 계산"""
+
+    def __init__(self, npz_path):
+        with np.load(npz_path) as file:
+            if int(file['version']) != WEIGHTS_VERSION:
+                raise ValueError('Unsupported NER weights version: %s' % file['version'])
+            self.weights = {name: file[name] for name in file.files if name != 'version'}
+
+        self.int8 = bool(self.weights.pop('int8'))
+
+    def _kernel(self, name):
+        # int8 모드는 파일/메모리에는 int8 로 두고 추론할 때만 float32 로 복원
+        weight = self.weights[name]
+        if self.int8:
+            return weight.astype(np.float32) * self.weights[name + '_scale']
+        return weight
+
+    def _embed(self, inputs):
+        embedded = self.weights['embedding'][inputs]
+        if self.int8:
+            embedded = embedded.astype(np.float32) * self.weights['embedding_scale'][inputs][..., None]
+        return embedded
+
+    def _lstm(self, name, inputs, h, c, reverse=False):
+        # 입력 쪽 곱셈은 모든 시점을 한 번에 하고, 시점마다 recurrent 곱셈만 반복
+        units = h.shape[1]
+        x_proj = inputs @ self._kernel(name + '_kernel') + self.weights[name + '_bias']
+        recurrent = self._kernel(name + '_recurrent')
+
+        seq_len = inputs.shape[1]
+        outputs = np.empty((inputs.shape[0], seq_len, units), dtype=np.float32)
+        steps = range(seq_len - 1, -1, -1) if reverse else range(seq_len)
+
+        for t in steps:
+            z = x_proj[:, t] + h @ recurrent
+            i = sigmoid(z[:, :units])
+            f = sigmoid(z[:, units:2*units])
+            c = f * c + i * np.tanh(z[:, 2*units:3*units])
+            h = sigmoid(z[:, 3*units:]) * np.tanh(c)
+            outputs[:, t] = h
+
+        return outputs, h, c
+
+    def _bidirectional(self, name, inputs, states):
+        fw_out, fw_h, fw_c = self._lstm(name + '_fw', inputs, states[0], states[1])
+        bw_out, bw_h, bw_c = self._lstm(name + '_bw', inputs, states[2], states[3], reverse=True)
+        return np.concatenate([fw_out, bw_out], axis=-1), (fw_h, fw_c, bw_h, bw_c)
+
+    def predict(self, inputs):
+        inputs = np.asarray(inputs, dtype=np.int64)
+        units = self.weights['lstm1_fw_recurrent'].shape[0]
+        zeros = np.zeros((inputs.shape[0], units), dtype=np.float32)
+
+        hidden = self._embed(inputs)
+        hidden, states = self._bidirectional('lstm1', hidden, (zeros, zeros, zeros, zeros))
+
+        # 두번째 BiLSTM 은 첫번째 BiLSTM 의 마지막 상태에서 시작
+        hidden, _ = self._bidirectional('lstm2', hidden, states)
+
+        hidden = np.maximum(hidden @ self._kernel('dense1_kernel') + self.weights['dense1_bias'], 0)
+        logits = hidden @ self._kernel('dense2_kernel') + self.weights['dense2_bias']
+
+        logits -= logits.max(axis=-1, keepdims=True)
+        probs = np.exp(logits)
+        return probs / probs.sum(axis=-1, keepdims=True)
+
+    def predict_on_batch(self, inputs):
+        return self.predict(inputs)
+
+
+if __name__ == '__main__':
+    # 웹 서버와 같은 경로 기준으로 실행
+    #   python -m entity.numpy_model export [--int8]
+    #   python -m entity.numpy_model check     (float/int8 로 변환한 가중치를 keras 모델과 태그 비교)
+    import argparse
+    import os
+    import shutil
+    import tempfile
+
+    from concurrent.futures import ThreadPoolExecutor
+
+    import pandas as pd
+    import sentencepiece as spm
+
+    from . import entity
+
+    parser = argparse.ArgumentParser(description='BiLSTM NER 가중치를 numpy 추론용으로 변환')
+    parser.add_argument('command', choices=['export', 'check'])
+    parser.add_argument('--weights', default=entity.WEIGHTS_PATH)
+    parser.add_argument('--out', default=entity.NUMPY_WEIGHTS_PATH)
+    parser.add_argument('--int8', action='store_true')
+    parser.add_argument('--stop-list', default='entity/stop_name_df.csv')
+    parser.add_argument('--threads', type=int, default=16, help='check 에서 batched 추론을 동시에 부르는 스레드 수')
+    args = parser.parse_args()
+
+    vocab = spm.SentencePieceProcessor()
+    vocab.Load(entity.VOCAB_PATH)
+
+    if args.command == 'export':
+        export_weights(args.weights, args.out, len(vocab), entity.d_model, entity.n_output, args.int8)
+        print('saved %s' % args.out)
+
+    elif args.command == 'check':
+        # 기준은 keras 모델로 한 문장씩 n_seq 까지 패딩해서 추론한 결과 (do_predict(batched=False))
+        # float/int8 로 변환한 numpy 모델을 같은 입력으로 바로 추론한 태그와,
+        # 웹 서버처럼 여러 스레드에서 do_predict(batched=True) 로 micro-batch 추론한 결과를 비교
+        stop_names = pd.read_csv(args.stop_list)['stop_name'].dropna().sample(200, random_state=0).tolist()
+        sentences = ['%s에서 %s까지 가는 가장 안전한 길 알려줘' % (origin, destination)
+                     for origin, destination in zip(stop_names[0::2], stop_names[1::2])]
+        inputs = np.zeros((len(sentences), entity.n_seq), dtype=np.int64)
+        for i, sentence in enumerate(sentences):
+            ids = vocab.encode_as_ids(sentence)[:entity.n_seq]
+            inputs[i, :len(ids)] = ids
+
+        tmp_dir = tempfile.mkdtemp(prefix='ner_check_')
+        float_path = os.path.join(tmp_dir, 'ner_rnn.npz')
+        int8_path = os.path.join(tmp_dir, 'ner_rnn_int8.npz')
+
+        keras_model = export_weights(args.weights, float_path, len(vocab), entity.d_model, entity.n_output)
+        export_weights(args.weights, int8_path, len(vocab), entity.d_model, entity.n_output, int8=True)
+
+        entity.vocab = vocab
+        entity.model = keras_model
+        keras_tags = np.argmax(keras_model.predict(inputs), axis=-1)
+        keras_entities = [entity.do_predict(sentence, batched=False) for sentence in sentences]
+
+        for npz_path in (float_path, int8_path):
+            numpy_model = NumpyNERModel(npz_path)
+            numpy_tags = np.argmax(numpy_model.predict(inputs), axis=-1)
+
+            entity.model = numpy_model
+            entity.ner_batcher = None
+            with ThreadPoolExecutor(args.threads) as executor:
+                batched_entities = list(executor.map(lambda sentence: entity.do_predict(sentence, batched=True),
+                                                     sentences))
+            entity.ner_batcher.close()
+
+            print('int8=%-5s same tags: %d / %d, same do_predict(batched=True) entities: %d / %d (%d batches)'
+                  % (numpy_model.int8, (keras_tags == numpy_tags).all(axis=1).sum(), len(sentences),
+                     sum(a == b for a, b in zip(keras_entities, batched_entities)), len(sentences),
+                     entity.ner_batcher.batches))
+
+        shutil.rmtree(tmp_dir, ignore_errors=True)
@@ -0,0 +1,171 @@
+# -*- coding:utf-8 -*-
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import requests
+
+
+# 여러 사용자(client_id)가 동시에 /start -> 출발지 -> 선택 -> 목적지 -> 선택 대화를 끝까지 진행하는 부하 생성기
+#   python -m loadtest.run_load --url http://localhost:5555 --sessions 200 --concurrency 20 --stub-url http://localhost:8090
+# 대화 상태별 처리량과 p50/p95/p99 응답 시간을 출력하고 --out 에 json 으로 저장
+# 검색어는 세션마다 다르게 만들어서 정류장 검색/후보 경로 캐시가 stub 호출을 가리지 않도록 함 (--repeat-queries 면 고정 목록)
+# busLaneDetail 저장소까지 비우려면 챗봇 서버를 TRANSAFER_UPSTREAM_CACHES=0 으로 실행
+
+STATES = ('start', 'ask_origin', 'ask_detail_origin', 'ask_destination', 'ask_detail_destination')
+PLACES = ('강남역', '서울역', '시청', '광화문', '잠실', '홍대입구', '신촌', '여의도')
+
+# 상태별로 대화가 다음 단계로 넘어갔을 때의 응답 (chat_flow.py 의 문구)
+# 마지막 단계는 경로 그래프까지 받아야 성공
+EXPECTED_REPLIES = {
+    'start': '출발지를 알려주세요',
+    'ask_origin': '숫자로 말씀해주세요',
+    'ask_detail_origin': '목적지를 알려주세요',
+    'ask_destination': '숫자로 말씀해주세요',
+    'ask_detail_destination': '가장 빠른 환승 경로는',
+}
+
+
+class LoadStats:
+    def __init__(self):
+        self.latencies = {state: [] for state in STATES}
+        self.errors = {state: 0 for state in STATES}
+        self.rejected = {state: 0 for state in STATES}
+        self.completed = 0
+        self._lock = threading.Lock()
+
+    def record(self, state, elapsed, error=False, rejected=False):
+        # error: HTTP 오류/연결 실패, rejected: 200 이지만 대화가 다음 단계로 넘어가지 않은 응답
+        with self._lock:
+            self.latencies[state].append(elapsed)
+            if error:
+                self.errors[state] += 1
+            if rejected:
+                self.rejected[state] += 1
+
+    def finish_session(self):
+        with self._lock:
+            self.completed += 1
+
+    def summary(self, elapsed):
+        result = {'elapsed_sec': round(elapsed, 3),
+                  'sessions_completed': self.completed,
+                  'sessions_per_sec': round(self.completed / elapsed, 3),
+                  'messages_per_sec': round(sum(len(v) for v in self.latencies.values()) / elapsed, 3),
+                  'states': {}}
+
+        for state in STATES:
+            samples = np.array(self.latencies[state]) * 1000
+            result['states'][state] = {
+                'requests': len(samples),
+                'errors': self.errors[state],
+                'rejected': self.rejected[state],
+                'p50_ms': round(float(np.percentile(samples, 50)), 2) if len(samples) else None,
+                'p95_ms': round(float(np.percentile(samples, 95)), 2) if len(samples) else None,
+                'p99_ms': round(float(np.percentile(samples, 99)), 2) if len(samples) else None,
+            }
+
+        return result
+
+
+def run_session(url, stats, max_pick, timeout, think_time, session_no=None):
+    # 쿠키(세션 id)를 유지하는 사용자 하나, session_no 가 있으면 검색어 뒤에 붙여 세션마다 다른 검색어로 만듦
+    session = requests.Session()
+    client_id = str(uuid.uuid4())
+    origin, destination = random.sample(PLACES, 2)
+    if session_no is not None:
+        origin, destination = '%s %d' % (origin, session_no), '%s %d' % (destination, session_no)
+
+    messages = [('start', '/start'),
+                ('ask_origin', origin),
+                ('ask_detail_origin', str(random.randint(1, max_pick))),
+                ('ask_destination', destination),
+                ('ask_detail_destination', str(random.randint(1, max_pick)))]
+
+    for message_id, (state, message) in enumerate(messages):
+        started = time.perf_counter()
+        error = rejected = False
+        try:
+            res = session.post(url + '/chat_message', timeout=timeout,
+                               data={'client_id': client_id, 'message_id': message_id, 'input': message})
+            res.raise_for_status()
+            rejected = EXPECTED_REPLIES[state] not in (res.json().get('output') or '')
+        except (requests.RequestException, ValueError):
+            error = True
+        stats.record(state, time.perf_counter() - started, error, rejected)
+
+        if error or rejected:
+            return
+        if think_time:
+            time.sleep(random.uniform(0, think_time))
+
+    stats.finish_session()
+
+
+def stub_counts(stub_url):
+    return requests.get(stub_url.rstrip('/') + '/stats', timeout=10).json()['counts']
+
+
+def main():
+    parser = argparse.ArgumentParser(description='챗봇 대화 전체 흐름 부하 테스트')
+    parser.add_argument('--url', default='http://localhost:5555')
+    parser.add_argument('--sessions', type=int, default=100)
+    parser.add_argument('--concurrency', type=int, default=10)
+    parser.add_argument('--max-pick', type=int, default=8, help='정류장 후보 중 고를 최대 번호')
+    parser.add_argument('--think-time', type=float, default=0.0, help='메시지 사이 최대 대기 시간(초)')
+    parser.add_argument('--timeout', type=float, default=60.0)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat-queries', action='store_true',
+                        help='세션마다 다른 검색어 대신 PLACES 를 그대로 사용 (캐시가 데워진 상태 측정)')
+    parser.add_argument('--stub-url', default=None, help='stub 서버 주소, 지정하면 API 별 호출 수를 같이 출력')
+    parser.add_argument('--out', default=None)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    stats = LoadStats()
+    stub_before = stub_counts(args.stub_url) if args.stub_url else None
+
+    # 검색어 뒤에 붙일 번호는 실행마다 달라야 이전 실행에서 쌓인 정류장 검색 결과를 쓰지 않음
+    run_id = int(time.time())
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        for i in range(args.sessions):
+            executor.submit(run_session, args.url.rstrip('/'), stats, args.max_pick, args.timeout, args.think_time,
+                            None if args.repeat_queries else run_id * 100000 + i)
+    result = stats.summary(time.perf_counter() - started)
+    result.update({'sessions': args.sessions, 'concurrency': args.concurrency})
+
+    if stub_before is not None:
+        stub_after = stub_counts(args.stub_url)
+        result['stub_calls'] = {api: {name: count - stub_before.get(api, {}).get(name, 0)
+                                      for name, count in stub_after[api].items()}
+                                for api in stub_after}
+
+    print('%d/%d sessions in %.1fs: %.2f sessions/s, %.2f messages/s'
+          % (result['sessions_completed'], args.sessions, result['elapsed_sec'],
+             result['sessions_per_sec'], result['messages_per_sec']))
+    print('%-24s %8s %7s %8s %9s %9s %9s' % ('state', 'requests', 'errors', 'rejected', 'p50 ms', 'p95 ms', 'p99 ms'))
+    for state, row in result['states'].items():
+        print('%-24s %8d %7d %8d %9s %9s %9s' % (state, row['requests'], row['errors'], row['rejected'],
+                                                 row['p50_ms'], row['p95_ms'], row['p99_ms']))
+
+    if 'stub_calls' in result:
+        # 세션 수에 비해 호출 수가 적으면 캐시가 stub 을 가리고 있는 것
+        print('%-24s %8s %7s' % ('stub api', 'ok', 'error'))
+        for api, row in result['stub_calls'].items():
+            print('%-24s %8d %7d' % (api, row['ok'], row['error']))
+
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as file:
+            json.dump(result, file, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
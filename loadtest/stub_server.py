@@ -0,0 +1,134 @@
+# -*- coding:utf-8 -*-
+import argparse
+import json
+import os
+import random
+import re
+import threading
+import time
+import zlib
+
+from flask import Flask, Response, request
+
+
+# ODsay / 서울시 버스 API 대신 저장된 응답(benchmarks/fixtures)을 지연 시간/오류율을 주어 돌려주는 서버
+#   python -m loadtest.stub_server --port 8090 --latency-ms 80 --error-rate 0.01
+# 챗봇 서버는 아래 환경변수로 이 서버를 바라보게 해서 실행
+#   ODSAY_API_URL=http://localhost:8090/odsay/ SEOUL_API_URL=http://localhost:8090/seoul \
+#   TRANSAFER_DATA_DIR=<python -m benchmarks.fixture_data --dataset 로 만든 디렉토리>/ python web_server.py
+# getLocationInfo 의 정류장 좌표는 검색어마다 다르게 옮겨서 돌려줌 (검색어가 다르면 후보 경로 캐시도 다른 키가 됨)
+
+APIS = ('searchPubTransPathR', 'busLaneDetail', 'getLocationInfo')
+
+app = Flask(__name__)
+
+settings = {
+    'latency_ms': {api: 50.0 for api in APIS},
+    'jitter_ms': 20.0,
+    'error_rate': {api: 0.0 for api in APIS},
+}
+responses = {}
+counts = {api: {'ok': 0, 'error': 0} for api in APIS}
+counts_lock = threading.Lock()
+
+
+def load_responses(fixture_dir):
+    with open(os.path.join(fixture_dir, 'search_pub_trans_path.json'), encoding='utf-8') as file:
+        responses['searchPubTransPathR'] = file.read()
+    with open(os.path.join(fixture_dir, 'bus_lane_detail.json'), encoding='utf-8') as file:
+        responses['busLaneDetail'] = {bus_id: json.dumps(result_dict, ensure_ascii=False)
+                                      for bus_id, result_dict in json.load(file).items()}
+    with open(os.path.join(fixture_dir, 'get_location_info.xml'), encoding='utf-8') as file:
+        responses['getLocationInfo'] = file.read()
+
+
+def simulate(api):
+    # 설정한 지연 시간만큼 기다리고, error_rate 확률로 실패 응답을 보낼지 정함
+    latency = max(0.0, random.gauss(settings['latency_ms'][api], settings['jitter_ms'])) / 1000
+    time.sleep(latency)
+
+    failed = random.random() < settings['error_rate'][api]
+    with counts_lock:
+        counts[api]['error' if failed else 'ok'] += 1
+
+    return failed
+
+
+@app.route("/odsay/<api>", methods=["GET"])
+def odsay(api):
+    if api not in ('searchPubTransPathR', 'busLaneDetail'):
+        return {'error': {'code': '404', 'msg': 'unknown api'}}, 404
+
+    if simulate(api):
+        return Response('stub upstream error', status=503)
+
+    if api == 'busLaneDetail':
+        body = responses['busLaneDetail'].get(request.args.get('busID', ''))
+        if body is None:
+            return {'error': [{'code': '-98', 'message': '결과가 없습니다.'}]}
+        return Response(body, mimetype='application/json')
+
+    return Response(responses['searchPubTransPathR'], mimetype='application/json')
+
+
+def shift_coordinates(body, query):
+    # 검색어로 정한 만큼 (최대 약 1도) gpsX / gpsY 를 옮김, 같은 검색어는 항상 같은 좌표
+    code = zlib.crc32(query.encode('utf-8'))
+    offsets = {'gpsX': (code % 1000) * 0.001, 'gpsY': (code // 1000 % 1000) * 0.001}
+
+    return re.sub(r'<(gpsX|gpsY)>([0-9.]+)</\1>',
+                  lambda match: '<%s>%.6f</%s>' % (match.group(1), float(match.group(2)) + offsets[match.group(1)],
+                                                    match.group(1)),
+                  body)
+
+
+@app.route("/seoul/getLocationInfo", methods=["GET"])
+def get_location_info():
+    if simulate('getLocationInfo'):
+        return Response('stub upstream error', status=503)
+
+    return Response(shift_coordinates(responses['getLocationInfo'], request.args.get('stSrch', '')),
+                    mimetype='application/xml')
+
+
+@app.route("/stats", methods=["GET"])
+def stats():
+    with counts_lock:
+        return {'settings': settings, 'counts': counts}
+
+
+def parse_overrides(values, default):
+    # ['busLaneDetail=120', ...] -> API 별 값
+    result = {api: default for api in APIS}
+    for value in values or []:
+        api, number = value.split('=', 1)
+        if api not in result:
+            raise ValueError('Unknown api: %s' % api)
+        result[api] = float(number)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='ODsay / 서울시 버스 API stub 서버')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8090)
+    parser.add_argument('--fixtures', default='benchmarks/fixtures')
+    parser.add_argument('--latency-ms', type=float, default=50.0)
+    parser.add_argument('--jitter-ms', type=float, default=20.0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--api-latency-ms', action='append', metavar='API=MS',
+                        help='API 별 지연 시간, 예: busLaneDetail=150')
+    parser.add_argument('--api-error-rate', action='append', metavar='API=RATE',
+                        help='API 별 오류율, 예: searchPubTransPathR=0.05')
+    args = parser.parse_args()
+
+    load_responses(args.fixtures)
+    settings['latency_ms'] = parse_overrides(args.api_latency_ms, args.latency_ms)
+    settings['jitter_ms'] = args.jitter_ms
+    settings['error_rate'] = parse_overrides(args.api_error_rate, args.error_rate)
+
+    app.run(host=args.host, port=args.port, threaded=True)
+
+
+if __name__ == '__main__':
+    main()
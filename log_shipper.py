@@ -0,0 +1,88 @@
+# -*- coding:utf-8 -*-
+
+import json
+import logging
+import queue
+import threading
+import time
+
+import requests
+
+logger = logging.getLogger("chatbot")
+
+
+class LogShipper:
+    """
+    챗봇 응답 로그를 요청 스레드에서 바로 보내지 않고, 큐에 쌓아두었다가 백그라운드 스레드가 모아서 전송
+    큐가 가득 차면 버리고 dropped 에 개수를 셈
+    """
+
+    def __init__(self, url, username='TranSafer Log', max_queue_size=1000,
+                 batch_size=20, flush_interval=2.0, timeout=5):
+        self.url = url
+        self.username = username
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.timeout = timeout
+
+        self.dropped = 0
+        self.sent = 0
+        self.failed = 0
+
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._stop_event = threading.Event()
+        self._lock = threading.Lock()
+        self._session = requests.Session()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='log-shipper', daemon=True)
+            self._thread.start()
+        return self
+
+    def ship(self, text):
+        try:
+            self._queue.put_nowait(text)
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+
+    def close(self, timeout=5):
+        # 남은 로그를 모두 보내고 종료
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _next_batch(self):
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or (self._stop_event.is_set() and self._queue.empty()):
+                break
+            try:
+                batch.append(self._queue.get(timeout=min(remaining, 0.1)))
+            except queue.Empty:
+                continue
+
+        return batch
+
+    def _run(self):
+        while not (self._stop_event.is_set() and self._queue.empty()):
+            batch = self._next_batch()
+            if batch:
+                self._send(batch)
+
+    def _send(self, batch):
+        try:
+            res = self._session.put(self.url, timeout=self.timeout,
+                                    data=json.dumps({'username': self.username, 'text': '\n'.join(batch)}))
+            # 4xx/5xx 응답도 연결 오류와 같이 실패로 셈
+            res.raise_for_status()
+            self.sent += len(batch)
+        except requests.RequestException as e:
+            self.failed += len(batch)
+            logger.warning(f"log shipping failed: {e}")
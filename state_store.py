@@ -0,0 +1,90 @@
+# -*- coding:utf-8 -*-
+
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from tasks.transportation_path.cache import LRUCache
+
+
+# 대화 상태(출발지/목적지 후보 등)를 쿠키 대신 서버에 보관
+# STATE_STORE 가 'memory' 이면 프로세스 안 LRU, 'sqlite:<파일 경로>' 이면 여러 worker 가 함께 쓰는 sqlite 파일
+STATE_STORE_TTL = 3600
+STATE_STORE_SIZE = 10000
+STATE_PURGE_INTERVAL = 60
+
+
+class MemoryStateStore:
+    """한 프로세스 안에서만 쓰는 대화 상태 저장소 (LRU + TTL)"""
+
+    def __init__(self, maxsize=STATE_STORE_SIZE, ttl=STATE_STORE_TTL):
+        self._cache = LRUCache(maxsize, ttl)
+
+    def get(self, key):
+        # 호출한 쪽에서 고쳐도 저장된 값이 바뀌지 않도록 복사본을 반환
+        return dict(self._cache.get(key, {}))
+
+    def put(self, key, state):
+        self._cache.put(key, dict(state))
+
+    def delete(self, key):
+        self._cache.pop(key)
+
+    def stats(self):
+        return self._cache.stats()
+
+
+class SQLiteStateStore:
+    """여러 worker 프로세스가 함께 쓰는 sqlite 파일 대화 상태 저장소"""
+
+    def __init__(self, db_path, ttl=STATE_STORE_TTL):
+        self.db_path = db_path
+        self.ttl = ttl
+        self._local = threading.local()
+        self._purged_at = 0
+
+        with self._connect() as conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS conversation_state ('
+                         'state_key TEXT PRIMARY KEY, expires_at REAL, body TEXT)')
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        row = self._connect().execute('SELECT body FROM conversation_state WHERE state_key = ? AND expires_at > ?',
+                                      (key, time.time())).fetchone()
+        return {} if row is None else json.loads(row[0])
+
+    def put(self, key, state):
+        now = time.time()
+
+        with self._connect() as conn:
+            conn.execute('INSERT OR REPLACE INTO conversation_state (state_key, expires_at, body) VALUES (?, ?, ?)',
+                         (key, now + self.ttl, json.dumps(state, ensure_ascii=False)))
+
+            # 만료된 상태는 STATE_PURGE_INTERVAL 마다 한 번씩 정리
+            if now - self._purged_at > STATE_PURGE_INTERVAL:
+                self._purged_at = now
+                conn.execute('DELETE FROM conversation_state WHERE expires_at <= ?', (now,))
+
+    def delete(self, key):
+        with self._connect() as conn:
+            conn.execute('DELETE FROM conversation_state WHERE state_key = ?', (key,))
+
+
+def create_state_store(spec=None):
+    spec = spec or os.environ.get('STATE_STORE', 'memory')
+
+    if spec == 'memory':
+        return MemoryStateStore()
+    if spec.startswith('sqlite:'):
+        return SQLiteStateStore(spec[len('sqlite:'):])
+
+    raise ValueError('Unknown state store: %s' % spec)
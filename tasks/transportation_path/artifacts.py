@@ -0,0 +1,76 @@
+# -*- coding:utf-8 -*-
+import os
+import threading
+import time
+
+
+# static/maps, static/results 에 생성되는 파일들의 보관 한도
+ARTIFACT_DIRS = ('static/maps', 'static/results')
+ARTIFACT_MAX_BYTES = 200 * 1024 * 1024
+ARTIFACT_MAX_AGE = 7 * 24 * 3600
+EVICT_INTERVAL = 60
+
+_last_evicted_at = 0
+_evict_lock = threading.Lock()
+
+
+def touch(path):
+    # 캐시로 다시 쓰인 파일은 오래된 파일로 지워지지 않도록 수정 시각을 갱신
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+
+
+def evict_artifacts(directory, max_bytes=ARTIFACT_MAX_BYTES, max_age=ARTIFACT_MAX_AGE):
+    # max_age 보다 오래된 파일을 지우고, 그래도 max_bytes 를 넘으면 오래된 파일부터 지움
+    now = time.time()
+    files = []
+
+    try:
+        entries = list(os.scandir(directory))
+    except FileNotFoundError:
+        return 0
+
+    removed = 0
+    for entry in entries:
+        try:
+            if not entry.is_file():
+                continue
+            stat = entry.stat()
+        except FileNotFoundError:
+            continue
+
+        if now - stat.st_mtime > max_age:
+            removed += _remove(entry.path)
+        else:
+            files.append((stat.st_mtime, stat.st_size, entry.path))
+
+    total_bytes = sum(size for _, size, _ in files)
+    for mtime, size, path in sorted(files):
+        if total_bytes <= max_bytes:
+            break
+        removed += _remove(path)
+        total_bytes -= size
+
+    return removed
+
+
+def evict_static_artifacts(force=False):
+    # 요청마다 디렉토리를 훑지 않도록 EVICT_INTERVAL 마다 한 번만 실행
+    global _last_evicted_at
+
+    with _evict_lock:
+        if not force and time.time() - _last_evicted_at < EVICT_INTERVAL:
+            return 0
+        _last_evicted_at = time.time()
+
+    return sum(evict_artifacts(directory) for directory in ARTIFACT_DIRS)
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+        return 1
+    except FileNotFoundError:
+        return 0
@@ -0,0 +1,219 @@
+# -*- coding:utf-8 -*-
+import asyncio
+import datetime
+import json
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+
+# local modules
+from . import artifacts, handler, metrics
+from .config import odsay_api_key, seoul_api_key
+
+
+# async 서버(async_server.py)용 handler
+# 외부 API 는 공용 httpx.AsyncClient 로 기다리고, 혼잡도/점수 계산은 CPU_WORKERS 스레드, 그래프는 handler 의 worker 프로세스에서 실행
+# sqlite 저장소/파일 읽고 쓰기는 run_io 로 기본 스레드 풀에서 실행 (이벤트 루프를 막지 않도록)
+# 데이터셋/캐시/저장소 등 전역 상태는 handler.init_handler 로 만든 것을 그대로 사용
+
+CPU_WORKERS = 4
+HTTP_MAX_CONNECTIONS = 100
+
+http_client = None
+cpu_executor = None
+
+
+def get_http_client():
+    # 이벤트 루프 안에서 처음 부를 때 만듦
+    global http_client
+
+    if http_client is None:
+        http_client = httpx.AsyncClient(timeout=handler.UPSTREAM_TIMEOUT,
+                                        limits=httpx.Limits(max_connections=HTTP_MAX_CONNECTIONS,
+                                                            max_keepalive_connections=handler.HTTP_POOL_SIZE))
+    return http_client
+
+
+async def close_http_client():
+    global http_client
+
+    if http_client is not None:
+        await http_client.aclose()
+        http_client = None
+
+
+def get_cpu_executor():
+    global cpu_executor
+
+    if cpu_executor is None:
+        cpu_executor = ThreadPoolExecutor(max_workers=CPU_WORKERS)
+
+    return cpu_executor
+
+
+async def run_cpu(fn, *args):
+    return await asyncio.get_running_loop().run_in_executor(get_cpu_executor(), fn, *args)
+
+
+async def run_io(fn, *args):
+    return await asyncio.get_running_loop().run_in_executor(None, fn, *args)
+
+
+async def get_location_info(desc_location):
+    url = '%s/getLocationInfo?ServiceKey=%s' % (handler.seoul_api_url, seoul_api_key)
+    with metrics.upstream('getLocationInfo'):
+        res = await get_http_client().get(url, params={'stSrch': desc_location})
+        res.raise_for_status()
+
+    return res
+
+
+async def search_locations(output):
+    # 로컬 인덱스에서 먼저 찾고, 없을 때만 getLocationInfo API 콜하기
+    if handler.stop_index is not None:
+        stops = await run_io(handler.stop_index.lookup, output)
+        metrics.cache_result('stop_index', stops is not None)
+        if stops is not None:
+            return stops
+
+    return await run_io(handler.location_info_to_stops, await get_location_info(output), output)
+
+
+async def ask_location(output):
+    stops = await search_locations(output)
+
+    if not stops:
+        return None, 0
+
+    html_path = handler.STOP_PICKER_PAGE % await run_io(handler.save_stop_candidates, stops)
+
+    return html_path, stops
+
+
+async def ask_origin(output):
+    return await ask_location(output)
+
+
+async def ask_destination(output):
+    return await ask_location(output)
+
+
+async def get_path_info(start_loc, end_loc):
+    param = {
+        'apiKey': odsay_api_key,
+        'SX': start_loc[1],
+        'SY': start_loc[2],
+        'EX': end_loc[1],
+        'EY': end_loc[2]
+    }
+    with metrics.upstream('searchPubTransPathR'):
+        res = await get_http_client().get(handler.odsay_api_url + 'searchPubTransPathR', params=param)
+        res.raise_for_status()
+
+    return res
+
+
+async def get_route_candidates(start_loc, end_loc, departure_time):
+    key = handler.route_cache_key(start_loc, end_loc, departure_time)
+    route_list = handler.route_cache.get(key)
+    metrics.cache_result('route_candidates', route_list is not None)
+
+    if route_list is None:
+        res = await get_path_info(start_loc, end_loc)
+        route_list = json.loads(res.text)['result']['path']
+        handler.route_cache.put(key, route_list)
+
+    return route_list
+
+
+async def get_bus_lane_detail(busID):
+    if handler.lane_store is not None:
+        result_dict = await run_io(handler.lane_store.get, busID)
+        metrics.cache_result('bus_lane_store', result_dict is not None)
+        if result_dict is not None:
+            return result_dict
+
+    param = {
+        'apiKey': odsay_api_key,
+        'busID': busID
+    }
+    with metrics.upstream('busLaneDetail'):
+        res = await get_http_client().get(handler.odsay_api_url + 'busLaneDetail', params=param)
+        res.raise_for_status()
+        result_dict = handler.response_to_dict(res, 'json')
+
+    if handler.lane_store is not None and 'result' in result_dict:
+        await run_io(handler.lane_store.put, busID, result_dict)
+
+    return result_dict
+
+
+async def prefetch_bus_lane_details(bus_ids):
+    bus_ids = list(dict.fromkeys(bus_ids))
+    result_dicts = await asyncio.gather(*[get_bus_lane_detail(bus_id) for bus_id in bus_ids])
+
+    return dict(zip(bus_ids, result_dicts))
+
+
+async def search_routes(start_loc, end_loc, top_n=handler.TOP_N_ROUTES, max_lanes_per_path=None,
+                        departure_time=None):
+    if departure_time is None:
+        departure_time = datetime.datetime.fromtimestamp(time.time())
+
+    route_list = await get_route_candidates(start_loc, end_loc, departure_time)
+    scored_routes = await run_cpu(handler.compress_routes, route_list, departure_time, max_lanes_per_path)
+
+    with metrics.STAGE_SECONDS.time(stage='bus_lane_detail'):
+        lane_details = await prefetch_bus_lane_details(handler.route_bus_ids(scored_routes))
+
+    return await run_cpu(handler.score_routes, scored_routes, lane_details, top_n)
+
+
+async def sweep_departure_times(start_loc, end_loc, start_time=None, step_minutes=10, horizon_minutes=180,
+                                max_lanes_per_path=None):
+    # handler.sweep_departure_times 의 async 버전
+    if start_time is None:
+        start_time = datetime.datetime.fromtimestamp(time.time())
+
+    shifts = [datetime.timedelta(minutes=minutes) for minutes in range(0, horizon_minutes + 1, step_minutes)]
+
+    route_list = await get_route_candidates(start_loc, end_loc, start_time)
+    scored_routes = await run_cpu(handler.compress_routes, route_list, start_time, max_lanes_per_path)
+
+    with metrics.STAGE_SECONDS.time(stage='bus_lane_detail'):
+        lane_details = await prefetch_bus_lane_details(handler.route_bus_ids(scored_routes))
+
+    return await run_cpu(handler.score_departure_times, scored_routes, lane_details, start_time, shifts)
+
+
+async def save_route_congestion(route_list):
+    return await run_cpu(handler.save_route_congestion, route_list)
+
+
+async def iter_route_charts(route_list, top_n=3, sort_types=('fastest', 'safetest', 'riskiest')):
+    # 다 그려진 순서대로 (정렬 기준, 이미지 경로) 를 내보냄
+    chart_data_list = [await run_cpu(handler.route_chart_data, route_list, top_n, sort_type) for sort_type in sort_types]
+    await run_io(artifacts.evict_static_artifacts)
+
+    with metrics.STAGE_SECONDS.time(stage='chart_render'):
+        if handler.RENDER_WORKERS <= 1:
+            for sort_type, chart_data in zip(sort_types, chart_data_list):
+                yield sort_type, await run_cpu(handler.render_chart, chart_data)
+            return
+
+        executor = handler.get_render_executor()
+
+        async def render(sort_type, chart_data):
+            # 처음 submit 할 때 worker 프로세스를 띄우므로 submit 도 이벤트 루프 밖에서 함
+            future = await run_io(executor.submit, handler.render_chart, chart_data)
+            return sort_type, await asyncio.wrap_future(future)
+
+        for next_chart in asyncio.as_completed([render(sort_type, chart_data)
+                                                for sort_type, chart_data in zip(sort_types, chart_data_list)]):
+            yield await next_chart
+
+
+async def render_route_charts(route_list, top_n=3, sort_types=('fastest', 'safetest', 'riskiest')):
+    return {sort_type: img_path async for sort_type, img_path in iter_route_charts(route_list, top_n, sort_types)}
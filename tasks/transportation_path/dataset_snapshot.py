@@ -0,0 +1,140 @@
+# -*- coding:utf-8 -*-
+import argparse
+import json
+import struct
+import time
+
+import numpy as np
+
+
+# 스냅샷 파일 구조
+#   MAGIC(4) | version(uint32) | header 길이(uint64) | header(json) | 64byte 단위로 정렬된 배열들
+# 배열은 np.memmap 으로 그대로 매핑하므로 읽을 때 파싱 비용이 거의 없음
+MAGIC = b'TRSF'
+SNAPSHOT_VERSION = 2
+ALIGNMENT = 64
+
+_PREAMBLE = struct.Struct('<4sIQ')
+
+
+def _align(offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def write_snapshot(snapshot_path, arrays, meta):
+    arrays = {name: np.ascontiguousarray(array) for name, array in arrays.items()}
+
+    # header 길이가 offset 에 영향을 주지 않도록 배열 offset 은 0 기준으로 계산
+    array_info = {}
+    offset = 0
+    for name, array in arrays.items():
+        offset = _align(offset)
+        array_info[name] = {'dtype': array.dtype.str, 'shape': list(array.shape), 'offset': offset}
+        offset += array.nbytes
+
+    header = json.dumps({'version': SNAPSHOT_VERSION,
+                         'created_at': time.time(),
+                         'arrays': array_info,
+                         'meta': meta}, ensure_ascii=False).encode('utf-8')
+    data_start = _align(_PREAMBLE.size + len(header))
+
+    with open(snapshot_path, 'wb') as file:
+        file.write(_PREAMBLE.pack(MAGIC, SNAPSHOT_VERSION, len(header)))
+        file.write(header)
+
+        for name, array in arrays.items():
+            file.seek(data_start + array_info[name]['offset'])
+            file.write(array.tobytes())
+
+
+def read_snapshot(snapshot_path):
+    with open(snapshot_path, 'rb') as file:
+        magic, version, header_len = _PREAMBLE.unpack(file.read(_PREAMBLE.size))
+        if magic != MAGIC:
+            raise ValueError('%s is not a dataset snapshot' % snapshot_path)
+        if version != SNAPSHOT_VERSION:
+            raise ValueError('Unsupported dataset snapshot version: %d (expected %d)'
+                             % (version, SNAPSHOT_VERSION))
+        header = json.loads(file.read(header_len).decode('utf-8'))
+
+    data_start = _align(_PREAMBLE.size + header_len)
+    buffer = np.memmap(snapshot_path, dtype=np.uint8, mode='r')
+
+    arrays = {}
+    for name, info in header['arrays'].items():
+        dtype = np.dtype(info['dtype'])
+        count = int(np.prod(info['shape'], dtype=np.int64))
+        start = data_start + info['offset']
+        arrays[name] = buffer[start:start + count * dtype.itemsize].view(dtype).reshape(info['shape'])
+
+    return arrays, header['meta']
+
+
+def write_dataset_snapshot(snapshot_path, bus_ridership_index, subway_congestion,
+                           subway_risk_dict, bus_risk_dict):
+    arrays = {
+        'bus_keys': bus_ridership_index['keys'],
+        'bus_ride': bus_ridership_index['ride'],
+        'bus_alight': bus_ridership_index['alight'],
+        'subway_tensor': subway_congestion['tensor'],
+        'subway_risk_keys': np.array(list(subway_risk_dict.keys()), dtype=np.int64),
+        'subway_risk_values': np.array(list(subway_risk_dict.values()), dtype=np.float64),
+        'bus_risk_keys': np.array(list(bus_risk_dict.keys()), dtype=np.int64),
+        'bus_risk_values': np.array(list(bus_risk_dict.values()), dtype=np.float64),
+    }
+    meta = {
+        'bus_route_nos': sorted(bus_ridership_index['route_codes'], key=bus_ridership_index['route_codes'].get),
+        'subway_station_ids': sorted(subway_congestion['station_index'], key=subway_congestion['station_index'].get),
+        'subway_unknown_index': subway_congestion['unknown_index'],
+    }
+
+    write_snapshot(snapshot_path, arrays, meta)
+
+
+def read_dataset_snapshot(snapshot_path):
+    arrays, meta = read_snapshot(snapshot_path)
+
+    bus_ridership_index = {
+        'route_codes': {route_no: code for code, route_no in enumerate(meta['bus_route_nos'])},
+        'keys': arrays['bus_keys'],
+        'ride': arrays['bus_ride'],
+        'alight': arrays['bus_alight'],
+    }
+
+    subway_congestion = {
+        'tensor': arrays['subway_tensor'],
+        'station_index': {station_id: i for i, station_id in enumerate(meta['subway_station_ids'])},
+        'unknown_index': meta['subway_unknown_index'],
+    }
+
+    subway_risk_dict = dict(zip(arrays['subway_risk_keys'].tolist(), arrays['subway_risk_values'].tolist()))
+    bus_risk_dict = dict(zip(arrays['bus_risk_keys'].tolist(), arrays['bus_risk_values'].tolist()))
+
+    return bus_ridership_index, subway_congestion, subway_risk_dict, bus_risk_dict
+
+
+if __name__ == '__main__':
+    # python -m tasks.transportation_path.dataset_snapshot build
+    # python -m tasks.transportation_path.dataset_snapshot bench
+    from . import handler
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('command', choices=['build', 'bench'])
+    parser.add_argument('--data_dir', default=handler.DATA_DIR)
+    args = parser.parse_args()
+
+    snapshot_path = args.data_dir + handler.DATASET_SNAPSHOT_FILE
+
+    start = time.perf_counter()
+    datasets = handler.load_raw_datasets(args.data_dir)
+    raw_sec = time.perf_counter() - start
+
+    if args.command == 'build':
+        write_dataset_snapshot(snapshot_path, *datasets)
+        print('snapshot -> %s (raw load %.3fs)' % (snapshot_path, raw_sec))
+    else:
+        start = time.perf_counter()
+        read_dataset_snapshot(snapshot_path)
+        snapshot_sec = time.perf_counter() - start
+        print('cold start: raw %.3fs -> snapshot %.3fs (x%.1f)'
+              % (raw_sec, snapshot_sec, raw_sec / max(snapshot_sec, 1e-9)))
@@ -1,98 +1,257 @@
 # -*- coding:utf-8 -*-
 import datetime
-import folium
-import itertools
+import hashlib
 import json
 import matplotlib
+import multiprocessing
+import os
 import pickle
 import requests
 import time
 import warnings
 import xmltodict
 
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+
 import matplotlib.font_manager as fm
 import matplotlib.image as mpimg
 import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
 
-from folium.features import DivIcon
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
 from matplotlib.offsetbox import OffsetImage, AnnotationBbox
 
 # local modules
 from .config import odsay_api_key, seoul_api_key
-
-
-seoul_api_url = 'http://ws.bus.go.kr/api/rest/pathinfo'
-odsay_api_url = 'https://api.odsay.com/v1/api/'
+from .dataset_snapshot import read_dataset_snapshot
+from . import artifacts, metrics, risk_scoring
+from .cache import LRUCache
+from .lane_store import LaneDetailStore
+from .load_curves import BusLoadCurves
+from .route_model import BUS, SUBWAY, WALK, Segment, StationColumns
+from .route_ranking import select_top_routes
+from .stop_search import load_stop_search_index
+
+
+# 부하 테스트 등에서 대체 서버를 쓸 수 있도록 환경변수로 바꿀 수 있음 (loadtest/stub_server.py)
+seoul_api_url = os.environ.get('SEOUL_API_URL', 'http://ws.bus.go.kr/api/rest/pathinfo')
+odsay_api_url = os.environ.get('ODSAY_API_URL', 'https://api.odsay.com/v1/api/')
+
+DATA_DIR = os.environ.get('TRANSAFER_DATA_DIR', 'tasks/transportation_path/dataset/')
+# 0 이면 외부 API 응답을 대신하는 캐시/저장소(후보 경로 캐시, busLaneDetail 저장소와 인원 수 곡선, 정류장 검색 인덱스)를 쓰지 않음
+# 부하 테스트에서 모든 요청이 외부 API(stub 서버)까지 가도록 할 때 사용
+UPSTREAM_CACHES = os.environ.get('TRANSAFER_UPSTREAM_CACHES', '1') != '0'
+BUS_PREP_FILE = 'getout_bus_prep_m_df(202005)_min.csv'
+DATASET_SNAPSHOT_FILE = 'dataset_snapshot.bin'
+LANE_STORE_FILE = 'bus_lane_detail.sqlite3'
+LANE_SNAPSHOT_FILE = 'bus_lane_snapshot.json.gz'
+LOAD_CURVE_FILE = 'bus_load_curves.bin'  # python -m tasks.transportation_path.load_curves build
+STOP_LIST_PATH = 'entity/stop_name_df.csv'
+STOP_LOCATION_FILE = 'stop_queries.sqlite3'
+
+# 외부 API 호출 설정
+# UPSTREAM_WORKERS 가 1 이하이면 busLaneDetail 을 순서대로 호출함
+HTTP_POOL_SIZE = 16
+UPSTREAM_WORKERS = 8
+UPSTREAM_TIMEOUT = 10
+
+# 정렬 기준(빠른/안전한/위험한)별로 보여줄 경로 수
+TOP_N_ROUTES = 3
+
+# searchPubTransPathR 후보 경로 캐시
+# 좌표는 ROUTE_CACHE_GRID_DEGREE(약 100m) 격자로, 출발 시각은 ROUTE_CACHE_TIME_BUCKET_MINUTES 단위로 묶음
+ROUTE_CACHE_SIZE = 2048
+ROUTE_CACHE_TTL = 6 * 3600
+ROUTE_CACHE_GRID_DEGREE = 0.001
+ROUTE_CACHE_TIME_BUCKET_MINUTES = 60
+
+# 그래프를 동시에 그릴 worker 프로세스 수 (1 이하이면 요청 프로세스에서 그림)
+RENDER_WORKERS = 3
+
+STOP_PICKER_PAGE = 'static/stop_picker.html?key=%s'
+STOP_CANDIDATES_PATH = 'static/maps/stops_%s.json'
+ROUTE_CONGESTION_PATH = 'static/maps/routes_%s.json'
+
+CHART_TITLES = {'fastest': '최단 거리 환승 경로', 'safetest': '안전한 환승 경로', 'riskiest': '위험한 환승 경로'}
+
+# 지하철 혼잡도 배열의 축 순서
+# 'NaN' 역으로 대체할 때 2호선 내선/외선은 하선/상선 값을 사용
+SUBWAY_DAYS = ('평일', '주말')
+SUBWAY_WAYS = ('상선', '하선', '내선', '외선')
+SUBWAY_FALLBACK_WAYS = {'상선': '상선', '하선': '하선', '내선': '하선', '외선': '상선'}
 
 BUS_SPEED_MEAN = 18.7 * 1000  # 미터 https://www.index.go.kr/potal/stts/idxMain/selectPoSttsIdxSearch.do?idx_cd=4081&stts_cd=408102
 
-getout_bus_prep_m_df = None
-subway_congestion_dict = None
+bus_ridership_index = None
+subway_congestion = None
 subway_risk_dict = None
 bus_risk_dict = None
+subway_risk_lut = None
+bus_risk_lut = None
 mask_imgs = None
+lane_store = None
+bus_load_curves = None
+stop_index = None
+upstream_executor = None
+render_executor = None
+route_cache = LRUCache(ROUTE_CACHE_SIZE if UPSTREAM_CACHES else 0, ROUTE_CACHE_TTL)
 
 matplotlib.use('Agg')
 
 
-def init_handler(data_dir='tasks/transportation_path/dataset/'):
-    global getout_bus_prep_m_df, subway_congestion_dict, subway_risk_dict, bus_risk_dict, mask_imgs
+def create_http_session(pool_size=HTTP_POOL_SIZE):
+    # keep-alive 연결을 재사용하기 위한 세션
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
 
-    plt.rc('font', family='AppleGothic')
+    return session
 
-    if not getout_bus_prep_m_df:
-        # 버스 노선/정류소별 일별/시간대별 데이터 가져오기
-        getout_bus_prep_file = data_dir + "getout_bus_prep_m_df(202005)_min.csv"
-        getout_bus_prep_m_df = pd.read_csv(getout_bus_prep_file)
-        getout_bus_prep_m_df = getout_bus_prep_m_df.astype({'TIME': 'int',
-                                                            'BUS_ROUTE_NO': 'str'})
 
-    if not subway_congestion_dict:
-        with open(data_dir + 'station_congestion_2015.pkl', 'rb') as file:
-            subway_congestion_df = pickle.load(file)
+http_session = create_http_session()
 
-        subway_congestion_dict = subway_congestion_df.set_index(
-            ['사용일', '역번', '구분']).to_dict('index')
 
-        with open(data_dir + 'station_congestion_2015_est_5_8.pkl', 'rb') as file:
-            subway_congestion_58_df = pickle.load(file)
+def load_bus_ridership_index(data_dir):
+    # 버스 노선/정류소별 일별/시간대별 데이터 가져오기
+    getout_bus_prep_file = data_dir + BUS_PREP_FILE
+    getout_bus_prep_m_df = pd.read_csv(getout_bus_prep_file)
+    getout_bus_prep_m_df = getout_bus_prep_m_df.astype({'TIME': 'int',
+                                                        'BUS_ROUTE_NO': 'str'})
 
-        subway_congestion_dict.update(subway_congestion_58_df.set_index(
-            ['사용일', '역번', '구분']).to_dict('index'))
+    # 요청마다 DataFrame 을 필터링하지 않도록 (노선, 주말, 정류소, 시간) 인덱스를 미리 만들어 둠
+    return build_bus_ridership_index(getout_bus_prep_m_df)
 
-        df = pd.read_csv(data_dir + '서울특별시 노선별 지하철역 정보(신규)_fix.csv')
-        subway_code = {}
 
-        for i, row in df.iterrows():
-            subway_code[row['전철역코드']] = row['외부코드']
+def build_subway_congestion(subway_congestion_df):
+    # [평일/주말, 역, 방향, 시간] 4차원 배열로 지하철 혼잡도를 만듦
+    # 정보가 없는 역/방향/시간은 기존처럼 'NaN' 역의 상선/하선 값으로 미리 채워둠
+    df = subway_congestion_df[subway_congestion_df['사용일'].isin(SUBWAY_DAYS) &
+                              subway_congestion_df['구분'].isin(SUBWAY_WAYS)]
+    df = df.drop_duplicates(['사용일', '역번', '구분'], keep='last')
 
-        subway_congestion_dict = {
-            (key[0], subway_code.get(str(key[1]), str(key[1])), key[2]):value
-            for key, value in subway_congestion_dict.items()
-        }
+    station_ids = sorted(df['역번'].unique())
+    station_index = {station_id: i for i, station_id in enumerate(station_ids)}
+    unknown_index = len(station_ids)  # 목록에 없는 역은 마지막 칸 (대체값만 있음)
 
-    if not subway_risk_dict:
-        with open(data_dir + 'subway_risk_dict.pkl', 'rb') as file:
-            subway_risk_dict = pickle.load(file)
+    hour_columns = ['%02d:00' % hour for hour in range(24)]
+    values = df.reindex(columns=hour_columns).apply(pd.to_numeric, errors='coerce').to_numpy(np.float64)
+
+    tensor = np.full((len(SUBWAY_DAYS), len(station_ids) + 1, len(SUBWAY_WAYS), 24), np.nan)
+    tensor[df['사용일'].map(SUBWAY_DAYS.index).to_numpy(),
+           df['역번'].map(station_index).to_numpy(),
+           df['구분'].map(SUBWAY_WAYS.index).to_numpy()] = values
+
+    if 'NaN' in station_index:
+        fallback_ways = [SUBWAY_WAYS.index(SUBWAY_FALLBACK_WAYS[way]) for way in SUBWAY_WAYS]
+        fallback = tensor[:, station_index['NaN']][:, fallback_ways]
+        tensor = np.where(np.isnan(tensor), fallback[:, None], tensor)
+
+    # 대체값도 없으면 운행하지 않는 시간으로 보고 0
+    tensor = np.nan_to_num(tensor, nan=0.0)
+
+    return {
+        'tensor': tensor,
+        'station_index': station_index,
+        'unknown_index': unknown_index,
+    }
+
+
+def load_subway_congestion(data_dir):
+    with open(data_dir + 'station_congestion_2015.pkl', 'rb') as file:
+        subway_congestion_df = pickle.load(file)
+
+    with open(data_dir + 'station_congestion_2015_est_5_8.pkl', 'rb') as file:
+        subway_congestion_58_df = pickle.load(file)
+
+    df = pd.read_csv(data_dir + '서울특별시 노선별 지하철역 정보(신규)_fix.csv')
+    subway_code = dict(zip(df['전철역코드'], df['외부코드']))
 
-        subway_risk_dict = {key: value/key
-                            for key, value in subway_risk_dict.items()}
+    # 5~8호선 추정치가 뒤에 오도록 합쳐서 같은 키는 나중 값이 쓰이게 함
+    subway_congestion_df = pd.concat([subway_congestion_df, subway_congestion_58_df], ignore_index=True)
+    subway_congestion_df['역번'] = [subway_code.get(str(station_id), str(station_id))
+                                    for station_id in subway_congestion_df['역번']]
+
+    return build_subway_congestion(subway_congestion_df)
+
+
+def load_risk_dict(risk_file):
+    with open(risk_file, 'rb') as file:
+        risk_dict = pickle.load(file)
+
+    return {key: value/key for key, value in risk_dict.items()}
+
+
+def load_raw_datasets(data_dir):
+    return (load_bus_ridership_index(data_dir),
+            load_subway_congestion(data_dir),
+            load_risk_dict(data_dir + 'subway_risk_dict.pkl'),
+            load_risk_dict(data_dir + 'bus_risk_dict.pkl'))
+
+
+def load_mask_imgs():
+    return {
+        'safe': plt.imread('static/img/mask-safe.png'),
+        'normal': plt.imread('static/img/mask-normal.png'),
+        'unsafe': plt.imread('static/img/mask-unsafe.png'),
+        'risky': plt.imread('static/img/mask-risky.png'),
+    }
+
+
+def init_handler(data_dir=DATA_DIR):
+    global bus_ridership_index, subway_congestion, subway_risk_dict, bus_risk_dict, subway_risk_lut, bus_risk_lut
+    global mask_imgs, lane_store, stop_index, bus_load_curves
+
+    plt.rc('font', family='AppleGothic')
+
+    snapshot_path = data_dir + DATASET_SNAPSHOT_FILE
+
+    if bus_ridership_index is None and os.path.exists(snapshot_path):
+        # 미리 만들어둔 스냅샷이 있으면 csv/pickle 대신 그대로 매핑해서 사용
+        try:
+            bus_ridership_index, subway_congestion, subway_risk_dict, bus_risk_dict = \
+                read_dataset_snapshot(snapshot_path)
+        except ValueError as e:
+            warnings.warn('%s, loading raw datasets instead' % e)
+
+    if bus_ridership_index is None:
+        bus_ridership_index = load_bus_ridership_index(data_dir)
+
+    if subway_congestion is None:
+        subway_congestion = load_subway_congestion(data_dir)
+
+    if not subway_risk_dict:
+        subway_risk_dict = load_risk_dict(data_dir + 'subway_risk_dict.pkl')
 
     if not bus_risk_dict:
-        with open(data_dir + 'bus_risk_dict.pkl', 'rb') as file:
-            bus_risk_dict = pickle.load(file)
+        bus_risk_dict = load_risk_dict(data_dir + 'bus_risk_dict.pkl')
 
-        bus_risk_dict = {key: value/key for key, value in bus_risk_dict.items()}
+    # 인원 수로 위험도를 바로 찾을 수 있는 배열
+    subway_risk_lut = build_risk_lut(subway_risk_dict)
+    bus_risk_lut = build_risk_lut(bus_risk_dict)
 
     if not mask_imgs:
-        mask_imgs = {
-            'safe': plt.imread('static/img/mask-safe.png'),
-            'normal': plt.imread('static/img/mask-normal.png'),
-            'unsafe': plt.imread('static/img/mask-unsafe.png'),
-            'risky': plt.imread('static/img/mask-risky.png'),
-        }
+        mask_imgs = load_mask_imgs()
+
+    if lane_store is None and UPSTREAM_CACHES:
+        # 버스 노선 상세정보는 프로세스끼리 공유하는 파일 저장소에 보관하고, 스냅샷이 있으면 미리 채워둠
+        lane_store = LaneDetailStore(data_dir + LANE_STORE_FILE)
+
+        if os.path.exists(data_dir + LANE_SNAPSHOT_FILE):
+            lane_store.load_snapshot(data_dir + LANE_SNAPSHOT_FILE)
+
+    if bus_load_curves is None and UPSTREAM_CACHES and os.path.exists(data_dir + LOAD_CURVE_FILE):
+        # 미리 계산한 노선별 정류장/시간별 승하차 인원이 있으면 요청 때는 busLaneDetail 없이 누적만 함
+        try:
+            bus_load_curves = BusLoadCurves.from_file(data_dir + LOAD_CURVE_FILE)
+        except ValueError as e:
+            warnings.warn('%s, computing bus occupancy per request instead' % e)
+
+    if stop_index is None and UPSTREAM_CACHES:
+        # 정류장 이름 검색용 로컬 인덱스 (원격 API 로 찾은 검색어별 결과는 STOP_LOCATION_FILE 에 쌓임)
+        stop_index = load_stop_search_index(STOP_LIST_PATH, data_dir + STOP_LOCATION_FILE)
 
     return None
 
@@ -100,7 +259,9 @@ def init_handler(data_dir='tasks/transportation_path/dataset/'):
 def get_location_info(desc_location):
     param = {'stSrch': desc_location}
     url = '%s/getLocationInfo?ServiceKey=%s' % (seoul_api_url, seoul_api_key)
-    res = requests.get(url, params=param)
+    with metrics.upstream('getLocationInfo'):
+        res = http_session.get(url, params=param, timeout=UPSTREAM_TIMEOUT)
+        res.raise_for_status()
 
     return res
 
@@ -112,66 +273,95 @@ def response_to_dict(res, type='xml'):
         return json.loads(res.text)
 
 
-def draw_locations_on_map(item_list):
-    Xs, Ys = zip(*[(float(item['gpsX']), float(item['gpsY'])) for item in item_list])
-    mean_loc = (Ys[0], Xs[0])
-    map_osm = folium.Map(location=mean_loc, zoom_start=16)
+def save_json_artifact(path_format, data, stage):
+    # 같은 내용은 같은 파일을 쓰도록 내용의 hash 를 이름으로 사용
+    body = json.dumps(data, ensure_ascii=False, separators=(',', ':'))
+    key = hashlib.sha1(body.encode('utf-8')).hexdigest()[:20]
+    json_path = path_format % key
 
-    for i, item in enumerate(item_list):
-        loc = (item['gpsY'], item['gpsX'])
+    if os.path.exists(json_path):
+        artifacts.touch(json_path)
+    else:
+        with metrics.STAGE_SECONDS.time(stage=stage):
+            os.makedirs(os.path.dirname(json_path), exist_ok=True)
+            tmp_path = '%s.%d.tmp' % (json_path, os.getpid())
+            with open(tmp_path, 'w', encoding='utf-8') as file:
+                file.write(body)
+            os.replace(tmp_path, json_path)
 
-        marker = folium.Marker(loc,
-                               popup='%d. %s' % (i+1, item['poiNm']),
-                               icon=DivIcon(
-                                   icon_size=(50,36),
-                                   icon_anchor=(25,18),
-                                   html='<div style="font-size: 18pt; color: white; text-align: center;">%d</div>' % (i+1)))
-                              #icon=folium.Icon(color='red'))
+    artifacts.evict_static_artifacts()
 
-        marker.add_to(map_osm)
-        map_osm.add_child(folium.CircleMarker(loc, fill=True, radius=15, color='crimson', fill_opacity=0.5))
+    return key
 
-    return map_osm
 
+def load_json_artifact(path_format, key):
+    # key 는 hex 문자열만 허용
+    if not key.isalnum():
+        return None
 
-def ask_origin(output):
-    res = get_location_info(output)
+    try:
+        with open(path_format % key, encoding='utf-8') as file:
+            return file.read()
+    except FileNotFoundError:
+        return None
+
+
+def save_stop_candidates(stops):
+    return save_json_artifact(STOP_CANDIDATES_PATH, {'stops': [list(stop) for stop in stops]}, 'map_save')
+
+
+def load_stop_candidates(key):
+    return load_json_artifact(STOP_CANDIDATES_PATH, key)
+
+
+def search_locations(output):
+    # 로컬 인덱스에서 먼저 찾고, 없을 때만 getLocationInfo API 콜하기
+    if stop_index is not None:
+        stops = stop_index.lookup(output)
+        metrics.cache_result('stop_index', stops is not None)
+        if stops is not None:
+            return stops
+
+    return location_info_to_stops(get_location_info(output), output)
+
+
+def location_info_to_stops(res, query=None):
     res_dict = response_to_dict(res)
 
     if res_dict['ServiceResult']['msgHeader']['headerCd'] == '4': # 결과 없음
-        return None, 0
+        return []
 
     item_list = res_dict['ServiceResult']['msgBody']['itemList']
 
     if not isinstance(item_list, list):
         item_list = [item_list]
 
-    map_osm = draw_locations_on_map(item_list)
+    stops = [(item['poiNm'], item['gpsX'], item['gpsY']) for item in item_list]
 
-    html_path = 'static/maps/map_%s.html' % (str(time.time()))
-    map_osm.save(html_path)
+    if stop_index is not None and query is not None:
+        stop_index.learn(query, stops)
 
-    return html_path, [(item['poiNm'], item['gpsX'], item['gpsY']) for item in item_list]
+    return stops
 
 
-def ask_destination(output):
-    res = get_location_info(output)
-    res_dict = response_to_dict(res)
+def ask_location(output):
+    stops = search_locations(output)
 
-    if res_dict['ServiceResult']['msgHeader']['headerCd'] == '4': # 결과 없음
+    if not stops:
         return None, 0
 
-    item_list = res_dict['ServiceResult']['msgBody']['itemList']
+    # 지도는 하나의 정적 페이지에서 후보 정류장 json 을 받아 그림
+    html_path = STOP_PICKER_PAGE % save_stop_candidates(stops)
+
+    return html_path, stops
 
-    if not isinstance(item_list, list):
-        item_list = [item_list]
 
-    map_osm = draw_locations_on_map(item_list)
+def ask_origin(output):
+    return ask_location(output)
 
-    html_path = 'static/maps/map_%s.html' % (str(time.time()))
-    map_osm.save(html_path)
 
-    return html_path, [(item['poiNm'], item['gpsX'], item['gpsY']) for item in item_list]
+def ask_destination(output):
+    return ask_location(output)
 
 
 def get_path_info(start_loc, end_loc):
@@ -184,17 +374,58 @@ def get_path_info(start_loc, end_loc):
         'EX': end_loc[1],
         'EY': end_loc[2]
     }
-    res = requests.get(odsay_api_url + 'searchPubTransPathR', params=param)
+    with metrics.upstream('searchPubTransPathR'):
+        res = http_session.get(odsay_api_url + 'searchPubTransPathR', params=param, timeout=UPSTREAM_TIMEOUT)
+        res.raise_for_status()
 
     return res
 
 
-def search_routes(start_loc, end_loc):
-    res = get_path_info(start_loc, end_loc)
-    res_dict = json.loads(res.text)
-    route_list = res_dict['result']['path']
+def route_cache_key(start_loc, end_loc, departure_time):
+    # 좌표는 격자 단위로, 출발 시각은 평일/주말 및 시간대 단위로 묶음
+    def snap(value):
+        return int(round(float(value) / ROUTE_CACHE_GRID_DEGREE))
+
+    time_bucket = (departure_time.hour * 60 + departure_time.minute) // ROUTE_CACHE_TIME_BUCKET_MINUTES
+
+    return (snap(start_loc[1]), snap(start_loc[2]), snap(end_loc[1]), snap(end_loc[2]),
+            departure_time.weekday() >= 5, time_bucket)
+
+
+def get_route_candidates(start_loc, end_loc, departure_time):
+    # 자주 찾는 출발지/목적지는 searchPubTransPathR 을 다시 부르지 않고 캐시된 후보 경로를 사용
+    key = route_cache_key(start_loc, end_loc, departure_time)
+    route_list = route_cache.get(key)
+    metrics.cache_result('route_candidates', route_list is not None)
+
+    if route_list is None:
+        res = get_path_info(start_loc, end_loc)
+        res_dict = json.loads(res.text)
+        route_list = res_dict['result']['path']
+        route_cache.put(key, route_list)
+
+    return route_list
+
+
+def search_routes(start_loc, end_loc, max_workers=None, top_n=TOP_N_ROUTES, max_lanes_per_path=None,
+                  departure_time=None):
+    if departure_time is None:
+        departure_time = datetime.datetime.fromtimestamp(time.time())
+    #datetime.datetime.strptime('2020-09-02 14:55:00', '%Y-%m-%d %H:%M:%S')
+
+    # 후보 경로만 캐시하고, 시간에 따라 달라지는 혼잡도 점수는 매번 다시 계산
+    route_list = get_route_candidates(start_loc, end_loc, departure_time)
+    scored_routes = compress_routes(route_list, departure_time, max_lanes_per_path)
+
+    # 검색에 필요한 busLaneDetail 을 한꺼번에 병렬로 받아둠
+    with metrics.STAGE_SECONDS.time(stage='bus_lane_detail'):
+        lane_details = prefetch_bus_lane_details(route_bus_ids(scored_routes), max_workers)
+
+    return score_routes(scored_routes, lane_details, top_n)
 
-    compressed_route_list = []
+
+def compress_routes(route_list, departure_time, max_lanes_per_path=None):
+    scored_routes = []
 
     for route in route_list:
         compressed_route = {
@@ -205,119 +436,367 @@ def search_routes(start_loc, end_loc):
             'map_object': route['info']['mapObj'],
         }
 
-        predicted_time = datetime.datetime.fromtimestamp(time.time())
-        #datetime.datetime.strptime('2020-09-02 14:55:00', '%Y-%m-%d %H:%M:%S')
-
+        predicted_time = departure_time
         path_list = []
 
         for path in route['subPath']:
             path, predicted_time = compress_path(path, predicted_time)
             if path:
-                path_list.append(path)
+                # 노선이 지나치게 많은 구간은 앞쪽 노선들만 사용
+                path_list.append(path[:max_lanes_per_path])
 
-        for paths in itertools.product(*path_list):
-            compressed_route_list.append(compressed_route.copy())
-            compressed_route_list[-1]['path_list'] = paths
+        scored_routes.append({'route': compressed_route, 'segments': path_list})
+
+    return scored_routes
 
-    bus_info_cache = {}
 
-    for route in compressed_route_list:
-        for path in route['path_list']:
-            if path['type'] == '버스':
-                attach_congestion_count_at_bus(path, bus_info_cache)
-            elif path['type'] == '지하철':
-                attach_congestion_count_at_subway(path)
-
-    result = []
-    for i, route in enumerate(compressed_route_list):
-        count = 0
-        for path in route['path_list']:
-            if path['type'] == '도보':
-                continue
+def route_bus_ids(scored_routes):
+    # 인원 수 곡선이 있는 노선은 busLaneDetail 이 필요 없음
+    return [path.bus_id
+            for scored_route in scored_routes
+            for paths in scored_route['segments']
+            for path in paths
+            if path.type == BUS and (bus_load_curves is None or path.bus_id not in bus_load_curves)]
+
 
-            for station in path['stations']:
-                if 'predicted_congestion' not in station:
-                    count += 1
-        if count == 0:
-            result.append(route)
-    compressed_route_list = result
-    #print(result)
+def score_routes(scored_routes, lane_details, top_n=TOP_N_ROUTES):
+    # 외부 API 호출 없이 CPU 만 쓰는 부분 (혼잡도 계산, 점수 계산, 정렬)
+    # 모든 조합을 만들지 않고, 검색에 나온 구간/노선의 혼잡도를 한 번에 계산
+    with metrics.STAGE_SECONDS.time(stage='congestion'):
+        attach_congestion_counts([path
+                                  for scored_route in scored_routes
+                                  for paths in scored_route['segments']
+                                  for path in paths],
+                                 {}, lane_details)
 
-    for i, route in enumerate(compressed_route_list):
-        route['risk_score'] = check_risk_score_per_route(route)
-        route['mean_risk'] = np.mean([station['predicted_risk']
-                                       for path in route['path_list']
-                                       for station in path.get('stations', [])])
+    for scored_route in scored_routes:
+        for i, paths in enumerate(scored_route['segments']):
+            # 혼잡도 정보가 없는 정류장이 있는 노선은 제외
+            scored_route['segments'][i] = [path for path in paths if path.has_congestion()]
+
+    # 검색에 나온 모든 구간/노선의 점수를 한 번에 계산
+    with metrics.STAGE_SECONDS.time(stage='risk_scoring'):
+        risk_scores = iter(check_risk_score_per_paths([path
+                                                       for scored_route in scored_routes
+                                                       for paths in scored_route['segments']
+                                                       for path in paths]))
 
-    return compressed_route_list
+        for scored_route in scored_routes:
+            scored_route['segments'] = [[score_path(path, next(risk_scores)) for path in paths]
+                                        for paths in scored_route['segments']]
 
+    with metrics.STAGE_SECONDS.time(stage='ranking'):
+        return select_top_routes(scored_routes, top_n)
 
-def visualization_routes(route_list, top_n=3, sort_type='safetest'):
-    fig, ax = plt.subplots(top_n, 1, figsize=(10, top_n*3.5+1))
 
-    if sort_type == 'fastest':
-        title = '최단 거리 환승 경로'
-    elif sort_type == 'safetest':
-        title = '안전한 환승 경로'
+def sweep_departure_times(start_loc, end_loc, start_time=None, step_minutes=10, horizon_minutes=180,
+                          max_workers=None, max_lanes_per_path=None):
+    # start_time 부터 step_minutes 간격으로 horizon_minutes 까지 출발했을 때의 위험 점수 곡선과 가장 안전한 출발 시각
+    if start_time is None:
+        start_time = datetime.datetime.fromtimestamp(time.time())
+
+    shifts = [datetime.timedelta(minutes=minutes) for minutes in range(0, horizon_minutes + 1, step_minutes)]
+
+    # 후보 경로/busLaneDetail 은 한 번만 가져오고, 출발 시각만 바꿔가며 평가
+    route_list = get_route_candidates(start_loc, end_loc, start_time)
+    scored_routes = compress_routes(route_list, start_time, max_lanes_per_path)
+
+    with metrics.STAGE_SECONDS.time(stage='bus_lane_detail'):
+        lane_details = prefetch_bus_lane_details(route_bus_ids(scored_routes), max_workers)
+
+    return score_departure_times(scored_routes, lane_details, start_time, shifts)
+
+
+def score_departure_times(scored_routes, lane_details, start_time, shifts):
+    """
+    compress_routes 결과를 출발 시각별로 평가해서 시각마다 가장 안전한 경로를 찾음 (select_top_routes 의 safetest 1등과 같은 기준)
+    모든 출발 시각의 혼잡도/점수는 시각 축을 더한 배열로 한 번에 계산
+    """
+    paths = [path
+             for scored_route in scored_routes
+             for paths in scored_route['segments']
+             for path in paths if path.station_num]
+    path_index = {id(path): i for i, path in enumerate(paths)}
+    lengths = np.array([path.station_num for path in paths], dtype=np.int64)
+    n_times = len(shifts)
+
+    with metrics.STAGE_SECONDS.time(stage='congestion'):
+        congestions, risks = congestion_grid(paths, shifts, lane_details)
+
+    with metrics.STAGE_SECONDS.time(stage='risk_scoring'):
+        if paths:
+            # 출발 시각별 구간들을 하나로 이어붙여서 점수를 한 번에 계산
+            ongoing_times = np.concatenate([path.columns.ongoing_seconds() for path in paths])
+            scores = risk_scoring.score_paths(np.tile(ongoing_times, n_times), congestions.ravel(), risks.ravel(),
+                                              np.tile(lengths, n_times)).reshape(n_times, len(paths))
+
+            starts = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+            risk_sums = np.add.reduceat(risks, starts, axis=1)
+
+            # 혼잡도 정보가 없는 정류장이 있는 노선은 제외
+            scores[np.add.reduceat(np.isnan(congestions), starts, axis=1) > 0] = np.inf
+
+    with metrics.STAGE_SECONDS.time(stage='ranking'):
+        # 경로 점수는 구간 점수의 합이므로, 구간마다 (점수, 위험도 합) 이 가장 작은 노선을 고르면 됨
+        route_scores = np.zeros((len(scored_routes), n_times))
+        route_mean_risks = np.zeros((len(scored_routes), n_times))
+
+        for route_idx, scored_route in enumerate(scored_routes):
+            risk_sum = np.zeros(n_times)
+
+            for segment in scored_route['segments']:
+                idx = [path_index[id(path)] for path in segment if id(path) in path_index]
+                if not idx:
+                    continue  # 도보 (0점)
+
+                best = scores[:, idx].min(axis=1)
+                route_scores[route_idx] += best
+                risk_sum += np.where(scores[:, idx] == best[:, None], risk_sums[:, idx], np.inf).min(axis=1)
+
+            station_num = sum(segment[0].station_num for segment in scored_route['segments'] if segment)
+            route_mean_risks[route_idx] = risk_sum / station_num if station_num else 0.0
+
+        route_mean_risks[np.isinf(route_scores)] = np.inf
+
+        # 출발 시각마다 (점수, 평균 위험도, 경로 순서) 가 가장 작은 경로
+        best_routes = np.lexsort((route_mean_risks.T, route_scores.T))[:, 0] if len(scored_routes) else []
+
+    curve = []
+    for time_idx, shift in enumerate(shifts):
+        route_idx = int(best_routes[time_idx]) if len(scored_routes) else -1
+        found = route_idx >= 0 and np.isfinite(route_scores[route_idx, time_idx])
+
+        curve.append({
+            'departure_time': start_time + shift,
+            'risk_score': float(route_scores[route_idx, time_idx]) if found else None,
+            'mean_risk': float(route_mean_risks[route_idx, time_idx]) if found else None,
+            'route': scored_routes[route_idx]['route'] if found else None,
+        })
+
+    candidates = [point for point in curve if point['route'] is not None]
+    best = min(candidates, key=lambda point: (point['risk_score'], point['mean_risk'])) if candidates else None
+
+    return {'curve': curve, 'best': best}
+
+
+def score_path(path, risk_score):
+    return {
+        'path': path,
+        'risk_score': risk_score,
+        'risk_sum': path.risk_sum(),
+        'station_num': path.station_num,
+    }
+
+
+def route_chart_data(route_list, top_n=3, sort_type='safetest'):
+    # 그래프를 그리는 데 필요한 값만 뽑아냄 (프로세스 간 전달 및 캐시 키로 사용)
+    title = CHART_TITLES[sort_type]
+
+    if sort_type == 'safetest':
         route_list = sorted(route_list,
                             key=lambda x:(x['risk_score'], x['mean_risk']))
     elif sort_type == 'riskiest':
-        title = '위험한 환승 경로'
         route_list = sorted(route_list,
                             key=lambda x:(x['risk_score'], x['mean_risk']), reverse=True)
 
-    fig.suptitle(title, y=1.03, fontsize=18)
+    rows = []
 
-    for i, route in enumerate(route_list[:top_n]):
+    for route in route_list[:top_n]:
         congestions = []
         x_names = []
         x_types = []
 
         for path in route['path_list']:
             # 도보의 경우
-            if path['type'] == '도보':
+            if path.type == WALK:
                 congestions.append(0)
-                x_names.append('도보 %d분' % (path['duration']))
+                x_names.append('도보 %d분' % (path.duration))
                 x_types.append((0, 0))
 
-            # 버스의 경우
-            elif path['type'] == '버스':
-                x_names.extend([s['station_name'] for s in path['stations']])
+            # 버스/지하철의 경우
+            elif path.type in (BUS, SUBWAY):
+                x_names.extend(path.columns.station_names)
 
                 # 역 별 시간 계산
-                x_types.append((1, 0, '%s 버스 탑승' % path['bus_no']))
-                x_types.extend([(1, station['ongoing_time'].seconds/60) for i, station in enumerate(path['stations'][1:], 1)])
+                if path.type == BUS:
+                    x_types.append((1, 0, '%s 버스 탑승' % path.bus_no))
+                else:
+                    x_types.append((1, 0, '%s호선 탑승' % (path.subway_id)))
+                x_types.extend([(1, seconds/60) for seconds in path.columns.ongoing_seconds()[1:].tolist()])
 
                 # 혼잡도
-                congestions.extend([s['predicted_congestion'] for s in path['stations']])
+                congestions.extend(path.congestions.tolist())
+
+        rows.append({
+            'congestions': [float(congestion) for congestion in congestions],
+            'station_names': x_names,
+            'station_types': x_types,
+            'total_time': route['total_time'],
+            'mean_risk': float(route['mean_risk']),
+            'risk_score': float(route['risk_score']),
+        })
+
+    return {'title': title, 'top_n': top_n, 'rows': rows}
+
+
+def route_congestion_data(route_list, top_n=3, sort_types=('fastest', 'safetest', 'riskiest')):
+    # 브라우저에서 그래프를 그리도록 draw_bar_graph 가 쓰는 값을 json 으로 보냄
+    # routes 는 route_list(빠른 순서) 순서, rankings 는 정렬 기준별 상위 top_n 경로의 routes 번호
+    rows = route_chart_data(route_list, len(route_list), 'fastest')['rows']
+
+    for row in rows:
+        row['station_names'] = [short_station_name(name) for name in row['station_names']]
+        row['mask'] = mask_tier(row['risk_score'])
+
+    order = list(range(len(route_list)))
+    risk_key = lambda i: (route_list[i]['risk_score'], route_list[i]['mean_risk'])
+    rankings = {
+        'fastest': order[:top_n],
+        'safetest': sorted(order, key=risk_key)[:top_n],
+        'riskiest': sorted(order, key=risk_key, reverse=True)[:top_n],
+    }
 
-            # 지하철의 경우
-            elif path['type'] == '지하철':
-                x_names.extend([s['station_name'] for s in path['stations']])
+    return {
+        'titles': {sort_type: CHART_TITLES[sort_type] for sort_type in sort_types},
+        'rankings': {sort_type: rankings[sort_type] for sort_type in sort_types},
+        'routes': rows,
+    }
 
-                # 역 별 시간 계산
-                x_types.append((1, 0, '%s호선 탑승' % (path['subway_id'])))
-                x_types.extend([(1, station['ongoing_time'].seconds/60) for i, station in enumerate(path['stations'][1:], 1)])
 
-                # 혼잡도
-                congestions.extend([s['predicted_congestion'] for s in path['stations']])
+def save_route_congestion(route_list, top_n=3):
+    return save_json_artifact(ROUTE_CONGESTION_PATH, route_congestion_data(route_list, top_n), 'route_json')
+
+
+def load_route_congestion(key):
+    return load_json_artifact(ROUTE_CONGESTION_PATH, key)
+
+
+def render_chart(chart_data):
+    # 같은 내용의 그래프는 다시 그리지 않고 기존 이미지를 사용
+    chart_key = hashlib.sha1(json.dumps(chart_data, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()
+    img_path = 'static/results/img_%s.png' % chart_key[:20]
+
+    if os.path.exists(img_path):
+        artifacts.touch(img_path)
+        return img_path
+
+    top_n = chart_data['top_n']
 
-        risk_score = route['risk_score']
-        total_time = route['total_time']
-        mean_risk = route['mean_risk']
+    # pyplot 전역 상태를 쓰지 않도록 Figure 객체를 직접 만들어서 그림
+    fig = Figure(figsize=(10, top_n*3.5+1))
+    FigureCanvasAgg(fig)
+    fig.subplots(top_n, 1, squeeze=False)
+    fig.suptitle(chart_data['title'], y=1.03, fontsize=18)
 
-        draw_bar_graph(fig, top_n, i, congestions, x_names, x_types,
-                       total_time, mean_risk, risk_score)
+    for i, row in enumerate(chart_data['rows']):
+        draw_bar_graph(fig, top_n, i, row['congestions'], row['station_names'], row['station_types'],
+                       row['total_time'], row['mean_risk'], row['risk_score'])
 
-    plt.tight_layout()
-    img_path = 'static/results/img_%s.png' % (repr(time.time()))
+    fig.tight_layout()
 
-    plt.savefig(img_path, dpi=100)
+    # 다른 프로세스가 쓰는 중인 파일을 읽지 않도록 임시 파일에 저장 후 이름 변경
+    os.makedirs(os.path.dirname(img_path), exist_ok=True)
+    tmp_path = '%s.%d.tmp.png' % (img_path, os.getpid())
+    fig.savefig(tmp_path, dpi=100)
+    os.replace(tmp_path, img_path)
 
     return img_path
 
 
+def visualization_routes(route_list, top_n=3, sort_type='safetest'):
+    return render_chart(route_chart_data(route_list, top_n, sort_type))
+
+
+def init_render_worker():
+    global mask_imgs
+
+    plt.rc('font', family='AppleGothic')
+    if not mask_imgs:
+        mask_imgs = load_mask_imgs()
+
+
+def get_render_executor():
+    global render_executor
+
+    if render_executor is None:
+        # 요청 스레드에서 처음 만들어질 때는 이미 여러 스레드(로그 전송, API 호출, sqlite 연결)가 떠 있으므로
+        # fork 대신 forkserver 로 worker 를 띄움 (필요한 상태는 init_render_worker 에서 다시 읽음)
+        # forkserver 가 이 모듈(matplotlib 등)을 미리 import 해두면 worker 는 그걸 물려받아 빨리 뜸
+        mp_context = multiprocessing.get_context('forkserver')
+        mp_context.set_forkserver_preload([__name__])
+        render_executor = ProcessPoolExecutor(max_workers=RENDER_WORKERS, initializer=init_render_worker,
+                                              mp_context=mp_context)
+
+    return render_executor
+
+
+def iter_route_charts(route_list, top_n=3, sort_types=('fastest', 'safetest', 'riskiest')):
+    # 정렬 기준별 그래프를 worker 프로세스에서 동시에 그리고, 다 그려진 순서대로 (정렬 기준, 이미지 경로) 를 내보냄
+    chart_data_list = [route_chart_data(route_list, top_n, sort_type) for sort_type in sort_types]
+    artifacts.evict_static_artifacts()
+
+    with metrics.STAGE_SECONDS.time(stage='chart_render'):
+        if RENDER_WORKERS <= 1:
+            for sort_type, chart_data in zip(sort_types, chart_data_list):
+                yield sort_type, render_chart(chart_data)
+            return
+
+        futures = {get_render_executor().submit(render_chart, chart_data): sort_type
+                   for sort_type, chart_data in zip(sort_types, chart_data_list)}
+        for future in as_completed(futures):
+            yield futures[future], future.result()
+
+
+def render_route_charts(route_list, top_n=3, sort_types=('fastest', 'safetest', 'riskiest')):
+    return dict(iter_route_charts(route_list, top_n, sort_types))
+
+
 # 해당 버스에 대한 각종 정보가 담긴 dict 반환
+def get_bus_lane_detail(busID):
+    # 저장소에 있으면 그대로 쓰고, 없을 때만 busLaneDetail API 콜하기
+    if lane_store is not None:
+        result_dict = lane_store.get(busID)
+        metrics.cache_result('bus_lane_store', result_dict is not None)
+        if result_dict is not None:
+            return result_dict
+
+    url = odsay_api_url + 'busLaneDetail'
+    param = {
+        'apiKey': odsay_api_key,
+        'busID': busID
+    }
+
+    with metrics.upstream('busLaneDetail'):
+        res = http_session.get(url, params=param, timeout=UPSTREAM_TIMEOUT)
+        res.raise_for_status()
+        result_dict = response_to_dict(res, 'json')
+
+    if lane_store is not None and 'result' in result_dict:
+        lane_store.put(busID, result_dict)
+
+    return result_dict
+
+
+def prefetch_bus_lane_details(bus_ids, max_workers=None):
+    global upstream_executor
+
+    max_workers = UPSTREAM_WORKERS if max_workers is None else max_workers
+    bus_ids = list(dict.fromkeys(bus_ids))
+
+    if max_workers <= 1 or len(bus_ids) <= 1:
+        return {bus_id: get_bus_lane_detail(bus_id) for bus_id in bus_ids}
+
+    if max_workers != UPSTREAM_WORKERS:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return dict(zip(bus_ids, executor.map(get_bus_lane_detail, bus_ids)))
+
+    # 매 검색마다 스레드를 새로 만들지 않도록 공용 executor 를 재사용
+    if upstream_executor is None:
+        upstream_executor = ThreadPoolExecutor(max_workers=UPSTREAM_WORKERS)
+
+    return dict(zip(bus_ids, upstream_executor.map(get_bus_lane_detail, bus_ids)))
+
+
 def get_bus_info_dict(result_dict):
     info_str_list = ['busNo',
                  'busStartPoint', 'busEndPoint', 'busFirstTime', 'busLastTime',
@@ -384,196 +863,350 @@ def get_path_localStationID_list(result_dict, first_stationID, last_stationID):
     return (before_path_localStationID_list, riding_path_localStationID_list)
 
 
-def get_num_in_bus_at_station_list(busID, first_stationID, last_stationID, now):
-    now_time = now.hour + now.minute / 60
-    is_weekend = 0 if now.weekday() < 5 else 1
-    warning_count = 0
+def make_bus_ridership_keys(route_code, is_weekend, station_ids, hours):
+    # (노선, 주말여부, 정류소, 시간) 을 하나의 int64 키로 묶음
+    # 정류소 ID 는 40bit, 시간은 5bit 안에 들어간다고 가정
+    station_ids = np.asarray(station_ids, dtype=np.int64)
+    hours = np.asarray(hours, dtype=np.int64)
+    route_code = np.asarray(route_code, dtype=np.int64)
+    is_weekend = np.asarray(is_weekend, dtype=np.int64)
 
-    # busLaneDetail API 콜하기
-    url = odsay_api_url + 'busLaneDetail'
-    param = {
-        'apiKey': odsay_api_key,
-        'busID': busID
+    return ((route_code * 2 + is_weekend) << 40 | station_ids) << 5 | hours
+
+
+def build_bus_ridership_index(bus_prep_df):
+    route_nos = bus_prep_df['BUS_ROUTE_NO'].values
+    route_codes = {route_no: code for code, route_no in enumerate(pd.unique(route_nos))}
+
+    keys = make_bus_ridership_keys([route_codes[route_no] for route_no in route_nos],
+                                   bus_prep_df['WEEKEND'].values,
+                                   bus_prep_df['STND_BSST_ID'].values,
+                                   bus_prep_df['TIME'].values)
+
+    # 같은 키가 여러 번 나오면 기존처럼 처음 나온 행을 쓰도록 stable 정렬
+    order = np.argsort(keys, kind='stable')
+
+    return {
+        'route_codes': route_codes,
+        'keys': np.ascontiguousarray(keys[order]),
+        'ride': np.ascontiguousarray(bus_prep_df['RIDE_NUM_PRED'].values[order], dtype=np.float64),
+        'alight': np.ascontiguousarray(bus_prep_df['ALIGHT_NUM_PRED'].values[order], dtype=np.float64),
     }
 
-    res = requests.get(url, params=param)
-    result_dict = response_to_dict(res, 'json')
+
+def lookup_bus_ridership_rows(bus_no, is_weekend, station_ids, hours):
+    # 각 정류소/시간에 해당하는 행 번호, 정보가 없으면 -1
+    rows = np.full(len(station_ids), -1, dtype=np.int64)
+    route_code = bus_ridership_index['route_codes'].get(bus_no)
+    index_keys = bus_ridership_index['keys']
+
+    if route_code is None or len(station_ids) == 0 or len(index_keys) == 0:
+        return rows
+
+    hours = np.asarray(hours, dtype=np.int64)
+    valid = (hours >= 0) & (hours < 32)
+    keys = make_bus_ridership_keys(route_code, is_weekend, station_ids, np.where(valid, hours, 0))
+
+    pos = np.minimum(np.searchsorted(index_keys, keys), len(index_keys) - 1)
+    found = valid & (index_keys[pos] == keys)
+    rows[found] = pos[found]
+
+    return rows
+
+
+def accumulate_num_in_bus(bus_no, is_weekend, station_ids, hours, interval):
+    # 정류소별 승차/하차 인원을 순서대로 누적한 버스 안 인원 수와, 정보가 있는 정류소 여부를 반환
+    # hours 가 (시각 수, 정류소 수) 이면 시각별로 따로 누적 (is_weekend 는 (시각 수, 1))
+    hours = np.asarray(hours)
+    rows = lookup_bus_ridership_rows(bus_no,
+                                     np.broadcast_to(is_weekend, hours.shape).ravel(),
+                                     np.broadcast_to(station_ids, hours.shape).ravel(),
+                                     hours.ravel()).reshape(hours.shape)
+    found = rows >= 0
+
+    # 기존 반복문과 같은 순서로 더하도록 (승차, -하차) 를 번갈아 누적
+    deltas = np.zeros(hours.shape + (2,))
+    deltas[found, 0] = bus_ridership_index['ride'][rows[found]] * interval   # 한 시간에 여러대가 지나갈것을 고려하여 보정
+    deltas[found, 1] = -bus_ridership_index['alight'][rows[found]] * interval
+
+    num_in_bus = np.cumsum(deltas.reshape(hours.shape[:-1] + (-1,)), axis=-1)[..., 1::2]
+
+    return num_in_bus, found
+
+
+def get_num_in_bus_at_station_list(busID, first_stationID, last_stationID, now, result_dict=None):
+    if bus_load_curves is not None:
+        counts = bus_load_curves.lookup(busID, first_stationID, last_stationID, now)
+        metrics.cache_result('bus_load_curves', counts is not None)
+        if counts is not None:
+            return counts
+
+    num_in_bus, found, warning_counts = get_num_in_bus_grid(busID, first_stationID, last_stationID, [now], result_dict)
+
+    # 해당 이용자가 버스를 타고가는 중 시점별 버스 안에 있는 사람 수 구하기
+    return num_in_bus[0][found[0]].tolist(), int(warning_counts[0])
+
+
+def get_num_in_bus_grid(busID, first_stationID, last_stationID, times, result_dict=None):
+    """
+    여러 승차 시각(times)에 대해 버스 안 인원 수를 한 번에 계산
+    (승차~하차 구간 인원 수, 정보 여부, 정보 없는 정류장 수) 배열, 앞의 둘은 (시각 수, 정류장 수)
+    """
+    now_times = [now.hour + now.minute / 60 for now in times]
+    is_weekend = np.array([[0 if now.weekday() < 5 else 1] for now in times])
+
+    if result_dict is None:
+        result_dict = get_bus_lane_detail(busID)
 
     bus_info_dict = get_bus_info_dict(result_dict)
     before_path_localStationID_list, riding_path_localStationID_list = get_path_localStationID_list(result_dict, first_stationID, last_stationID)
-
-    stat_df = getout_bus_prep_m_df[(getout_bus_prep_m_df['BUS_ROUTE_NO'] == bus_info_dict['busNo']) &
-                         (getout_bus_prep_m_df['WEEKEND'] == int(is_weekend))]
+    num_before = len(before_path_localStationID_list)
 
     # 버스 시작지점 때 타고 있는 사람 수 구하기
     # 현 버스의 기점 출발시간 구하기
-    start_time_at_busStartPoint = round(now_time - bus_info_dict['time_per_station'] * len(before_path_localStationID_list) , 3)
+    start_times_at_busStartPoint = np.array([round(now_time - bus_info_dict['time_per_station'] * num_before, 3)
+                                             for now_time in now_times])
 
-    time_at_station = start_time_at_busStartPoint
-    current_num_in_bus = 0
+    # 기점부터 정류소별 도착 시간 (이용자가 타는 정류소부터는 현재 시각 기준)
+    times_at_station = np.concatenate([
+        start_times_at_busStartPoint[:, None] + bus_info_dict['time_per_station'] * np.arange(num_before),
+        np.array(now_times)[:, None] + bus_info_dict['time_per_station'] * np.arange(len(riding_path_localStationID_list)),
+    ], axis=1)
+    station_ids = [int(station_local_id)
+                   for station_local_id in before_path_localStationID_list + riding_path_localStationID_list]
 
-    for idx, station_local_id in enumerate(before_path_localStationID_list):
-        temp_df = stat_df[(stat_df['STND_BSST_ID'] == int(station_local_id)) & (stat_df['TIME'] == int(time_at_station))]
+    num_in_bus, found = accumulate_num_in_bus(bus_info_dict['busNo'], is_weekend, station_ids,
+                                              np.trunc(times_at_station), bus_info_dict['interval'])
 
-        if len(temp_df) == 0:
-            warning_message = "No information of %s bus at %s station" % (busID, station_local_id)
-            #warnings.warn(warning_message)
-            warning_count += 1
-            continue
-        else:
-            current_num_in_bus += temp_df['RIDE_NUM_PRED'].values[0] * bus_info_dict['interval']   # 한 시간에 여러대가 지나갈것을 고려하여 보정
-            current_num_in_bus -= temp_df['ALIGHT_NUM_PRED'].values[0]  * bus_info_dict['interval']
+    return num_in_bus[:, num_before:], found[:, num_before:], np.count_nonzero(~found, axis=1)
 
-        time_at_station += bus_info_dict['time_per_station']
 
-    # 해당 이용자가 버스를 타고가는 중 시점별 버스 안에 있는 사람 수 구하기
-    time_at_station = now_time
-    num_in_bus_at_station_list = []
+def get_bus_path_counts(path, cache, lane_details=None):
+    first_station_id = int(path.columns.station_ids[0])
+    last_station_id = int(path.columns.station_ids[-1])
+    key = (path.bus_id, first_station_id, last_station_id, path.start_time)
 
-    for idx, station_local_id in enumerate(riding_path_localStationID_list):
-        temp_df = stat_df[(stat_df['STND_BSST_ID'] == int(station_local_id)) & (stat_df['TIME'] == int(time_at_station))]
+    if key not in cache:
+        cache[key] = get_num_in_bus_at_station_list(
+            path.bus_id,
+            first_station_id,
+            last_station_id,
+            path.start_time,
+            (lane_details or {}).get(path.bus_id))
 
-        if len(temp_df) == 0:
-            warning_message = "No information of %s bus at %s station" % (busID, station_local_id)
-            #warnings.warn(warning_message)
-            warning_count += 1
-            continue
+    return cache[key]
 
-        current_num_in_bus += temp_df['RIDE_NUM_PRED'].values[0] * bus_info_dict['interval']   # 한 시간에 여러대가 지나갈것을 고려하여 보정
-        current_num_in_bus -= temp_df['ALIGHT_NUM_PRED'].values[0]  * bus_info_dict['interval']
 
-        num_in_bus_at_station_list.append(current_num_in_bus)
-        time_at_station += bus_info_dict['time_per_station']
+def get_bus_path_counts_grid(path, start_times, lane_details=None):
+    # 여러 출발 시각에 대한 구간의 정류장별 인원 수 (시각 수, 정류장 수) 와 정보 없는 정류장 수
+    first_station_id = int(path.columns.station_ids[0])
+    last_station_id = int(path.columns.station_ids[-1])
 
-    return num_in_bus_at_station_list, warning_count
+    grid = None
+    if bus_load_curves is not None:
+        grid = bus_load_curves.lookup_grid(path.bus_id, first_station_id, last_station_id, start_times)
+        metrics.cache_result('bus_load_curves', grid is not None)
 
+    if grid is None:
+        grid = get_num_in_bus_grid(path.bus_id, first_station_id, last_station_id, start_times,
+                                   (lane_details or {}).get(path.bus_id))
 
-def attach_congestion_count_at_bus(path, cache):
-    key = (path['bus_id'],
-           path['stations'][0]['station_id'],
-           path['stations'][-1]['station_id'],
-           path['start_time'])
+    num_in_bus, found, warning_counts = grid
 
-    if key in cache:
-        counts, warning_count = cache[key]
-    else:
-        counts, warning_count = get_num_in_bus_at_station_list(
-            path['bus_id'],
-            path['stations'][0]['station_id'],
-            path['stations'][-1]['station_id'],
-            path['start_time'])
-        cache[key] = (counts, warning_count)
+    # attach_congestion_counts 와 같이 정보가 있는 정류장 값만 앞에서부터 채우고, 나머지는 NaN
+    order = np.argsort(~found, axis=1, kind='stable')
+    counts = np.take_along_axis(num_in_bus.astype(np.float64), order, axis=1)
+    counts[np.arange(counts.shape[1]) >= np.count_nonzero(found, axis=1)[:, None]] = np.nan
 
-    for count, station in zip(counts, path['stations']):
-        count = max(count, 0)
-        count = min(count, 70)
+    padded = np.full((len(start_times), path.station_num), np.nan)
+    width = min(counts.shape[1], path.station_num)
+    padded[:, :width] = counts[:, :width]
 
-        station['predicted_count'] = count
-        station['predicted_congestion'] = count / 46
-        station['predicted_risk'] = bus_risk_dict.get(int(count + 0.5), 0)
+    return padded, warning_counts
 
-    path['warning_count'] = warning_count
 
+def way_code_to_name(code, subway_id):
+    if subway_id == 2:
+        return '내선' if code == 2 else '외선'
+    return '상선' if code == 1 else '하선'
 
-def attach_congestion_count_at_subway(path):
-    def way_code_to_name(code, subway_id):
-        if subway_id == 2:
-            return '내선' if code == 2 else '외선'
-        return '상선' if code == 1 else '하선'
 
-    def datetime_to_weekday(now):
-        if now.weekday() < 5:
-            return '평일'
-        return '주말'
+def datetime_to_weekday(now):
+    if now.weekday() < 5:
+        return '평일'
+    return '주말'
 
-    subway_id = path['subway_id']
 
-    if isinstance(subway_id, int):
-        way_name = way_code_to_name(path['way_code'], subway_id)
-        week_day = datetime_to_weekday(path['start_time'])
+def build_risk_lut(risk_dict):
+    # 인원 수(int) -> 위험도 dict 를 인원 수로 바로 접근하는 배열로 바꿈, 없는 값은 0
+    lut = np.zeros(max(risk_dict, default=-1) + 1)
+    for key, value in risk_dict.items():
+        if key >= 0:
+            lut[int(key)] = value
 
-        for station in path['stations']:
-            hour_name = '%02d:00' % station['start_time'].hour
-            try:
-                val = subway_congestion_dict[week_day,
-                                             str(station['station_id']),
-                                             way_name][hour_name]
-            except KeyError:
-                val = subway_congestion_dict[week_day,
-                                             'NaN',
-                                             way_code_to_name(path['way_code'], 1)][hour_name]
+    return lut
 
-            val = max(val, 0)
-            val = min(val, 368)
 
-            count = val * 1.6
+def lookup_risk(risk_lut, counts):
+    # 인원 수가 NaN(정보 없음)이면 위험도도 NaN
+    known = ~np.isnan(counts)
+    idx = (np.where(known, counts, -1) + 0.5).astype(np.int64)
+    valid = (idx >= 0) & (idx < len(risk_lut))
 
-            station['predicted_congestion'] = val/100
-            station['predicted_count'] = count
-            station['predicted_risk'] = subway_risk_dict.get(int(count + 0.5), 0)
+    risks = np.where(known, 0.0, np.nan)
+    risks[valid] = risk_lut[idx[valid]]
 
+    return risks
+
+
+def write_congestion(paths, congestions, counts, risks):
+    # 구간별로 이어붙인 배열을 다시 구간 길이만큼 잘라서 (복사 없이) 각 구간에 붙임
+    start = 0
+    for path in paths:
+        end = start + path.station_num
+        path.counts = counts[start:end]
+        path.congestions = congestions[start:end]
+        path.risks = risks[start:end]
+        start = end
+
+
+def attach_congestion_counts(paths, cache=None, lane_details=None):
+    # 여러 구간의 정류장을 모아서 혼잡도/위험도를 한 번에 계산한 뒤 다시 각 구간에 기록
+    cache = {} if cache is None else cache
+
+    bus_paths, bus_counts = [], []
+    subway_paths, subway_keys = [], ([], [], [], [])
+
+    station_index = subway_congestion['station_index']
+    unknown_index = subway_congestion['unknown_index']
+
+    for path in paths:
+        if path.type == BUS:
+            counts, warning_count = get_bus_path_counts(path, cache, lane_details)
+            path.warning_count = warning_count
+
+            # 정보가 있는 정류장 수만큼 앞에서부터 채우고, 나머지는 NaN
+            counts = counts[:path.station_num]
+            padded = np.full(path.station_num, np.nan)
+            padded[:len(counts)] = counts
+
+            bus_paths.append(path)
+            bus_counts.append(padded)
+
+        elif path.type == SUBWAY and isinstance(path.subway_id, int):
+            day_idx = SUBWAY_DAYS.index(datetime_to_weekday(path.start_time))
+            way_idx = SUBWAY_WAYS.index(way_code_to_name(path.way_code, path.subway_id))
+
+            subway_paths.append(path)
+            subway_keys[0].append(np.full(path.station_num, day_idx))
+            subway_keys[1].append([station_index.get(str(station_id), unknown_index)
+                                   for station_id in path.columns.station_ids.tolist()])
+            subway_keys[2].append(np.full(path.station_num, way_idx))
+            subway_keys[3].append(path.columns.hours(path.start_time))
+
+    if bus_paths:
+        counts = np.clip(np.concatenate(bus_counts), 0, 70)
+        write_congestion(bus_paths, counts / 46, counts, lookup_risk(bus_risk_lut, counts))
+
+    if subway_paths:
+        keys = tuple(np.concatenate(key).astype(np.int64) for key in subway_keys)
+        vals = np.clip(subway_congestion['tensor'][keys], 0, 368)
+        counts = vals * 1.6
+        write_congestion(subway_paths, vals / 100, counts, lookup_risk(subway_risk_lut, counts))
+
+
+def congestion_grid(paths, shifts, lane_details=None):
+    """
+    구간들의 출발 시각을 shifts(timedelta 목록) 만큼씩 옮겨가며 정류장별 혼잡도/위험도를 한 번에 계산
+    (출발 시각 수, 구간들의 전체 정류장 수) 배열 2개를 반환, 정보가 없으면 NaN
+    """
+    bounds = np.cumsum([0] + [path.station_num for path in paths])
+    congestions = np.full((len(shifts), bounds[-1]), np.nan)
+    risks = np.full((len(shifts), bounds[-1]), np.nan)
+
+    bus_columns, bus_counts = [], []
+    subway_columns, subway_keys = [], ([], [], [], [])
+
+    station_index = subway_congestion['station_index']
+    unknown_index = subway_congestion['unknown_index']
+
+    for path, start, end in zip(paths, bounds, bounds[1:]):
+        start_times = [path.start_time + shift for shift in shifts]
+
+        if path.type == BUS:
+            counts, _ = get_bus_path_counts_grid(path, start_times, lane_details)
+            bus_columns.append(np.arange(start, end))
+            bus_counts.append(counts)
+
+        elif path.type == SUBWAY and isinstance(path.subway_id, int):
+            shape = (len(shifts), path.station_num)
+            day_idx = [[SUBWAY_DAYS.index(datetime_to_weekday(start_time))] for start_time in start_times]
+            way_idx = SUBWAY_WAYS.index(way_code_to_name(path.way_code, path.subway_id))
+
+            subway_columns.append(np.arange(start, end))
+            subway_keys[0].append(np.broadcast_to(day_idx, shape))
+            subway_keys[1].append(np.broadcast_to([station_index.get(str(station_id), unknown_index)
+                                                   for station_id in path.columns.station_ids.tolist()], shape))
+            subway_keys[2].append(np.full(shape, way_idx))
+            subway_keys[3].append(path.columns.hours_grid(start_times))
+
+    if bus_columns:
+        columns = np.concatenate(bus_columns)
+        counts = np.clip(np.concatenate(bus_counts, axis=1), 0, 70)
+        congestions[:, columns] = counts / 46
+        risks[:, columns] = lookup_risk(bus_risk_lut, counts)
+
+    if subway_columns:
+        columns = np.concatenate(subway_columns)
+        keys = tuple(np.concatenate(key, axis=1).astype(np.int64) for key in subway_keys)
+        vals = np.clip(subway_congestion['tensor'][keys], 0, 368)
+        congestions[:, columns] = vals / 100
+        risks[:, columns] = lookup_risk(subway_risk_lut, vals * 1.6)
+
+    return congestions, risks
 
-def compress_path(path, predicted_time):
-    result = [{'start_time': predicted_time}]
 
+def attach_congestion_count_at_bus(path, cache, lane_details=None):
+    attach_congestion_counts([path], cache, lane_details)
+
+
+def attach_congestion_count_at_subway(path):
+    attach_congestion_counts([path])
+
+
+def compress_path(path, predicted_time):
     if path['trafficType'] == 3:
         if path['distance'] == 0:
             return None, predicted_time
         else:
-            result[0]['type'] = '도보'
-            result[0]['distance'] = path['distance']
-            result[0]['duration'] = path['sectionTime']
+            result = [Segment(WALK, predicted_time, path['distance'], path['sectionTime'])]
 
             predicted_time += datetime.timedelta(minutes=path['sectionTime'])
 
     elif path['trafficType'] == 2:
-        result[0]['type'] = '버스'
-        result[0]['distance'] = path['distance']
-        result[0]['duration'] = path['sectionTime']
-        result[0]['start_name'] = path['startName']
-        result[0]['end_name'] = path['endName']
-
-        time_per_station = datetime.timedelta(minutes=path['sectionTime']) / (len(path['passStopList']['stations'])-1)
-
-        result[0]['stations'] = [{'station_id': station['stationID'],
-                                  'station_name': station['stationName'],
-                                  'start_time': predicted_time + time_per_station * i,
-                                  'ongoing_time': time_per_station * i}
-                                 for i, station in enumerate(path['passStopList']['stations'])]
+        # 노선마다 혼잡도가 다르므로 노선별로 구간을 만들고, 정류장 정보는 공유
+        columns = StationColumns.from_pass_stops(path['passStopList']['stations'], path['sectionTime'])
+        segment = Segment(BUS, predicted_time, path['distance'], path['sectionTime'],
+                          path['startName'], path['endName'], columns=columns)
+        result = [segment] + [segment.lane_copy() for _ in range(len(path['lane'])-1)]
 
         predicted_time += datetime.timedelta(minutes=path['sectionTime'])
 
-        for i in range(len(path['lane'])-1):
-            result.append(result[0].copy())
-
         for i, lane in enumerate(path['lane']):
-            result[i]['bus_no'] = lane['busNo']
-            result[i]['bus_id'] = lane['busID']
-            result[i]['bus_type'] = lane['type']
+            result[i].bus_no = lane['busNo']
+            result[i].bus_id = lane['busID']
+            result[i].bus_type = lane['type']
 
     elif path['trafficType'] == 1:
-        result[0]['type'] = '지하철'
-        result[0]['distance'] = path['distance']
-        result[0]['duration'] = path['sectionTime']
-        result[0]['start_name'] = path['startName']
-        result[0]['end_name'] = path['endName']
-        result[0]['way_code'] = path['wayCode']
-
-        time_per_station = datetime.timedelta(minutes=path['sectionTime']) / (len(path['passStopList']['stations'])-1)
-
-        result[0]['stations'] = [{'station_id': station['stationID'],
-                                  'station_name': station['stationName'],
-                                  'start_time': predicted_time + time_per_station * i,
-                                  'ongoing_time': time_per_station * i}
-                                 for i, station in enumerate(path['passStopList']['stations'])]
+        columns = StationColumns.from_pass_stops(path['passStopList']['stations'], path['sectionTime'])
+        segment = Segment(SUBWAY, predicted_time, path['distance'], path['sectionTime'],
+                          path['startName'], path['endName'], path['wayCode'], columns)
+        result = [segment] + [segment.lane_copy() for _ in range(len(path['lane'])-1)]
 
         predicted_time += datetime.timedelta(minutes=path['sectionTime'])
 
-        for i in range(len(path['lane'])-1):
-            result.append(result[0].copy())
-
         for i, lane in enumerate(path['lane']):
-            result[i]['subway_id'] = lane['subwayCode']
+            result[i].subway_id = lane['subwayCode']
 
     else:
         raise ValueError()
@@ -581,55 +1214,44 @@ def compress_path(path, predicted_time):
     return result, predicted_time
 
 
-def check_risk_score_per_route(route):
-    def find_consecutives(values, ongoing_times, consecutive_seconds, thresholds):
-        score = 0
-        i = 0
-        threshold_keys = sorted(thresholds.keys(), reverse=True)
-
-        while(i < len(values)):
-            idx_end = np.argmax((ongoing_times - ongoing_times[i]) > consecutive_seconds)
-            if idx_end == 0:
-                break
-            min_value = min(values[i:idx_end+1])
-
-            for key in threshold_keys:
-                if min_value > key:
-                    score += thresholds[key]
-                    i = idx_end-1
-                    break
-            i += 1
-        return score
-
-    score = 0
-
-    for path in route['path_list']:
-        if path['type'] == '도보':
-            continue
+def check_risk_score_per_paths(paths):
+    # 도보 구간은 정류장이 없으므로 0점
+    station_paths = [path for path in paths if path.station_num]
 
-        ongoing_times = np.array([station['ongoing_time'].seconds for station in path['stations']])
+    if not station_paths:
+        return [0.0] * len(paths)
 
-        try:
-            # 10분 연속 혼잡도가 >0.5 면 +1, >0.75 면 +2, >1.0 이면 +3
-            congestions = np.array([station['predicted_congestion'] for station in path['stations']])
-        except KeyError():
-            #print(path['stations'])
-            pass
-        score += find_consecutives(congestions, ongoing_times, 600, {0.25:0.5, 0.5:1, 0.75:2, 1.0:3})
+    return risk_scoring.score_paths(np.concatenate([path.columns.ongoing_seconds() for path in station_paths]),
+                                    np.concatenate([path.congestions for path in station_paths]),
+                                    np.concatenate([path.risks for path in station_paths]),
+                                    [path.station_num for path in paths]).tolist()
 
-        # 10분 연속 감염 위험도가 >10 면 +1, >15 면 +2
-        congestions = np.array([station['predicted_risk'] for station in path['stations']])
 
-        score += find_consecutives(congestions, ongoing_times, 600, {0.5:1, 0.75:2, 1.0:3})
+def check_risk_score_per_path(path):
+    return check_risk_score_per_paths([path])[0]
 
-        # 15분 연속 타고 있을 때마다 score + 1
-        score += find_consecutives(ongoing_times, ongoing_times, 900, {15*60:1})
 
-    return score
+def check_risk_score_per_route(route):
+    return sum(check_risk_score_per_paths(route['path_list']))
+
+
+def short_station_name(name):
+    # 7글자까지는 그대로 표시, 그 이상은 4글자..2글자로 표기하기 위함
+    return name if len(name) < 8 else '%s..%s' % (name[:4], name[-2:])
+
+
+def mask_tier(risk_score):
+    if risk_score <= 3.1:
+        return 'safe'
+    elif risk_score <= 6.1:
+        return 'normal'
+    elif risk_score <= 9.1:
+        return 'unsafe'
+    return 'risky'
 
 
 def draw_bar_graph(fig, num_rows, i, congestions, station_names, station_types, time, mean_risk, risk_score):
-    ax = plt.subplot(num_rows, 1, i+1)
+    ax = fig.axes[i]
 
     bar_colors = [
         '#00A2FF' if congestion < 0.25 else
@@ -640,42 +1262,35 @@ def draw_bar_graph(fig, num_rows, i, congestions, station_names, station_types,
         for congestion in congestions
     ]
 
-    # 7글자까지는 그대로 표시, 그 이상은 4글자..2글자로 표기하기 위함
-    short_station_names = [name if len(name) < 8 else '%s..%s' % (name[:4], name[-2:]) for name in station_names]
+    short_station_names = [short_station_name(name) for name in station_names]
 
-    plt.bar(x=np.arange(len(congestions)), height=congestions, color=bar_colors)
-    plt.xticks(np.arange(len(congestions)), short_station_names,
-               rotation=-45, ha='left', fontsize=14, color='#5A6773')
-    plt.yticks([0, 0.25, 0.5, 0.75, 1.0], fontsize=14)
+    ax.bar(x=np.arange(len(congestions)), height=congestions, color=bar_colors)
+    ax.set_xticks(np.arange(len(congestions)))
+    ax.set_xticklabels(short_station_names, rotation=-45, ha='left', fontsize=14, color='#5A6773')
+    ax.set_yticks([0, 0.25, 0.5, 0.75, 1.0])
+    ax.tick_params(axis='y', labelsize=14)
 
-    for spine in plt.gca().spines.values():
+    for spine in ax.spines.values():
         spine.set_visible(False)
 
     # X label 에서 "도보"를 색으로 표시
-    for ticklabel, s_type in zip(plt.gca().get_xticklabels(), station_types):
-        if s_type == (0, 0):
+    for ticklabel, s_type in zip(ax.get_xticklabels(), station_types):
+        if tuple(s_type) == (0, 0):
             ticklabel.set_color('#009999')
 
     # 환승 타이밍 / 탑승한 경로 표시
     for i, typ in enumerate(station_types):
         if len(typ) == 3:
-            plt.text(i-0.6, 1.0, typ[2], fontsize=14)
-            plt.plot((i-0.5, i-0.5), (0, 0.95), '--', color='#666666', linewidth=0.5)
+            ax.text(i-0.6, 1.0, typ[2], fontsize=14)
+            ax.plot((i-0.5, i-0.5), (0, 0.95), '--', color='#666666', linewidth=0.5)
 
     # 추가 정보
-    plt.text(len(congestions), -0.15, '총 시간: %d분' % (time), fontsize=14)
-    plt.text(len(congestions), 0, '위험지수: %.1f' % (mean_risk), fontsize=14)
+    ax.text(len(congestions), -0.15, '총 시간: %d분' % (time), fontsize=14)
+    ax.text(len(congestions), 0, '위험지수: %.1f' % (mean_risk), fontsize=14)
     #plt.text(len(congestions), 0.15, '점수: %.1f' % (risk_score), fontsize=14)
 
     # mask icon
-    if risk_score <= 3.1:
-        im = mask_imgs['safe']
-    elif risk_score <= 6.1:
-        im = mask_imgs['normal']
-    elif risk_score <= 9.1:
-        im = mask_imgs['unsafe']
-    else:
-        im = mask_imgs['risky']
+    im = mask_imgs[mask_tier(risk_score)]
 
     imagebox = OffsetImage(im, zoom=0.2)
     ab = AnnotationBbox(imagebox, xy=(1.05, 0.5), xycoords="axes fraction", frameon=False)
@@ -683,12 +1298,12 @@ def draw_bar_graph(fig, num_rows, i, congestions, station_names, station_types,
 
     # 경로별 15분 넘는 정류장 표시
     for i, typ in enumerate(station_types):
-        if typ == (0, 0):
+        if tuple(typ) == (0, 0):
             continue
 
         if typ[1] > 15:
-            plt.plot((i-0.35, i+0.35), (-0.04, -0.04), color='#FF968D', linewidth=5.0)
+            ax.plot((i-0.35, i+0.35), (-0.04, -0.04), color='#FF968D', linewidth=5.0)
         else:
-            plt.plot((i-0.35, i+0.35), (-0.04, -0.04), color='#EAE4E0', linewidth=5.0)
+            ax.plot((i-0.35, i+0.35), (-0.04, -0.04), color='#EAE4E0', linewidth=5.0)
 
-    plt.ylim((-0.1, 1.0))
+    ax.set_ylim((-0.1, 1.0))
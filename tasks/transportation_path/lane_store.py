@@ -0,0 +1,164 @@
+# -*- coding:utf-8 -*-
+import argparse
+import gzip
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import pandas as pd
+import requests
+
+
+# 노선 정보(정류장 순서 등)는 거의 바뀌지 않으므로 길게 보관
+LANE_STORE_TTL = 30 * 24 * 3600
+SNAPSHOT_VERSION = 1
+
+
+class LaneDetailStore:
+    """busLaneDetail 응답을 여러 프로세스가 함께 쓰는 sqlite 파일에 보관하는 저장소"""
+
+    def __init__(self, db_path, ttl=LANE_STORE_TTL):
+        self.db_path = db_path
+        self.ttl = ttl
+        self._local = threading.local()
+        self._memory = {}  # 프로세스 안에서 json 파싱을 반복하지 않기 위한 캐시
+
+        # fetched_at: TTL 기준 시각 (API 로 받거나 스냅샷을 불러온 시각)
+        # created_at: body 가 만들어진 시각 (API 로 받은 시각, 스냅샷이면 스냅샷을 만든 시각)
+        with self._connect() as conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS bus_lane_detail ('
+                         'bus_id INTEGER PRIMARY KEY, fetched_at REAL, body TEXT, created_at REAL)')
+
+            columns = [row[1] for row in conn.execute('PRAGMA table_info(bus_lane_detail)')]
+            if 'created_at' not in columns:  # created_at 이 없던 예전 파일
+                conn.execute('ALTER TABLE bus_lane_detail ADD COLUMN created_at REAL')
+                conn.execute('UPDATE bus_lane_detail SET created_at = fetched_at')
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            self._local.conn = conn
+        return conn
+
+    def _is_fresh(self, fetched_at):
+        return self.ttl is None or time.time() - fetched_at < self.ttl
+
+    def get(self, bus_id):
+        bus_id = int(bus_id)
+
+        if bus_id in self._memory:
+            fetched_at, result_dict = self._memory[bus_id]
+            if self._is_fresh(fetched_at):
+                return result_dict
+
+        row = self._connect().execute('SELECT fetched_at, body FROM bus_lane_detail WHERE bus_id = ?',
+                                      (bus_id,)).fetchone()
+        if row is None or not self._is_fresh(row[0]):
+            return None
+
+        result_dict = json.loads(row[1])
+        self._memory[bus_id] = (row[0], result_dict)
+        return result_dict
+
+    def put(self, bus_id, result_dict, fetched_at=None):
+        self.put_many({bus_id: result_dict}, fetched_at)
+
+    def put_many(self, result_dicts, fetched_at=None, created_at=None):
+        # created_at 은 body 가 만들어진 시각 (기본은 fetched_at)
+        fetched_at = time.time() if fetched_at is None else fetched_at
+        created_at = fetched_at if created_at is None else created_at
+
+        with self._connect() as conn:
+            # body 는 이미 있는 것보다 나중에 만들어진 경우에만 바꾸고, TTL 기준 시각은 항상 최근 것으로 갱신
+            conn.executemany('INSERT INTO bus_lane_detail (bus_id, fetched_at, body, created_at) VALUES (?, ?, ?, ?) '
+                             'ON CONFLICT(bus_id) DO UPDATE SET '
+                             'body = CASE WHEN bus_lane_detail.created_at < excluded.created_at '
+                             'THEN excluded.body ELSE bus_lane_detail.body END, '
+                             'created_at = MAX(bus_lane_detail.created_at, excluded.created_at), '
+                             'fetched_at = MAX(bus_lane_detail.fetched_at, excluded.fetched_at)',
+                             [(int(bus_id), fetched_at, json.dumps(result_dict, ensure_ascii=False), created_at)
+                              for bus_id, result_dict in result_dicts.items()])
+
+        for bus_id, result_dict in result_dicts.items():
+            self._memory.pop(int(bus_id), None)
+
+    def load_snapshot(self, snapshot_path):
+        # 불러올 때마다 불러온 시각부터 TTL 을 다시 적용 (스냅샷을 다시 불러오면 저장소가 계속 유지되도록)
+        # 스냅샷을 만든 뒤에 API 로 받은 행은 body 를 그대로 둠
+        snapshot = read_snapshot(snapshot_path)
+        self.put_many(snapshot['lanes'], time.time(), snapshot['created_at'])
+
+        return len(snapshot['lanes'])
+
+
+def read_snapshot(snapshot_path):
+    with gzip.open(snapshot_path, 'rt', encoding='utf-8') as file:
+        snapshot = json.load(file)
+
+    if snapshot.get('version') != SNAPSHOT_VERSION:
+        raise ValueError('Unsupported bus lane snapshot version: %s' % snapshot.get('version'))
+
+    return snapshot
+
+
+def write_snapshot(snapshot_path, lanes):
+    snapshot = {
+        'version': SNAPSHOT_VERSION,
+        'created_at': time.time(),
+        'lanes': {str(bus_id): result_dict for bus_id, result_dict in lanes.items()},
+    }
+
+    tmp_path = snapshot_path + '.tmp'
+    with gzip.open(tmp_path, 'wt', encoding='utf-8') as file:
+        json.dump(snapshot, file, ensure_ascii=False)
+    os.replace(tmp_path, snapshot_path)
+
+
+def crawl_bus_lanes(bus_nos, odsay_api_url, odsay_api_key, city_code=1000, sleep_sec=0.1):
+    # 버스 번호로 busID 목록을 찾고, 각 노선의 busLaneDetail 을 받아옴
+    lanes = {}
+
+    for bus_no in bus_nos:
+        res = requests.get(odsay_api_url + 'searchBusLane',
+                           params={'apiKey': odsay_api_key, 'busNo': bus_no, 'CID': city_code})
+        for lane in res.json().get('result', {}).get('lane', []):
+            if lane['busNo'] != bus_no or lane['busID'] in lanes:
+                continue
+
+            res = requests.get(odsay_api_url + 'busLaneDetail',
+                               params={'apiKey': odsay_api_key, 'busID': lane['busID']})
+            result_dict = res.json()
+            if 'result' in result_dict:
+                lanes[lane['busID']] = result_dict
+
+            time.sleep(sleep_sec)
+
+    return lanes
+
+
+if __name__ == '__main__':
+    # python -m tasks.transportation_path.lane_store crawl
+    # python -m tasks.transportation_path.lane_store load
+    from . import handler
+    from .config import odsay_api_key
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('command', choices=['crawl', 'load'])
+    parser.add_argument('--data_dir', default=handler.DATA_DIR)
+    args = parser.parse_args()
+
+    snapshot_path = args.data_dir + handler.LANE_SNAPSHOT_FILE
+
+    if args.command == 'crawl':
+        bus_prep_df = pd.read_csv(args.data_dir + handler.BUS_PREP_FILE, usecols=['BUS_ROUTE_NO'], dtype=str)
+        lanes = crawl_bus_lanes(sorted(bus_prep_df['BUS_ROUTE_NO'].unique()),
+                                handler.odsay_api_url, odsay_api_key)
+        write_snapshot(snapshot_path, lanes)
+        print('%d lanes -> %s' % (len(lanes), snapshot_path))
+    else:
+        store = LaneDetailStore(args.data_dir + handler.LANE_STORE_FILE)
+        print('%d lanes loaded' % store.load_snapshot(snapshot_path))
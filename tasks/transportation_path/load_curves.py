@@ -0,0 +1,214 @@
+# -*- coding:utf-8 -*-
+import argparse
+import time
+
+import numpy as np
+
+from .dataset_snapshot import read_snapshot, write_snapshot
+
+
+# 버스 노선별 정류장/시(hour)/평일·주말별 "승차, -하차 인원" 을 미리 계산해둔 파일
+# 요청 때는 busLaneDetail 호출과 승하차 데이터 검색 없이, 기점부터 하차 정류장까지 시각별 값을 모아 누적만 함
+# (handler.get_num_in_bus_grid 와 같은 시각/순서로 계산하므로 결과가 같음)
+#   arrays: bus_ids[R], offsets[R+1], time_per_station[R], station_ids[S]
+#           deltas[2, n_hours, S, 2], found[2, n_hours, S]  (S = 모든 노선의 정류장 수 합)
+# ODsay busLaneDetail 의 정류장 목록은 기점 -> 회차 -> 기점 순서라서 노선(busID) 하나에 양방향이 모두 들어있음
+
+CURVES_KIND = 'bus_load_deltas'
+
+
+def build_load_curves(lanes):
+    """lanes: {busID: busLaneDetail 응답}, handler.init_handler 로 승하차 데이터를 읽은 뒤 사용"""
+    from . import handler
+
+    # 승하차 데이터에 있는 시(hour) 범위, 범위 밖의 시각은 정보 없음
+    index_keys = handler.bus_ridership_index['keys']
+    n_hours = int((index_keys & 31).max()) + 1 if len(index_keys) else 0
+    routes = []
+
+    for bus_id, result_dict in sorted(lanes.items(), key=lambda item: int(item[0])):
+        if 'result' not in result_dict or len(result_dict['result']['station']) < 2:
+            continue
+
+        bus_info_dict = handler.get_bus_info_dict(result_dict)
+        stations = result_dict['result']['station']
+        routes.append((int(bus_id), bus_info_dict,
+                       [station['stationID'] for station in stations],
+                       [int(station['localStationID']) for station in stations]))
+
+    offsets = np.zeros(len(routes) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(station_ids) for _, _, station_ids, _ in routes])
+
+    deltas = np.zeros((2, n_hours, offsets[-1], 2), dtype=np.float64)
+    found = np.zeros((2, n_hours, offsets[-1]), dtype=bool)
+
+    for (bus_id, bus_info_dict, station_ids, local_station_ids), start, end in zip(routes, offsets, offsets[1:]):
+        # (주말여부, 시, 정류장) 을 한 번에 찾음
+        shape = (2, n_hours, len(local_station_ids))
+        rows = handler.lookup_bus_ridership_rows(bus_info_dict['busNo'],
+                                                 np.broadcast_to(np.arange(2)[:, None, None], shape).ravel(),
+                                                 np.broadcast_to(local_station_ids, shape).ravel(),
+                                                 np.broadcast_to(np.arange(n_hours)[:, None], shape).ravel())
+        rows = rows.reshape(shape)
+        route_found = rows >= 0
+
+        # handler.accumulate_num_in_bus 와 같은 값 (한 시간에 여러대가 지나갈것을 고려하여 보정)
+        route_deltas = deltas[:, :, start:end]
+        route_deltas[route_found, 0] = handler.bus_ridership_index['ride'][rows[route_found]] * bus_info_dict['interval']
+        route_deltas[route_found, 1] = -handler.bus_ridership_index['alight'][rows[route_found]] * bus_info_dict['interval']
+        found[:, :, start:end] = route_found
+
+    arrays = {
+        'bus_ids': np.array([route[0] for route in routes], dtype=np.int64),
+        'offsets': offsets,
+        'time_per_station': np.array([route[1]['time_per_station'] for route in routes], dtype=np.float64),
+        'station_ids': np.array([station_id for route in routes for station_id in route[2]], dtype=np.int64),
+        'deltas': deltas,
+        'found': found,
+    }
+
+    return arrays, {'kind': CURVES_KIND}
+
+
+def write_load_curves(curves_path, lanes):
+    arrays, meta = build_load_curves(lanes)
+    write_snapshot(curves_path, arrays, meta)
+
+    return len(arrays['bus_ids'])
+
+
+class BusLoadCurves:
+    """write_load_curves 로 만든 파일을 매핑해서 승차~하차 구간의 버스 안 인원 수를 계산"""
+
+    def __init__(self, arrays, meta):
+        if meta.get('kind') != CURVES_KIND:
+            raise ValueError('Not a bus load curve file')
+
+        self.arrays = arrays
+        self.n_hours = arrays['deltas'].shape[1]
+        self.route_index = {bus_id: i for i, bus_id in enumerate(arrays['bus_ids'].tolist())}
+
+    @classmethod
+    def from_file(cls, curves_path):
+        return cls(*read_snapshot(curves_path))
+
+    def __len__(self):
+        return len(self.route_index)
+
+    def __contains__(self, bus_id):
+        return int(bus_id) in self.route_index
+
+    def _positions(self, route, first_station_id, last_station_id):
+        start, end = self.arrays['offsets'][route:route + 2]
+        station_ids = self.arrays['station_ids'][start:end]
+
+        # get_path_localStationID_list 와 같이 하차 정류장에서 멈추고, 그 전에서 승차 정류장을 찾음
+        last_pos = np.flatnonzero(station_ids == int(last_station_id))
+        last_pos = int(last_pos[0]) if len(last_pos) else len(station_ids) - 1
+        first_pos = np.flatnonzero(station_ids[:last_pos + 1] == int(first_station_id))
+        first_pos = int(first_pos[0]) if len(first_pos) else last_pos + 1
+
+        return int(start), first_pos, last_pos
+
+    def _hours(self, route, first_pos, last_pos, times):
+        # handler.get_num_in_bus_grid 와 같은 계산으로 기점부터 하차 정류장까지 도착 시각의 시(hour)
+        time_per_station = float(self.arrays['time_per_station'][route])
+        now_times = [now.hour + now.minute / 60 for now in times]
+        start_times = np.array([round(now_time - time_per_station * first_pos, 3) for now_time in now_times])
+
+        return np.trunc(np.concatenate([
+            start_times[:, None] + time_per_station * np.arange(first_pos),
+            np.array(now_times)[:, None] + time_per_station * np.arange(last_pos + 1 - first_pos),
+        ], axis=1)).astype(np.int64)
+
+    def lookup(self, bus_id, first_station_id, last_station_id, now):
+        # get_num_in_bus_at_station_list 와 같은 (인원 수 list, 정보 없는 정류장 수), 없는 노선이면 None
+        grid = self.lookup_grid(bus_id, first_station_id, last_station_id, [now])
+        if grid is None:
+            return None
+
+        load, found, warning_counts = grid
+        return load[0][found[0]].tolist(), int(warning_counts[0])
+
+    def lookup_grid(self, bus_id, first_station_id, last_station_id, times):
+        """
+        여러 승차 시각에 대해 한 번에 계산, 없는 노선이면 None
+        (승차~하차 구간 인원 수, 정보 여부, 정보 없는 정류장 수) 배열, 앞의 둘은 (시각 수, 정류장 수)
+        """
+        route = self.route_index.get(int(bus_id))
+        if route is None:
+            return None
+
+        start, first_pos, last_pos = self._positions(route, first_station_id, last_station_id)
+        hours = self._hours(route, first_pos, last_pos, times)
+        stations = start + np.arange(last_pos + 1)
+        is_weekend = np.array([[0 if now.weekday() < 5 else 1] for now in times])
+
+        in_range = (hours >= 0) & (hours < self.n_hours)
+        hours = np.where(in_range, hours, 0)
+        found = self.arrays['found'][is_weekend, hours, stations] & in_range
+        deltas = np.where(found[..., None], self.arrays['deltas'][is_weekend, hours, stations], 0.0)
+
+        # handler.accumulate_num_in_bus 와 같은 순서로 (승차, -하차) 를 번갈아 누적
+        load = np.cumsum(deltas.reshape(len(times), -1), axis=1)[:, 1::2]
+
+        return load[:, first_pos:], found[:, first_pos:], np.count_nonzero(~found, axis=1)
+
+
+if __name__ == '__main__':
+    # python -m tasks.transportation_path.load_curves build
+    # python -m tasks.transportation_path.load_curves bench
+    import datetime
+    import random
+
+    from . import handler
+    from .lane_store import read_snapshot as read_lane_snapshot
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('command', choices=['build', 'bench'])
+    parser.add_argument('--data_dir', default=handler.DATA_DIR)
+    args = parser.parse_args()
+
+    curves_path = args.data_dir + handler.LOAD_CURVE_FILE
+    lanes = read_lane_snapshot(args.data_dir + handler.LANE_SNAPSHOT_FILE)['lanes']
+
+    handler.init_handler(args.data_dir)
+
+    if args.command == 'build':
+        start = time.perf_counter()
+        count = write_load_curves(curves_path, lanes)
+        print('%d routes -> %s (%.1fs)' % (count, curves_path, time.perf_counter() - start))
+    else:
+        # 임의의 승차/하차 구간을 기존 계산과 곡선 조회로 각각 구해 시간과 결과 차이를 비교
+        curves = BusLoadCurves.from_file(curves_path)
+        handler.bus_load_curves = None  # 기존 계산과 비교하기 위해 handler 에서는 곡선을 쓰지 않음
+        random.seed(0)
+        queries = []
+        for _ in range(1000):
+            bus_id = random.choice([bus_id for bus_id in lanes if int(bus_id) in curves])
+            stations = lanes[bus_id]['result']['station']
+            first, last = sorted(random.sample(range(len(stations)), 2))
+            now = datetime.datetime(2020, 5, random.randint(4, 10), random.randint(5, 23), random.randint(0, 59))
+            queries.append((bus_id, stations[first]['stationID'], stations[last]['stationID'], now))
+
+        start = time.perf_counter()
+        exact = [handler.get_num_in_bus_at_station_list(bus_id, first, last, now, lanes[bus_id])
+                 for bus_id, first, last, now in queries]
+        exact_sec = time.perf_counter() - start
+
+        start = time.perf_counter()
+        looked_up = [curves.lookup(bus_id, first, last, now) for bus_id, first, last, now in queries]
+        lookup_sec = time.perf_counter() - start
+
+        # 정보가 있는 정류장이 달라지면(warning_count 포함) has_congestion 으로 걸러지는 노선이 달라짐
+        compared = [(exact_result, result) for exact_result, result in zip(exact, looked_up) if result is not None]
+        identical = sum(exact_result == result for exact_result, result in compared)
+        changed = sum(len(counts) != len(result[0]) or warning_count != result[1]
+                      for (counts, warning_count), result in compared)
+        diffs = [abs(a - b) for (counts, _), result in compared if len(counts) == len(result[0])
+                 for a, b in zip(counts, result[0])]
+        print('exact %.1fus -> lookup %.1fus per query, abs diff mean %.2f / max %.2f people, '
+              'found stations changed %d/%d, identical %d/%d'
+              % (exact_sec / len(queries) * 1e6, lookup_sec / len(queries) * 1e6,
+                 np.mean(diffs) if diffs else 0.0, max(diffs) if diffs else 0.0,
+                 changed, len(compared), identical, len(compared)))
@@ -0,0 +1,183 @@
+# -*- coding:utf-8 -*-
+import bisect
+import threading
+import time
+
+from contextlib import contextmanager
+
+
+# 프로세스 안에서 단계별 지연 시간/호출 수/캐시 적중을 모아서 Prometheus text 형식으로 내보냄
+# 여러 worker 프로세스로 실행하면 각 프로세스의 값이 따로 보임 (worker 별로 scrape)
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+REGISTRY = []
+
+
+def _format_labels(label_names, label_values, extra=()):
+    pairs = list(zip(label_names, label_values)) + list(extra)
+    if not pairs:
+        return ''
+
+    def escape(value):
+        return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+    return '{%s}' % ','.join('%s="%s"' % (name, escape(value)) for name, value in pairs)
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, help, label_names=()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(label_names)
+        self._values = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels[name] for name in self.label_names)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(tuple(labels[name] for name in self.label_names), 0)
+
+    def collect(self):
+        lines = ['# HELP %s %s' % (self.name, self.help), '# TYPE %s counter' % self.name]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.append('%s%s %s' % (self.name, _format_labels(self.label_names, key), _format_value(value)))
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help, label_names=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        self._values = {}  # labels -> [bucket 별 개수, 합, 개수]
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple(labels[name] for name in self.label_names)
+        idx = bisect.bisect_left(self.buckets, value)
+
+        with self._lock:
+            item = self._values.get(key)
+            if item is None:
+                item = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            item[0][idx] += 1
+            item[1] += value
+            item[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def count(self, **labels):
+        item = self._values.get(tuple(labels[name] for name in self.label_names))
+        return 0 if item is None else item[2]
+
+    def collect(self):
+        lines = ['# HELP %s %s' % (self.name, self.help), '# TYPE %s histogram' % self.name]
+        with self._lock:
+            items = sorted((key, (list(item[0]), item[1], item[2])) for key, item in self._values.items())
+
+        for key, (bucket_counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), bucket_counts):
+                cumulative += bucket_count
+                lines.append('%s_bucket%s %d' % (self.name,
+                                                 _format_labels(self.label_names, key, [('le', _format_value(bound))]),
+                                                 cumulative))
+            labels = _format_labels(self.label_names, key)
+            lines.append('%s_sum%s %s' % (self.name, labels, _format_value(total)))
+            lines.append('%s_count%s %d' % (self.name, labels, count))
+        return lines
+
+
+class Gauge:
+    """scrape 할 때 fn() 을 불러서 값을 읽는 gauge, fn 은 숫자 또는 {label 값: 숫자} 를 반환"""
+
+    def __init__(self, name, help, fn, label_name=None):
+        self.name = name
+        self.help = help
+        self.fn = fn
+        self.label_name = label_name
+        REGISTRY.append(self)
+
+    def collect(self):
+        lines = ['# HELP %s %s' % (self.name, self.help), '# TYPE %s gauge' % self.name]
+        try:
+            values = self.fn()
+        except Exception:
+            return lines
+
+        if self.label_name is None:
+            lines.append('%s %s' % (self.name, _format_value(values)))
+        else:
+            for label, value in sorted(values.items()):
+                lines.append('%s%s %s' % (self.name, _format_labels((self.label_name,), (label,)),
+                                          _format_value(value)))
+        return lines
+
+
+def render():
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.collect())
+    return '\n'.join(lines) + '\n'
+
+
+CHAT_STATE_SECONDS = Histogram('transafer_chat_state_seconds',
+                               '챗봇 대화 상태별 응답 시간', ('state',))
+STAGE_SECONDS = Histogram('transafer_stage_seconds',
+                          '경로 검색/그리기 단계별 시간', ('stage',))
+UPSTREAM_SECONDS = Histogram('transafer_upstream_seconds',
+                             '외부 API 호출 시간', ('api',))
+UPSTREAM_ERRORS = Counter('transafer_upstream_errors_total',
+                          '외부 API 호출 실패 수', ('api',))
+CACHE_REQUESTS = Counter('transafer_cache_requests_total',
+                         '캐시/로컬 저장소 조회 결과 (hit, miss)', ('cache', 'result'))
+
+
+@contextmanager
+def upstream(api):
+    # 외부 API 호출 시간을 기록하고, 예외가 나면 실패 수를 셈 (HTTP 오류 응답은 블록 안에서 raise_for_status 로 예외가 되도록)
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        UPSTREAM_ERRORS.inc(api=api)
+        raise
+    finally:
+        UPSTREAM_SECONDS.observe(time.perf_counter() - started, api=api)
+
+
+def cache_result(cache, hit):
+    CACHE_REQUESTS.inc(cache=cache, result='hit' if hit else 'miss')
+
+
+def cache_hit_ratios():
+    # 캐시별 hit / (hit + miss)
+    totals = {}
+    for (cache, result), value in list(CACHE_REQUESTS._values.items()):
+        hits, total = totals.get(cache, (0, 0))
+        totals[cache] = (hits + (value if result == 'hit' else 0), total + value)
+    return {cache: hits / total for cache, (hits, total) in totals.items() if total}
+
+
+CACHE_HIT_RATIO = Gauge('transafer_cache_hit_ratio', '캐시별 적중률', cache_hit_ratios, 'cache')
@@ -0,0 +1,83 @@
+# -*- coding:utf-8 -*-
+import numpy as np
+
+
+# 10분 연속 혼잡도가 >0.25 면 +0.5, >0.5 면 +1, >0.75 면 +2, >1.0 이면 +3
+CONGESTION_THRESHOLDS = {0.25: 0.5, 0.5: 1, 0.75: 2, 1.0: 3}
+# 10분 연속 감염 위험도가 >0.5 면 +1, >0.75 면 +2, >1.0 이면 +3
+RISK_THRESHOLDS = {0.5: 1, 0.75: 2, 1.0: 3}
+# 15분 연속 타고 있을 때마다 +1
+RIDING_THRESHOLDS = {15 * 60: 1}
+
+CONSECUTIVE_SECONDS = 600
+RIDING_SECONDS = 900
+
+
+def find_consecutives(values, ongoing_times, path_starts, consecutive_seconds, thresholds):
+    """
+    여러 구간을 이어붙인 배열에서 구간별 연속 구간 점수를 한 번에 계산
+    i 번째 정류장부터 consecutive_seconds 를 처음 넘는 정류장까지의 최솟값이
+    threshold 를 넘으면 점수를 더하고, 그 정류장으로 건너뛰어 다시 확인함
+    """
+    values = np.asarray(values, dtype=np.float64)
+    n = len(values)
+    path_starts = np.asarray(path_starts, dtype=np.int64)
+    scores = np.zeros(len(path_starts))
+
+    if n == 0:
+        return scores
+
+    path_ends = np.append(path_starts[1:], n)
+    path_ids = np.repeat(np.arange(len(path_starts)), path_ends - path_starts)
+    path_end = path_ends[path_ids]
+
+    # 구간끼리 섞이지 않도록 구간마다 시간축을 충분히 띄워서 한 번에 정렬 탐색
+    ongoing_times = np.asarray(ongoing_times, dtype=np.float64)
+    gap = ongoing_times.max() - ongoing_times.min() + consecutive_seconds + 1
+    shifted_times = ongoing_times + path_ids * gap
+
+    idx_end = np.searchsorted(shifted_times, shifted_times + consecutive_seconds, side='right')
+    has_end = idx_end < path_end
+
+    # [i, idx_end] 범위의 최솟값
+    starts = np.flatnonzero(has_end)
+    window_min = np.full(n, np.nan)
+    if len(starts):
+        bounds = np.empty(len(starts) * 2, dtype=np.int64)
+        bounds[0::2] = starts
+        bounds[1::2] = idx_end[starts] + 1
+        window_min[starts] = np.minimum.reduceat(np.append(values, 0), bounds)[0::2]
+
+    # 최솟값보다 작은 가장 큰 threshold 의 점수
+    threshold_keys = np.array(sorted(thresholds), dtype=np.float64)
+    threshold_values = np.array([thresholds[key] for key in sorted(thresholds)], dtype=np.float64)
+
+    num_below = np.searchsorted(threshold_keys, np.nan_to_num(window_min, nan=-np.inf), side='left')
+    matched = has_end & (num_below > 0)
+    gains = np.where(matched, threshold_values[np.maximum(num_below - 1, 0)], 0)
+
+    # 다음에 확인할 정류장 (n 이면 해당 구간 종료)
+    next_idx = np.where(matched, idx_end, np.arange(1, n + 1))
+    next_idx = np.where(has_end & (next_idx < path_end), next_idx, n)
+
+    # pointer jumping 으로 구간 시작점에서 따라가는 경로의 점수 합을 구함
+    acc = np.append(gains, 0)
+    ptr = np.append(next_idx, n)
+    while (ptr[path_starts] != n).any():
+        acc = acc + acc[ptr]
+        ptr = ptr[ptr]
+
+    nonempty = path_starts < path_ends
+    scores[nonempty] = acc[path_starts[nonempty]]
+
+    return scores
+
+
+def score_paths(ongoing_times, congestions, risks, path_lengths):
+    """여러 구간(path)의 정류장 정보를 이어붙인 배열을 받아 구간별 위험 점수를 반환"""
+    path_lengths = np.asarray(path_lengths, dtype=np.int64)
+    path_starts = np.concatenate([[0], np.cumsum(path_lengths)[:-1]]).astype(np.int64)
+
+    return (find_consecutives(congestions, ongoing_times, path_starts, CONSECUTIVE_SECONDS, CONGESTION_THRESHOLDS) +
+            find_consecutives(risks, ongoing_times, path_starts, CONSECUTIVE_SECONDS, RISK_THRESHOLDS) +
+            find_consecutives(ongoing_times, ongoing_times, path_starts, RIDING_SECONDS, RIDING_THRESHOLDS))
@@ -0,0 +1,104 @@
+# -*- coding:utf-8 -*-
+import datetime
+
+import numpy as np
+
+
+# 경로의 구간(도보/버스/지하철) 하나를 dict 대신 배열 기반 객체로 표현
+# 정류장 정보(id, 이름, 구간 시작부터 걸린 시간)는 같은 구간의 노선들이 하나의 StationColumns 를 공유하고,
+# 노선마다 달라지는 혼잡도/위험도/인원 수만 노선별 배열로 가짐
+
+WALK = '도보'
+BUS = '버스'
+SUBWAY = '지하철'
+
+MICROSECONDS_PER_HOUR = 3600 * 10**6
+
+
+class StationColumns:
+    __slots__ = ('station_ids', 'station_names', 'offsets')
+
+    def __init__(self, station_ids, station_names, offsets):
+        self.station_ids = station_ids      # int64 배열
+        self.station_names = station_names  # tuple
+        self.offsets = offsets              # 구간 시작부터 걸린 시간 (초, float64 배열)
+
+    def __len__(self):
+        return len(self.station_ids)
+
+    @classmethod
+    def from_pass_stops(cls, stations, section_minutes):
+        # 정류장 사이 시간은 기존처럼 timedelta 로 나눈 값(마이크로초 단위)을 사용
+        time_per_station = datetime.timedelta(minutes=section_minutes) / (len(stations)-1)
+        step = time_per_station // datetime.timedelta(microseconds=1)
+
+        return cls(np.array([station['stationID'] for station in stations], dtype=np.int64),
+                   tuple(station['stationName'] for station in stations),
+                   np.arange(len(stations)) * step / 10**6)
+
+    def ongoing_seconds(self):
+        # timedelta.seconds 와 같이 초 단위 미만은 버림
+        return np.floor(self.offsets)
+
+    def hours(self, start_time):
+        # 정류장별 도착 시각의 시(hour)
+        return self.hours_grid([start_time])[0]
+
+    def hours_grid(self, start_times):
+        # 여러 출발 시각에 대한 정류장별 도착 시각의 시(hour), (출발 시각 수, 정류장 수)
+        starts = np.array([(start_time - start_time.replace(hour=0, minute=0, second=0, microsecond=0))
+                           // datetime.timedelta(microseconds=1) for start_time in start_times], dtype=np.int64)
+        offsets = np.round(self.offsets * 10**6).astype(np.int64)
+
+        return (starts[:, None] + offsets) // MICROSECONDS_PER_HOUR % 24
+
+
+class Segment:
+    __slots__ = ('type', 'start_time', 'distance', 'duration', 'start_name', 'end_name', 'way_code',
+                 'bus_no', 'bus_id', 'bus_type', 'subway_id', 'columns',
+                 'counts', 'congestions', 'risks', 'warning_count')
+
+    def __init__(self, type, start_time, distance, duration, start_name=None, end_name=None,
+                 way_code=None, columns=None):
+        self.type = type
+        self.start_time = start_time
+        self.distance = distance
+        self.duration = duration
+        self.start_name = start_name
+        self.end_name = end_name
+        self.way_code = way_code
+
+        self.bus_no = None
+        self.bus_id = None
+        self.bus_type = None
+        self.subway_id = None
+
+        self.columns = columns
+
+        # 혼잡도 정보가 없는 정류장은 NaN
+        self.counts = None
+        self.congestions = None
+        self.risks = None
+        self.warning_count = 0
+
+    def __repr__(self):
+        return 'Segment(%s, %s, %d stations)' % (self.type, self.bus_no or self.subway_id, self.station_num)
+
+    @property
+    def station_num(self):
+        return 0 if self.columns is None else len(self.columns)
+
+    def lane_copy(self):
+        # 같은 구간의 다른 노선, 정류장 정보는 공유
+        return Segment(self.type, self.start_time, self.distance, self.duration,
+                       self.start_name, self.end_name, self.way_code, self.columns)
+
+    def has_congestion(self):
+        if self.columns is None:
+            return True
+        return self.congestions is not None and not np.isnan(self.congestions).any()
+
+    def risk_sum(self):
+        if self.risks is None:
+            return 0.0
+        return sum(self.risks.tolist())
@@ -0,0 +1,112 @@
+# -*- coding:utf-8 -*-
+import heapq
+import itertools
+
+
+# 경로 하나는 구간(도보/버스/지하철)들의 목록이고, 버스/지하철 구간은 여러 노선 중 하나를 고를 수 있음
+# 구간/노선 별 점수는 한 번만 계산해두고, 경로 점수는 그 합으로 구함
+#   scored_route = {'route': {...}, 'segments': [[candidate, ...], ...]}
+#   candidate = {'path': path, 'risk_score': float, 'risk_sum': float, 'station_num': int}
+# 같은 구간의 노선들은 정류장 수가 같으므로, 경로 안에서는 mean_risk 순서가 risk_sum 순서와 같음
+
+SORT_TYPES = ('fastest', 'safetest', 'riskiest')
+
+
+def _station_num(scored_route):
+    return sum(segment[0]['station_num'] for segment in scored_route['segments'])
+
+
+def _iter_smallest_combinations(segments, sign):
+    # 구간별 후보를 (점수 합, 위험도 합, 원래 노선 순서) 오름차순으로 하나씩 꺼냄
+    # sign 이 -1 이면 점수가 큰 순서
+    sorted_segments = [
+        sorted(((sign * c['risk_score'], sign * c['risk_sum'], lane_idx, c) for lane_idx, c in enumerate(segment)),
+               key=lambda x: x[:3])
+        for segment in segments
+    ]
+
+    def make_entry(positions):
+        picked = [segment[pos] for segment, pos in zip(sorted_segments, positions)]
+        return (sum(p[0] for p in picked), sum(p[1] for p in picked),
+                tuple(p[2] for p in picked), positions, [p[3] for p in picked])
+
+    start = (0,) * len(sorted_segments)
+    heap = [make_entry(start)]
+    seen = {start}
+
+    while heap:
+        score, risk_sum, lanes, positions, candidates = heapq.heappop(heap)
+        yield score, risk_sum, lanes, candidates
+
+        for i, segment in enumerate(sorted_segments):
+            if positions[i] + 1 < len(segment):
+                next_positions = positions[:i] + (positions[i] + 1,) + positions[i + 1:]
+                if next_positions not in seen:
+                    seen.add(next_positions)
+                    heapq.heappush(heap, make_entry(next_positions))
+
+
+def _iter_route_in_order(route_idx, scored_route):
+    for lanes in itertools.product(*[range(len(segment)) for segment in scored_route['segments']]):
+        candidates = [segment[lane] for segment, lane in zip(scored_route['segments'], lanes)]
+        yield (route_idx, lanes), candidates
+
+
+def _iter_route_by_risk(route_idx, scored_route, sign):
+    station_num = _station_num(scored_route)
+
+    for score, risk_sum, lanes, candidates in _iter_smallest_combinations(scored_route['segments'], sign):
+        mean_risk = risk_sum / station_num if station_num else 0.0
+        yield (score, mean_risk, route_idx, lanes), candidates
+
+
+def iter_ranked_routes(scored_routes, sort_type='safetest'):
+    """경로 조합을 전부 만들지 않고 sort_type 순서대로 하나씩 (순서 키, 구간 후보 목록) 을 반환"""
+    scored_routes = [scored_route for scored_route in scored_routes
+                     if all(scored_route['segments'])]
+
+    if sort_type == 'fastest':
+        # 가장 빠른 경로는 ODsay 가 준 순서 그대로
+        return itertools.chain.from_iterable(_iter_route_in_order(route_idx, scored_route)
+                                             for route_idx, scored_route in enumerate(scored_routes))
+
+    if sort_type == 'safetest':
+        sign = 1
+    elif sort_type == 'riskiest':
+        sign = -1
+    else:
+        raise ValueError('Unknown sort_type: %s' % sort_type)
+
+    return heapq.merge(*[_iter_route_by_risk(route_idx, scored_route, sign)
+                         for route_idx, scored_route in enumerate(scored_routes)],
+                       key=lambda x: x[0])
+
+
+def materialize_route(scored_route, candidates):
+    station_num = _station_num(scored_route)
+
+    route = scored_route['route'].copy()
+    route['path_list'] = tuple(candidate['path'] for candidate in candidates)
+    route['risk_score'] = sum(candidate['risk_score'] for candidate in candidates)
+    route['mean_risk'] = sum(candidate['risk_sum'] for candidate in candidates) / station_num if station_num else 0.0
+
+    return route
+
+
+def select_top_routes(scored_routes, top_n=3, sort_types=SORT_TYPES):
+    """각 sort_type 별 상위 top_n 경로를 합쳐서, 원래 조합 순서대로 반환 (top_n 이 None 이면 모든 조합)"""
+    scored_routes = [scored_route for scored_route in scored_routes
+                     if all(scored_route['segments'])]
+
+    if top_n is None:
+        sort_types = ('fastest',)
+
+    selected = {}
+
+    for sort_type in sort_types:
+        for key, candidates in itertools.islice(iter_ranked_routes(scored_routes, sort_type), top_n):
+            route_idx, lanes = key if sort_type == 'fastest' else key[2:]
+            selected[route_idx, lanes] = candidates
+
+    return [materialize_route(scored_routes[route_idx], selected[route_idx, lanes])
+            for route_idx, lanes in sorted(selected)]
@@ -0,0 +1,235 @@
+# -*- coding:utf-8 -*-
+import bisect
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from collections import defaultdict
+
+import pandas as pd
+
+
+# 검색 결과 최대 개수와 n-gram 유사 검색 기준
+MAX_RESULTS = 20
+NGRAM_SIZE = 2
+FUZZY_MIN_SCORE = 0.5
+# 너무 흔한 n-gram (예: '입구') 은 후보를 세는 데 쓰지 않음
+FUZZY_MAX_POSTINGS = 1000
+
+# 원격 API 로 찾은 검색어별 결과는 정류장이 옮겨지거나 이름이 바뀔 수 있으므로 이 기간이 지나면 다시 찾음
+LEARNED_TTL = 7 * 24 * 3600
+
+
+def normalize(name):
+    return ''.join(str(name).split()).lower()
+
+
+def ngrams(text, n=NGRAM_SIZE):
+    if len(text) <= n:
+        return {text}
+    return {text[i:i+n] for i in range(len(text) - n + 1)}
+
+
+class StopQueryStore:
+    """검색어별 getLocationInfo 결과를 여러 프로세스가 함께 쓰는 sqlite 파일에 보관하는 저장소 (검색어당 한 행)"""
+
+    def __init__(self, db_path, ttl=LEARNED_TTL):
+        self.db_path = db_path
+        self.ttl = ttl
+        self._local = threading.local()
+
+        with self._connect() as conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS stop_query ('
+                         'query TEXT PRIMARY KEY, fetched_at REAL, body TEXT)')
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            self._local.conn = conn
+        return conn
+
+    def _is_fresh(self, fetched_at):
+        return self.ttl is None or time.time() - fetched_at < self.ttl
+
+    def get(self, query):
+        # (fetched_at, 정류장 목록), 없거나 만료되었으면 None
+        row = self._connect().execute('SELECT fetched_at, body FROM stop_query WHERE query = ?',
+                                      (query,)).fetchone()
+        if row is None or not self._is_fresh(row[0]):
+            return None
+
+        return row[0], [tuple(stop) for stop in json.loads(row[1])]
+
+    def put(self, query, stops, fetched_at=None):
+        fetched_at = time.time() if fetched_at is None else fetched_at
+
+        with self._connect() as conn:
+            conn.execute('INSERT OR REPLACE INTO stop_query (query, fetched_at, body) VALUES (?, ?, ?)',
+                         (query, fetched_at, json.dumps(stops, ensure_ascii=False)))
+
+        return fetched_at
+
+    def items(self):
+        # 만료되지 않은 (검색어, fetched_at, 정류장 목록)
+        for query, fetched_at, body in self._connect().execute('SELECT query, fetched_at, body FROM stop_query'):
+            if self._is_fresh(fetched_at):
+                yield query, fetched_at, [tuple(stop) for stop in json.loads(body)]
+
+
+def unique_stops(stops):
+    # 순서를 유지하면서 같은 정류장은 한 번만
+    return list(dict.fromkeys((str(poi_name), str(gps_x), str(gps_y)) for poi_name, gps_x, gps_y in stops))
+
+
+class StopSearchIndex:
+    """
+    정류장 이름 -> (poiNm, gpsX, gpsY) 로컬 검색 인덱스
+    완전 일치 > 앞부분 일치 > 한글 n-gram 유사 검색 순서로 결과를 반환
+    좌표가 있는 전체 정류장 목록으로 만든 경우(complete)에만 검색 결과를 그대로 쓰고,
+    그렇지 않으면 원격 API 로 찾았던 검색어의 결과(query_store, LEARNED_TTL 동안)만 그대로 돌려줌
+    """
+
+    def __init__(self, query_store=None):
+        self.stops = []              # (poiNm, gpsX, gpsY)
+        self._keys = set()
+        self._exact = defaultdict(list)
+        self._prefix = []            # (정규화된 이름, stop id) 정렬된 목록
+        self._ngrams = defaultdict(set)
+        self._ngram_counts = []
+        self._queries = {}           # 검색어 -> (fetched_at, 원격 API 결과)
+        self._lock = threading.Lock()
+        self.query_store = query_store
+        self.complete = False
+
+    def __len__(self):
+        return len(self.stops)
+
+    def add(self, poi_name, gps_x, gps_y):
+        stop = (str(poi_name), str(gps_x), str(gps_y))
+
+        with self._lock:
+            if stop in self._keys:
+                return False
+
+            stop_id = len(self.stops)
+            self.stops.append(stop)
+            self._keys.add(stop)
+
+            name = normalize(poi_name)
+            self._exact[name].append(stop_id)
+            bisect.insort(self._prefix, (name, stop_id))
+            grams = ngrams(name)
+            self._ngram_counts.append(len(grams))
+            for gram in grams:
+                self._ngrams[gram].add(stop_id)
+
+        return True
+
+    def remember(self, query, stops, fetched_at):
+        # 검색어별 원격 API 결과를 기억 (같은 검색어는 만료 전까지 다시 API 콜하지 않음)
+        stops = unique_stops(stops)
+
+        for stop in stops:
+            self.add(*stop)
+
+        with self._lock:
+            self._queries[query] = (fetched_at, stops)
+
+        return stops
+
+    def learn(self, query, stops):
+        # 원격 API 응답으로 받은 검색어별 정류장 좌표를 인덱스와 저장소에 추가 (같은 검색어는 덮어씀)
+        query = str(query).strip()
+        if not query or not stops:
+            return 0
+
+        stops = unique_stops(stops)
+        fetched_at = self.query_store.put(query, stops) if self.query_store is not None else time.time()
+        self.remember(query, stops, fetched_at)
+
+        return len(stops)
+
+    def lookup(self, query):
+        # 원격 API 대신 쓸 수 있는 결과, 없거나 만료되었으면 None
+        if self.complete:
+            return self.search(query) or None
+
+        query = str(query).strip()
+        item = self._queries.get(query)
+        ttl = LEARNED_TTL if self.query_store is None else self.query_store.ttl
+
+        if item is None or (ttl is not None and time.time() - item[0] >= ttl):
+            # 다른 프로세스가 저장했을 수 있으므로 저장소에서 다시 찾음
+            item = self.query_store.get(query) if self.query_store is not None else None
+            if item is None:
+                return None
+            self.remember(query, item[1], item[0])
+
+        return self._queries[query][1]
+
+    def search(self, query, limit=MAX_RESULTS):
+        name = normalize(query)
+        if not name:
+            return []
+
+        found = list(self._exact.get(name, []))
+
+        # 앞부분 일치는 짧은 이름 먼저
+        start = bisect.bisect_left(self._prefix, (name, -1))
+        prefix_ids = []
+        for i in range(start, len(self._prefix)):
+            prefix_name, stop_id = self._prefix[i]
+            if not prefix_name.startswith(name):
+                break
+            if prefix_name != name:
+                prefix_ids.append((len(prefix_name), stop_id))
+        found.extend(stop_id for _, stop_id in sorted(prefix_ids))
+
+        # 완전/앞부분 일치가 없을 때만 유사 검색
+        if not found:
+            found = self._fuzzy_search(name)
+
+        return [self.stops[stop_id] for stop_id in found[:limit]]
+
+    def _fuzzy_search(self, name):
+        query_grams = ngrams(name)
+        counts = defaultdict(int)
+
+        for gram in query_grams:
+            postings = self._ngrams.get(gram, ())
+            if len(postings) > FUZZY_MAX_POSTINGS:
+                continue
+            for stop_id in postings:
+                counts[stop_id] += 1
+
+        scored = []
+        for stop_id, count in counts.items():
+            # 검색어의 n-gram 이 얼마나 포함되어 있는지 (Dice 계수)
+            score = 2 * count / (len(query_grams) + self._ngram_counts[stop_id])
+            if score >= FUZZY_MIN_SCORE:
+                scored.append((-score, stop_id))
+
+        return [stop_id for _, stop_id in sorted(scored)]
+
+
+def load_stop_search_index(stop_list_path, learned_path=None):
+    index = StopSearchIndex(StopQueryStore(learned_path) if learned_path else None)
+
+    # 좌표(gpsX, gpsY)가 있는 정류장 목록만 인덱스에 넣을 수 있음
+    if stop_list_path and os.path.exists(stop_list_path):
+        stop_df = pd.read_csv(stop_list_path, dtype=str)
+        if {'gpsX', 'gpsY'} <= set(stop_df.columns):
+            stop_df = stop_df.dropna(subset=['stop_name', 'gpsX', 'gpsY'])
+            for poi_name, gps_x, gps_y in zip(stop_df['stop_name'], stop_df['gpsX'], stop_df['gpsY']):
+                index.add(poi_name, gps_x, gps_y)
+            index.complete = len(index) > 0
+
+    if index.query_store is not None:
+        for query, fetched_at, stops in index.query_store.items():
+            index.remember(query, stops, fetched_at)
+
+    return index
@@ -1,27 +1,67 @@
 # -*- coding:utf-8 -*-
 
-import logging
+import asyncio
+import atexit
 import json
+import logging
 import os
-import requests
+import queue
+import secrets
+import threading
 
-from flask import Flask, session, render_template, request
-from tasks.transportation_path import handler
+from flask import Flask, Response, session, render_template, request
+from tasks.transportation_path import handler, metrics
 # from entity.entity import get_entity
 
 from config import secret_key, logger_url
+import chat_flow
+from log_shipper import LogShipper
+from state_store import create_state_store
 
 app = Flask(__name__)
 app.secret_key = secret_key
 
-# 로그 환경 초기화 daily rolling log
-if not os.path.exists("logs"):
-    os.makedirs("logs")
-
 # 로그 / 파일로 로그를 남기기 위해서는 추가 작업 필요
 logger = logging.getLogger("chatbot")
 logger.setLevel(logging.DEBUG)
 
+# init_services 에서 만듦
+log_shipper = None
+state_store = None
+services_lock = threading.Lock()
+
+
+def init_services():
+    # 로그 전송 스레드, 대화 상태 저장소, 지표 등록은 import 할 때가 아니라 서버가 요청을 받기 전에 한 번만 함
+    # (그래프 worker 프로세스가 이 파일을 __mp_main__ 으로 다시 import 해도 아무것도 띄우지 않도록)
+    global log_shipper, state_store
+
+    with services_lock:
+        if log_shipper is not None:
+            return
+
+        # 로그 환경 초기화 daily rolling log
+        if not os.path.exists("logs"):
+            os.makedirs("logs")
+
+        # 대화 상태는 서버에 보관하고, 쿠키에는 임의로 만든 id 만 담음
+        state_store = create_state_store()
+
+        # 응답 로그는 백그라운드에서 모아서 전송
+        shipper = LogShipper(logger_url).start()
+        atexit.register(shipper.close)
+
+        metrics.Gauge('transafer_log_shipper_messages', '로그 전송 결과별 메시지 수',
+                      lambda: {'sent': shipper.sent, 'failed': shipper.failed, 'dropped': shipper.dropped},
+                      'result')
+
+        log_shipper = shipper
+
+
+@app.before_request
+def ensure_services():
+    init_services()
+
 
 # 챗봇 화면 출력
 @app.route("/", methods=["GET"])
@@ -31,103 +71,120 @@ def chat_client():
     return render_template("chat_client.html")
 
 
+# 출발지/목적지 후보 정류장 (static/stop_picker.html 에서 사용)
+@app.route("/stops/<key>", methods=["GET"])
+def stop_candidates(key):
+    body = handler.load_stop_candidates(key)
+    if body is None:
+        return {"stops": []}, 404
+
+    return Response(body, mimetype="application/json", headers={"Cache-Control": "public, max-age=86400"})
+
+
+# 경로별 혼잡도 그래프 데이터 (templates/chat_client.html 에서 막대 그래프로 그림)
+@app.route("/routes/<key>", methods=["GET"])
+def route_congestion(key):
+    body = handler.load_route_congestion(key)
+    if body is None:
+        return {"routes": []}, 404
+
+    return Response(body, mimetype="application/json", headers={"Cache-Control": "public, max-age=86400"})
+
+
+# Prometheus 수집용 지표
+@app.route("/metrics", methods=["GET"])
+def metrics_endpoint():
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4; charset=utf-8")
+
+
 # 챗봇 메시지 처리
+# stream=1 이면 text/event-stream 으로 응답 메시지를 나오는 대로 하나씩 보냄 (마지막은 event: done)
 @app.route("/chat_message", methods=["POST"])
 def chat_message():
     # 수신 데이터
     recv_value = request.form.to_dict(flat=True)
     logger.warning(f"recv: {recv_value}")
 
+    if recv_value.get('stream') == '1':
+        return Response(stream_chat_message(recv_value, state_key(recv_value['client_id'])),
+                        mimetype="text/event-stream",
+                        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
     output = run(recv_value['input'], recv_value['client_id'])
 
     # 발신 데이터
     send_value = {"client_id": recv_value["client_id"], "message_id": recv_value["message_id"], "output": output}
     logger.warning(f"send: {send_value}")
-    requests.put(logger_url, data=json.dumps({'username': 'TranSafer Log', 'text': output}))
+    log_shipper.ship(output)
 
     return send_value
 
 
+def stream_chat_message(recv_value, key):
+    outputs = []
+
+    for output in run_stream(recv_value['input'], key):
+        outputs.append(output)
+        send_value = {"client_id": recv_value["client_id"], "message_id": recv_value["message_id"], "output": output}
+        logger.warning(f"send: {send_value}")
+        yield 'data: %s\n\n' % json.dumps(send_value, ensure_ascii=False)
+
+    yield 'event: done\ndata: {}\n\n'
+    log_shipper.ship('</br>'.join(outputs))
+
+
+def state_key(client_id):
+    if 'sid' not in session:
+        session['sid'] = secrets.token_hex(16)
+
+    return '%s:%s' % (session['sid'], client_id)
+
+
 def run(message, client_id):
-    if 'state' not in session:
-        session['state'] = 'waiting'
-
-    state = session['state']
-
-    if message == "/start":
-        output = "가장 안전한 길을 알려드리는 TranSafer 입니다. :)<br/>먼저, 출발지를 알려주세요!"
-        session['state'] = 'ask_origin'
-
-    elif state == 'ask_origin':
-        html_path, item_list = handler.ask_origin(message)
-
-        if html_path is None:
-            output = '검색 결과가 없습니다! 이름을 확인해주세요.</br>출발지는 정류장 이름으로 검색됩니다!'
-        else:
-            output = '원하시는 출발지에 가장 가까운 정류장을 숫자로 말씀해주세요!<br/><iframe src="%s" width="300" height="300"></iframe>' % html_path
-            session['state'] = 'ask_detail_origin'
-            session['start_locs'] = item_list
-
-    elif state == 'ask_detail_origin':
-        item_list = session['start_locs']
-        max_station = len(item_list)
-
-        if not message.isnumeric():
-            output = '숫자만 입력해주세요!'
-        elif int(message) < 1 or max_station < int(message):
-            output = '1 ~ %d 사이의 숫자를 입력해주세요!' % max_station
-        else:
-            output = '이제 목적지를 알려주세요!'
-            session['start_loc'] = item_list[int(message)-1]
-            session['start_locs'] = None
-            session['state'] = 'ask_destination'
-
-    elif state == 'ask_destination':
-        html_path, item_list = handler.ask_destination(message)
-
-        if html_path is None:
-            output = '검색 결과가 없습니다! 이름을 확인해주세요.</br>목적지는 정류장 이름으로 검색됩니다.</br>서울시 이외의 정류장은 검색되지 않습니다.'
-        else:
-            output = '원하시는 목적지에 가장 가까운 정류장을 숫자로 말씀해주세요!<br/><iframe src="%s" width="300" height="300"></iframe>' % html_path
-            session['state'] = 'ask_detail_destination'
-            session['end_locs'] = item_list
-
-    elif state == 'ask_detail_destination':
-        item_list = session['end_locs']
-        max_station = len(item_list)
-
-        if not message.isnumeric():
-            output = '숫자만 입력해주세요!'
-        elif int(message) < 1 or max_station < int(message):
-            output = '1 ~ %d 사이의 숫자를 입력해주세요!' % max_station
-        else:
-            session['end_loc'] = item_list[int(message)-1]
-            session['end_locs'] = None
-            session['state'] = 'print_routes'
-
-            start_loc = session['start_loc']
-            end_loc = session['end_loc']
-
-            route_list = handler.search_routes(start_loc, end_loc)
-            #session['routes'] = route_list
-            #route_list = session['routes']
-
-            if not route_list:
-                output = '아쉽지만 혼잡도 정보가 존재하는 환승경로를 찾지 못했어요... </br>다른 경로를 시도해보고 싶으시다면, /start 를 적어주세요!'
-            else:
-                safest_route_img = handler.visualization_routes(route_list, sort_type='safetest')
-                fastest_route_img = handler.visualization_routes(route_list, sort_type='fastest')
-                riskiest_route_img = handler.visualization_routes(route_list, sort_type='riskiest')
-
-                output = ('<%s> 부터 <%s> 까지 가는 여러 경로들 중에서, 가장 빠른 환승 경로는 다음과 같아요!</br><img src="%s" width="300" height="345"></br>이 경로들은 상대적으로 이용 시민들이 적어 안전한 경로예요!</br><img src="%s" width="300" height="345"></br>한편, 아래 경로들은 이용 시민들이 많으니 가능하면 피하는 게 좋을 것 같아요!<img src="%s" width="300" height="345">' % (start_loc[0], end_loc[0], fastest_route_img, safest_route_img, riskiest_route_img))
-
-            state = 'waiting'
-    else:
-        output = '다시 시작하고 싶으시면 /start 를 입력해주세요!'
+    key = state_key(client_id)
+    context = state_store.get(key)
+
+    output = asyncio.run(chat_flow.run(message, context, chat_flow.SyncServices))
+
+    state_store.put(key, context)
 
     return output
 
 
+def run_stream(message, key):
+    # 대화 흐름은 별도 스레드에서 실행하고, 중간 출력은 queue 로 받아서 나오는 대로 내보냄
+    outputs = queue.Queue()
+
+    async def emit(output):
+        outputs.put(output)
+
+    def worker():
+        context = None
+        try:
+            context = state_store.get(key)
+            output = asyncio.run(chat_flow.run(message, context, chat_flow.SyncServices, emit))
+            state_store.put(key, context)
+
+            if output is not None:
+                outputs.put(output)
+        except Exception:
+            # 응답은 이미 200 으로 시작했으므로 오류도 메시지로 보냄
+            logger.exception("chat_flow failed: %s", key)
+            if context is not None:
+                state_store.put(key, context)
+            outputs.put(chat_flow.ERROR_MESSAGE)
+        finally:
+            outputs.put(None)
+
+    threading.Thread(target=worker, daemon=True).start()
+
+    while True:
+        output = outputs.get()
+        if output is None:
+            return
+        yield output
+
+
 def print_routes(route_list):
     traffic_type = ['지하철', '버스', '도보']
     lines = []
@@ -175,6 +232,7 @@ if __name__ == "__main__":
     app.config["TEMPLATES_AUTO_RELOAD"] = True
 
     handler.init_handler()
+    init_services()
 
     app.run(host='0.0.0.0', debug=True, port=5555)
     # app.run(port=5555)